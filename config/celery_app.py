@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from celery.signals import celeryd_init
 from celery.signals import setup_logging
 
 # set the default Django settings module for the 'celery' program.
@@ -24,5 +25,13 @@ def config_loggers(*args, **kwargs):
     dictConfig(settings.LOGGING)
 
 
+@celeryd_init.connect
+def configure_queue_worker(conf=None, options=None, **kwargs):
+    """Give a worker started for one wallet queue that queue's concurrency and time limits."""
+    from wallet.queues import configure_worker
+
+    configure_worker(conf, (options or {}).get("queues"))
+
+
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
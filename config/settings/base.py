@@ -5,6 +5,7 @@ import ssl
 from pathlib import Path
 
 import environ
+from kombu import Queue
 
 BASE_DIR = Path(__file__).resolve(strict=True).parent.parent.parent
 # bitcoin_wallet_tracker/
@@ -54,6 +55,16 @@ DATABASES = {
     ),
 }
 DATABASES["default"]["ATOMIC_REQUESTS"] = True
+# Optional read replica; page views read from it while sync writes stay on the primary.
+# Locally this can be a second SQLite file or Postgres database.
+WALLET_REPLICA_ALIAS = "replica"
+if env("DATABASE_REPLICA_URL", default=""):
+    DATABASES[WALLET_REPLICA_ALIAS] = env.db("DATABASE_REPLICA_URL")
+    # Tests treat the replica as the primary so fixtures are visible through it
+    DATABASES[WALLET_REPLICA_ALIAS]["TEST"] = {"MIRROR": "default"}
+DATABASE_ROUTERS = ["wallet.db_router.ReplicaRouter"]
+# Seconds a user keeps reading from the primary after a write, to see their own changes
+WALLET_REPLICA_STICKY_SECONDS = env.int("WALLET_REPLICA_STICKY_SECONDS", default=10)
 # https://docs.djangoproject.com/en/stable/ref/settings/#std:setting-DEFAULT_AUTO_FIELD
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -142,6 +153,7 @@ AUTH_PASSWORD_VALIDATORS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "wallet.db_router.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -302,8 +314,57 @@ CELERY_TASK_TIME_LIMIT = 5 * 60
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#task-soft-time-limit
 # TODO: set to whatever value is adequate in your circumstances
 CELERY_TASK_SOFT_TIME_LIMIT = 60
+# Wallet tasks run on separate queues so interactive balance syncs never wait
+# behind history backfills. A worker started for a single queue with -Q takes its
+# concurrency and time limits from here; "priority" orders messages within a
+# queue, lower first, as the Redis transport does.
+WALLET_TASK_QUEUES = {
+    "interactive": {
+        "priority": 0,
+        "concurrency": env.int("WALLET_INTERACTIVE_CONCURRENCY", default=4),
+        "time_limit": 60,
+        "soft_time_limit": 30,
+    },
+    "incremental": {
+        "priority": 3,
+        "concurrency": env.int("WALLET_INCREMENTAL_CONCURRENCY", default=2),
+        "time_limit": 3 * 60,
+        "soft_time_limit": 2 * 60,
+    },
+    "backfill": {
+        "priority": 6,
+        "concurrency": env.int("WALLET_BACKFILL_CONCURRENCY", default=1),
+        "time_limit": 15 * 60,
+        "soft_time_limit": 10 * 60,
+    },
+}
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#task-queues
+# Workers started without -Q consume every queue, interactive first
+CELERY_TASK_QUEUES = [Queue(name) for name in (*WALLET_TASK_QUEUES, "celery")]
+# https://docs.celeryq.dev/en/stable/userguide/routing.html#routers
+CELERY_TASK_ROUTES = ("wallet.queues.route_task",)
+# https://docs.celeryq.dev/en/stable/userguide/routing.html#redis-message-priorities
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
+}
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#beat-scheduler
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+# Seconds between adaptive sync scheduler runs, which is also the window its
+# request budget is spread over
+WALLET_SYNC_SCHEDULE_SECONDS = env.int("WALLET_SYNC_SCHEDULE_SECONDS", default=300)
+# Periodic tasks installed into the database scheduler on startup
+CELERY_BEAT_SCHEDULE = {
+    "refresh-chain-tip": {
+        "task": "wallet.tasks.refresh_chain_tip",
+        "schedule": env.int("WALLET_CHAIN_TIP_REFRESH_SECONDS", default=60),
+    },
+    "schedule-syncs": {
+        "task": "wallet.tasks.schedule_syncs",
+        "schedule": WALLET_SYNC_SCHEDULE_SECONDS,
+    },
+}
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#worker-send-task-events
 CELERY_WORKER_SEND_TASK_EVENTS = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#std-setting-task_send_sent_event
@@ -331,5 +392,96 @@ SOCIALACCOUNT_FORMS = {"signup": "bitcoin_wallet_tracker.users.forms.UserSocialS
 # Blockchair API
 BLOCKCHAIR_API_KEY = env("BLOCKCHAIR_API_KEY", default="")
 
+# Provider HTTP sessions
+# ------------------------------------------------------------------------------
+# Each worker process keeps one pooled keep-alive session per provider.
+# https://requests.readthedocs.io/en/latest/user/advanced/#transport-adapters
+WALLET_HTTP_POOL_CONNECTIONS = env.int("WALLET_HTTP_POOL_CONNECTIONS", default=4)
+WALLET_HTTP_POOL_MAXSIZE = env.int("WALLET_HTTP_POOL_MAXSIZE", default=10)
+# https://requests.readthedocs.io/en/latest/user/advanced/#timeouts
+WALLET_HTTP_CONNECT_TIMEOUT = env.float("WALLET_HTTP_CONNECT_TIMEOUT", default=5.0)
+WALLET_HTTP_READ_TIMEOUT = env.float("WALLET_HTTP_READ_TIMEOUT", default=20.0)
+# Transport-level retries for connection errors and 5xx responses
+# https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html#urllib3.util.Retry
+WALLET_HTTP_MAX_RETRIES = env.int("WALLET_HTTP_MAX_RETRIES", default=3)
+WALLET_HTTP_BACKOFF_FACTOR = env.float("WALLET_HTTP_BACKOFF_FACTOR", default=0.5)
+
+# Provider rate limits
+# ------------------------------------------------------------------------------
+# Token buckets shared by every worker through REDIS_URL, keyed by provider and
+# API key. "rate" is in tokens per second, "capacity" is the allowed burst.
+WALLET_RATE_LIMITS = {
+    # 1440 requests per day on the free tier (1 per minute on average)
+    "blockchair": {"rate": env.float("BLOCKCHAIR_RATE_LIMIT", default=1 / 60), "capacity": 1},
+    "blockchain_info": {"rate": env.float("BLOCKCHAIN_INFO_RATE_LIMIT", default=1 / 10), "capacity": 5},
+}
+# Maximum in-flight requests per provider for the asyncio fetch engine
+WALLET_ASYNC_CONCURRENCY = {
+    "blockchair": env.int("BLOCKCHAIR_ASYNC_CONCURRENCY", default=2),
+    "blockchain_info": env.int("BLOCKCHAIN_INFO_ASYNC_CONCURRENCY", default=4),
+}
+
+# Provider failover
+# ------------------------------------------------------------------------------
+# Backends in order of preference; the router fails over between them.
+WALLET_PROVIDERS = env.list("WALLET_PROVIDERS", default=["blockchain_info", "blockchair"])
+# Send a hedged request to the next provider when the primary is slower than this
+# latency percentile (0 disables hedging)
+WALLET_HEDGE_PERCENTILE = env.float("WALLET_HEDGE_PERCENTILE", default=0)
+WALLET_HEDGE_MIN_SAMPLES = env.int("WALLET_HEDGE_MIN_SAMPLES", default=20)
+# Tokens the secondary's rate-limit bucket must hold for a hedge to be sent; raise
+# it to keep a reserve for regular requests on providers with larger buckets
+WALLET_HEDGE_MIN_TOKENS = env.float("WALLET_HEDGE_MIN_TOKENS", default=1)
+
 # Your stuff...
 # ------------------------------------------------------------------------------
+
+# Portfolio rollups
+# ------------------------------------------------------------------------------
+# Seconds a cached per-user portfolio summary is served before it is recomputed;
+# syncs invalidate it sooner by bumping the user's version key.
+WALLET_PORTFOLIO_CACHE_TIMEOUT = env.int("WALLET_PORTFOLIO_CACHE_TIMEOUT", default=300)
+
+# Chain tip
+# ------------------------------------------------------------------------------
+# Seconds the cached chain tip height stays usable if refreshes stop arriving
+WALLET_CHAIN_TIP_CACHE_TIMEOUT = env.int("WALLET_CHAIN_TIP_CACHE_TIMEOUT", default=60 * 60)
+
+# Scheduled syncs
+# ------------------------------------------------------------------------------
+# Each address is synced every sync_interval seconds. The interval resets to the
+# minimum when a sync finds new activity and grows by the backoff factor, up to
+# the maximum, each time it finds none.
+WALLET_SYNC_INTERVAL_MIN = env.int("WALLET_SYNC_INTERVAL_MIN", default=5 * 60)
+WALLET_SYNC_INTERVAL_MAX = env.int("WALLET_SYNC_INTERVAL_MAX", default=24 * 60 * 60)
+WALLET_SYNC_BACKOFF = env.float("WALLET_SYNC_BACKOFF", default=2.0)
+# Days of stored transactions counted as an address's recent activity
+WALLET_SYNC_ACTIVITY_DAYS = env.int("WALLET_SYNC_ACTIVITY_DAYS", default=7)
+# Share of the provider's rate limit the scheduler may spend, leaving the rest
+# for syncs users trigger themselves
+WALLET_SYNC_BUDGET_SHARE = env.float("WALLET_SYNC_BUDGET_SHARE", default=0.5)
+# Seconds an address's single-flight sync lock survives without progress, so a
+# crashed worker cannot block syncs of that address for longer
+WALLET_SYNC_LOCK_TIMEOUT = env.int("WALLET_SYNC_LOCK_TIMEOUT", default=10 * 60)
+
+# Parallel backfills
+# ------------------------------------------------------------------------------
+# A full backfill splits an address's history into ranges of this many
+# transactions, fetched concurrently by the backfill workers.
+WALLET_BACKFILL_RANGE_SIZE = env.int("WALLET_BACKFILL_RANGE_SIZE", default=5000)
+# Transactions per provider request (blockchain.info allows at most 50)
+WALLET_BACKFILL_PAGE_SIZE = env.int("WALLET_BACKFILL_PAGE_SIZE", default=50)
+# Transactions each range reads past its end, to catch ones shifted to higher
+# offsets by new activity while the backfill runs
+WALLET_BACKFILL_OVERLAP = env.int("WALLET_BACKFILL_OVERLAP", default=50)
+
+# Live sync progress
+# ------------------------------------------------------------------------------
+# Seconds a sync's published progress is kept after its last update, so the
+# detail page can still show how the last sync ended
+WALLET_PROGRESS_TTL = env.int("WALLET_PROGRESS_TTL", default=60 * 60)
+# Longest a sync status request waits for a change before answering 304. Each
+# waiting request holds one of gunicorn's sync workers, so keep this to a few seconds.
+WALLET_PROGRESS_LONG_POLL_SECONDS = env.float("WALLET_PROGRESS_LONG_POLL_SECONDS", default=2)
+# Seconds between the Redis reads of a waiting sync status request
+WALLET_PROGRESS_POLL_INTERVAL = env.float("WALLET_PROGRESS_POLL_INTERVAL", default=0.5)
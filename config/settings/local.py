@@ -2,6 +2,7 @@
 from .base import *  # noqa: F403
 from .base import INSTALLED_APPS
 from .base import MIDDLEWARE
+from .base import WALLET_REPLICA_ALIAS
 from .base import env
 
 # GENERAL
@@ -80,3 +81,7 @@ DATABASES = {
         "NAME": BASE_DIR / "db.sqlite3",
     }
 }
+# Point DATABASE_REPLICA_URL at a second SQLite file (or the same one) to exercise the
+# replica router locally
+if env("DATABASE_REPLICA_URL", default=""):
+    DATABASES[WALLET_REPLICA_ALIAS] = env.db("DATABASE_REPLICA_URL")
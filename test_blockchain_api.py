@@ -8,6 +8,7 @@ import time
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.local')
 django.setup()
 
+from wallet.models import sats_to_btc
 from wallet.services import BlockchainInfoAPI
 
 
@@ -17,7 +18,7 @@ def test_get_address_info(address):
     info = BlockchainInfoAPI.get_address_info(address)
     if info:
         print(f"Success! Address info retrieved:")
-        print(f"Balance: {info['balance']} BTC")
+        print(f"Balance: {sats_to_btc(info['balance_sats'])} BTC")
         print(f"Transaction count: {info['tx_count']}")
         return True
     else:
@@ -33,7 +34,7 @@ def test_get_transactions(address, limit=2):  # Reduced limit to 2
         for i, tx in enumerate(transactions, 1):
             print(f"\nTransaction {i}:")
             print(f"Hash: {tx['hash']}")
-            print(f"Amount: {tx['amount']} BTC")
+            print(f"Amount: {sats_to_btc(tx['amount_sats'])} BTC")
             print(f"Timestamp: {tx['timestamp']}")
             print(f"Is sending: {tx['is_sending']}")
         return True
@@ -8,6 +8,9 @@ import time
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.local')
 django.setup()
 
+from django.conf import settings
+from wallet.models import sats_to_btc
+from wallet.ratelimit import RateLimitExceeded
 from wallet.services import BlockchairAPI
 
 def test_get_address_info(address):
@@ -18,7 +21,7 @@ def test_get_address_info(address):
     info = BlockchairAPI.get_address_info(address)
     if info:
         print(f"Success! Address info retrieved:")
-        print(f"Balance: {info['balance']} BTC")
+        print(f"Balance: {sats_to_btc(info['balance_sats'])} BTC")
         print(f"Transaction count: {info['tx_count']}")
         return True
     else:
@@ -36,7 +39,7 @@ def test_get_transactions(address):
         for i, tx in enumerate(transactions[:3], 1):  # Show first 3 transactions
             print(f"\nTransaction {i}:")
             print(f"Hash: {tx['hash']}")
-            print(f"Amount: {tx['amount']} BTC")
+            print(f"Amount: {sats_to_btc(tx['amount_sats'])} BTC")
             print(f"Timestamp: {tx['timestamp']}")
             print(f"Is sending: {tx['is_sending']}")
         
@@ -56,13 +59,19 @@ if __name__ == "__main__":
         test_address = sys.argv[1]
     
     print(f"Testing BlockchairAPI with address: {test_address}")
-    print(f"Rate limit delay: {BlockchairAPI.RATE_LIMIT_DELAY} seconds")
+    print(f"Rate limit: {settings.WALLET_RATE_LIMITS['blockchair']}")
     
     # Test get_address_info
     info_success = test_get_address_info(test_address)
     
-    # Test get_transactions
-    tx_success = test_get_transactions(test_address)
+    # Test get_transactions, waiting for the shared rate limiter if needed
+    while True:
+        try:
+            tx_success = test_get_transactions(test_address)
+            break
+        except RateLimitExceeded as e:
+            print(f"Rate limited, waiting {e.retry_after:.2f} seconds")
+            time.sleep(e.retry_after)
     
     # Summary
     print("\n=== Test Summary ===")
@@ -0,0 +1,343 @@
+import asyncio
+import contextlib
+import math
+import httpx
+import ijson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from .checkpoints import CursorScan, advance_history_cursor, resume_offset
+from .ingest import INGEST_BATCH_SIZE, advance_high_water_mark, ingest_stream_batch, new_stream_summary
+from .models import BitcoinAddress
+from .portfolio import invalidate_portfolios
+from .progress import record_error, record_page, start_progress
+from .ratelimit import RateLimitExceeded, TokenBucket
+from .scheduler import reschedule
+from .services import BlockchairAPI, BlockchainInfoAPI, ProviderStreamError, retry_after
+from .sync_lock import ACQUIRED, request_sync, touch_sync
+
+
+class AsyncFetchEngine:
+    """
+    Async HTTP client shared by every provider request of one sync run.
+
+    A semaphore per provider bounds how many of its requests are in flight, and each
+    request still takes a token from the shared rate limiter. A request finding the
+    bucket empty raises RateLimitExceeded instead of waiting for the refill, so the run
+    never holds its worker while waiting and the caller reschedules the rest.
+    """
+
+    def __init__(self, transport=None):
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.WALLET_HTTP_READ_TIMEOUT, connect=settings.WALLET_HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=settings.WALLET_HTTP_POOL_MAXSIZE),
+            transport=transport or httpx.AsyncHTTPTransport(retries=settings.WALLET_HTTP_MAX_RETRIES),
+        )
+        self.semaphores = {
+            provider: asyncio.Semaphore(limit) for provider, limit in settings.WALLET_ASYNC_CONCURRENCY.items()
+        }
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+
+    async def _acquire(self, provider, api_key):
+        wait = await asyncio.to_thread(TokenBucket(provider, api_key).acquire)
+        if wait > 0:
+            raise RateLimitExceeded(provider, wait)
+
+    async def get(self, provider, api_key, url, params=None):
+        async with self.semaphores[provider]:
+            await self._acquire(provider, api_key)
+            return await self.client.get(url, params=params)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, provider, api_key, url, params=None):
+        """Like get(), but the body is read as it arrives; the request's slot is held until it is"""
+        async with self.semaphores[provider]:
+            await self._acquire(provider, api_key)
+            async with self.client.stream('GET', url, params=params) as response:
+                yield response
+
+
+class _AsyncBody:
+    """File-like view of a streamed httpx response, for ijson's async parser"""
+
+    def __init__(self, response):
+        self.chunks = response.aiter_bytes()
+
+    async def read(self, size=-1):
+        if size == 0:
+            # ijson probes with read(0) to tell bytes from text
+            return b''
+        # An empty read means end of body to ijson, so skip empty chunks
+        async for chunk in self.chunks:
+            if chunk:
+                return chunk
+        return b''
+
+
+def _normalize(provider, normalize, tx, address):
+    # Like JsonItemStream, an item the parser does not expect fails the provider's stream
+    try:
+        return normalize(tx, address)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ProviderStreamError(provider, f"unexpected item: {e!r}") from e
+
+
+class AsyncBlockchainInfoAPI:
+    """Async counterpart of BlockchainInfoAPI, sharing its response parsing"""
+    PROVIDER = BlockchainInfoAPI.PROVIDER
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    async def _get(self, url, params=None):
+        return await self.engine.get(BlockchainInfoAPI.PROVIDER, BlockchainInfoAPI.API_KEY, url, params)
+
+    async def get_balances(self, addresses):
+        try:
+            response = await self._get(f"{BlockchainInfoAPI.BASE_URL}/balance", {'active': '|'.join(addresses)})
+            if response.status_code == 200:
+                return BlockchainInfoAPI.parse_balances(response.json(), addresses)
+            if response.status_code == 429:
+                raise RateLimitExceeded(self.PROVIDER, retry_after(response, self.PROVIDER))
+            print(f"Blockchain.info API Error: {response.status_code} - {response.text}")
+            return None
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error fetching balances from Blockchain.info API: {str(e)}")
+            return None
+
+    async def iter_transactions(self, address, limit=50, offset=0):
+        """
+        Stream a page of transactions as normalized dicts, parsing the body as it arrives.
+
+        Rate limits raise RateLimitExceeded and other failures, including a body that
+        breaks off mid-page, raise as the generator is consumed.
+        """
+        url = f"{BlockchainInfoAPI.BASE_URL}/rawaddr/{address}"
+        params = {'format': 'json', 'limit': limit, 'offset': offset}
+        async with self.engine.stream(BlockchainInfoAPI.PROVIDER, BlockchainInfoAPI.API_KEY, url, params) as response:
+            if response.status_code == 429:
+                raise RateLimitExceeded(BlockchainInfoAPI.PROVIDER, retry_after(response, BlockchainInfoAPI.PROVIDER))
+            response.raise_for_status()
+            async for tx in ijson.items_async(_AsyncBody(response), 'txs.item'):
+                yield _normalize(self.PROVIDER, BlockchainInfoAPI.normalize_transaction, tx, address)
+
+
+class AsyncBlockchairAPI:
+    """Async counterpart of BlockchairAPI, sharing its response parsing; history walks fail over to it"""
+    PROVIDER = BlockchairAPI.PROVIDER
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    async def iter_transactions(self, address, limit=50, offset=0):
+        """Stream a page of transactions as normalized dicts, like AsyncBlockchainInfoAPI.iter_transactions()"""
+        url = f"{BlockchairAPI.BASE_URL}/dashboards/address/{address}"
+        # Blockchair takes "<transactions>,<utxos>" pairs for limit and offset
+        params = {'limit': f"{limit},0", 'offset': f"{offset},0"}
+        if BlockchairAPI.API_KEY:
+            params['key'] = BlockchairAPI.API_KEY
+        async with self.engine.stream(BlockchairAPI.PROVIDER, BlockchairAPI.API_KEY, url, params) as response:
+            if response.status_code == 429:
+                raise RateLimitExceeded(BlockchairAPI.PROVIDER, retry_after(response, BlockchairAPI.PROVIDER))
+            response.raise_for_status()
+            async for tx in ijson.items_async(_AsyncBody(response), f'data.{address}.transactions.item'):
+                yield _normalize(self.PROVIDER, BlockchairAPI.normalize_transaction, tx, address)
+
+
+async def _ingest_page(address, transactions, scan, summary):
+    """
+    Store a streamed page in INGEST_BATCH_SIZE batches as it arrives, watching it for the
+    cursor. Fills in ``summary`` as it goes, so it counts the batches stored before a
+    failure too.
+    """
+    batch = []
+    async for tx_data in transactions:
+        batch.append(tx_data)
+        if len(batch) == INGEST_BATCH_SIZE:
+            await sync_to_async(ingest_stream_batch)(address, list(scan.watch(batch)), summary)
+            batch = []
+    if batch:
+        await sync_to_async(ingest_stream_batch)(address, list(scan.watch(batch)), summary)
+
+
+async def _release(address_id, token, error):
+    # tasks imports this module, so the release, which enqueues merged follow-ups, is imported here
+    from .tasks import _release_sync
+    await sync_to_async(_release_sync)(address_id, token, error)
+
+
+async def _fetch_page(apis, address, summary, limit, offset, expect_cursor):
+    """
+    Stream a page into ``summary`` from the first provider that serves it, in order.
+
+    Returns the CursorScan of the page, and None once a provider served it or the seconds
+    until one may be asked again if the providers were rate limited. Raises the last
+    error if every provider failed otherwise.
+    """
+    waits = []
+    errors: list[Exception] = []
+    for api in apis:
+        scan = CursorScan(address, expect_cursor=expect_cursor)
+        try:
+            await _ingest_page(address, api.iter_transactions(address.address, limit=limit, offset=offset), scan, summary)
+            return scan, None
+        except RateLimitExceeded as e:
+            waits.append(e.retry_after)
+        except (httpx.HTTPError, ijson.JSONError, ProviderStreamError) as e:
+            errors.append(e)
+        # Rows stored before a failure stay stored, and the next provider re-reads them
+        print(f"{api.PROVIDER} failed at offset {offset} of {address.address}, failing over")
+        summary.update(fetched=0, reached_known=False, high_water=[])
+    if waits:
+        return scan, min(waits)
+    raise errors[-1]
+
+
+async def _sync_history(apis, address, page_size, max_pages):
+    """
+    Walk the pages an address is missing, streaming each into batched ingest.
+
+    The walk holds the address's single-flight sync lock and publishes its progress like
+    the Celery page chain, so the two never walk the same address at once; addresses with
+    a sync already in flight are left to it. Pages of one address are fetched in turn,
+    each continuing where the last one ended, while addresses run concurrently. Each
+    page fails over between ``apis`` in order. Returns the number of new transactions and,
+    if every provider was rate limited, the seconds to wait before resuming the walk.
+    """
+    stored_count = await sync_to_async(address.legs.count)()
+    missing = address.transaction_count - stored_count
+    if missing <= 0:
+        return 0, None
+    status, token = await sync_to_async(request_sync)(address.id, fetch_transactions=True)
+    if status != ACQUIRED:
+        print(f"A sync of {address.address} is already in flight, leaving its history to it")
+        return 0, None
+    
+    pages = min(max_pages, math.ceil(missing / page_size))
+    await sync_to_async(start_progress)(address.id, 'history', expected=min(missing, pages * page_size))
+    new_transactions = 0
+    deferred = None
+    error = ''
+    held = True
+    # Continue after the history cursor, or from the newest transaction the first time
+    offset = resume_offset(address)
+    try:
+        for page in range(pages):
+            if not await sync_to_async(touch_sync)(address.id, token, page + 1):
+                print(f"Sync lock for {address.address} was taken over by another sync, stopping at page {page+1}")
+                held = False
+                break
+            summary = new_stream_summary()
+            try:
+                # Only the first page continues from the saved cursor; the rest follow it
+                scan, deferred = await _fetch_page(apis, address, summary, page_size, offset, expect_cursor=page == 0)
+            except (httpx.HTTPError, ijson.JSONError, ProviderStreamError) as e:
+                error = f"Page {page+1} failed: {str(e)}"
+                print(f"Error fetching transactions for {address.address}: {error}")
+                break
+            finally:
+                new_transactions += summary['new']
+            if deferred is not None:
+                # The rest of the walk is rescheduled by the caller rather than waited for here
+                print(f"Rate limited at page {page+1} of {address.address}, resuming in {deferred:.1f} seconds")
+                await sync_to_async(record_error)(address.id, f"Rate limited at page {page+1}, resuming in {deferred:.0f} seconds")
+                break
+            await sync_to_async(record_page)(address.id, summary['fetched'], summary['new'])
+            
+            update_fields = advance_history_cursor(address, scan, offset, page_size)
+            if offset == 0 and summary['fetched']:
+                update_fields += advance_high_water_mark(address, summary['high_water'])
+            if update_fields:
+                await sync_to_async(address.save)(update_fields=update_fields)
+            if scan.overshot or summary['fetched'] < page_size:
+                # Past the end, or stepped back to close a gap the next sync reads
+                break
+            offset += summary['fetched']
+    except Exception as e:
+        error = f"Sync failed: {str(e)}"
+        raise
+    finally:
+        if held:
+            await _release(address.id, token, error)
+    return new_transactions, deferred
+
+
+async def _get_balances(api, chunk):
+    """Balances of a chunk of addresses, and the seconds to wait if the provider was rate limited"""
+    try:
+        return await api.get_balances([address.address for address in chunk]), None
+    except RateLimitExceeded as e:
+        return None, e.retry_after
+
+
+async def sync_addresses(address_ids, fetch_transactions=True, page_size=20, max_pages=5, transport=None):
+    """
+    Sync balances and missing history for many addresses from a single event loop.
+
+    Balance chunks, and the history walks of all addresses, are requested concurrently,
+    bounded by the per-provider semaphores and the shared rate limiter. Work the rate
+    limiter has no tokens left for is not waited for: the addresses whose balances or
+    walks it stopped are returned as ``deferred``, with the ``retry_after`` seconds to
+    wait before syncing them again.
+    """
+    addresses = [address async for address in BitcoinAddress.objects.filter(id__in=address_ids).order_by('id')]
+    
+    async with AsyncFetchEngine(transport) as engine:
+        api = AsyncBlockchainInfoAPI(engine)
+        # History walks fail over in the configured provider order, like the router
+        history_apis = {api.PROVIDER: api, AsyncBlockchairAPI.PROVIDER: AsyncBlockchairAPI(engine)}
+        apis = [history_apis[provider] for provider in settings.WALLET_PROVIDERS if provider in history_apis]
+        batch_size = BlockchainInfoAPI.BALANCE_BATCH_SIZE
+        chunks = [addresses[start:start + batch_size] for start in range(0, len(addresses), batch_size)]
+        results = await asyncio.gather(*(_get_balances(api, chunk) for chunk in chunks))
+        
+        synced_at = timezone.now()
+        updated = []
+        deferred = []
+        waits = []
+        for chunk, (balances, wait) in zip(chunks, results):
+            if wait is not None:
+                deferred += [address.id for address in chunk]
+                waits.append(wait)
+                continue
+            for address in chunk:
+                info = (balances or {}).get(address.address)
+                if info is None:
+                    continue
+                reschedule(address, info['tx_count'] != address.transaction_count, synced_at)
+                address.balance_sats = info['balance_sats']
+                address.transaction_count = info['tx_count']
+                address.last_synced = synced_at
+                updated.append(address)
+        await sync_to_async(BitcoinAddress.objects.bulk_update)(
+            updated,
+            ['balance_sats', 'transaction_count', 'last_synced', 'sync_interval', 'next_sync_at'],
+            batch_size=batch_size,
+        )
+        await sync_to_async(invalidate_portfolios)(address_ids=[address.id for address in updated])
+        
+        new_transactions = 0
+        if fetch_transactions:
+            walks = await asyncio.gather(
+                *(_sync_history(apis, address, page_size, max_pages) for address in updated)
+            )
+            for address, (count, wait) in zip(updated, walks):
+                new_transactions += count
+                if wait is not None:
+                    deferred.append(address.id)
+                    waits.append(wait)
+    
+    return {
+        'addresses': len(addresses),
+        'updated': len(updated),
+        'new_transactions': new_transactions,
+        'deferred': deferred,
+        'retry_after': max(waits) if waits else None,
+    }
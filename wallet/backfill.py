@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.db import transaction
+from .checkpoints import CURSOR_MARGIN
+from .models import BackfillRange
+from .routing import get_provider_router
+
+
+def plan_backfill(address, total):
+    """
+    Split an address's history into BackfillRange checkpoints, or resume unfinished ones.
+
+    Ranges left pending, running or failed by an interrupted backfill are reused with their
+    checkpoints, so only their unfetched part is requested again. Transactions received
+    since the ranges were planned move their rows to higher offsets, so the offsets are
+    shifted by any growth in ``total`` and then resume CURSOR_MARGIN rows early. Otherwise
+    ``total`` transactions are split into WALLET_BACKFILL_RANGE_SIZE slices, each
+    preferring the next provider in turn. Returns the ranges still to fetch.
+    """
+    unfinished = list(address.backfill_ranges.exclude(status=BackfillRange.Status.DONE))
+    if unfinished:
+        for backfill_range in unfinished:
+            shift = max(0, total - backfill_range.tx_count)
+            if shift:
+                backfill_range.start_offset += shift
+                backfill_range.end_offset += shift
+                backfill_range.next_offset = max(
+                    backfill_range.start_offset, backfill_range.next_offset + shift - CURSOR_MARGIN
+                )
+                backfill_range.tx_count = total
+            backfill_range.status = BackfillRange.Status.PENDING
+            backfill_range.error = ''
+        BackfillRange.objects.bulk_update(
+            unfinished, ['start_offset', 'end_offset', 'next_offset', 'tx_count', 'status', 'error']
+        )
+        return unfinished
+
+    providers = [api.PROVIDER for api in get_provider_router().ranked('iter_transactions')]
+    size = settings.WALLET_BACKFILL_RANGE_SIZE
+    ranges = [
+        BackfillRange(
+            address=address,
+            start_offset=start,
+            end_offset=min(start + size, total),
+            next_offset=start,
+            provider=providers[index % len(providers)],
+            tx_count=total,
+        )
+        for index, start in enumerate(range(0, total, size))
+    ]
+    with transaction.atomic():
+        address.backfill_ranges.all().delete()
+        BackfillRange.objects.bulk_create(ranges)
+    return list(address.backfill_ranges.all())
+
+
+def merge_results(results):
+    """Total up the summaries returned by a backfill's range tasks"""
+    return {
+        'ranges': len(results),
+        'fetched': sum(result['fetched'] for result in results),
+        'new': sum(result['new'] for result in results),
+        'unfinished': [result['range_id'] for result in results if result['status'] != BackfillRange.Status.DONE],
+    }
@@ -0,0 +1,80 @@
+from datetime import date, datetime, time
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import BitcoinAddress, DailyBalance, TransactionLeg
+
+
+def lock_series(address_ids):
+    """
+    Lock the rows of the given addresses until the end of the transaction.
+
+    Writers of an address's legs and daily series take turns on its row, so each reads the
+    legs and rows the previous one committed (a no-op on SQLite, which serializes writers
+    anyway). Rows are locked in id order, so writers crediting the same addresses cannot
+    deadlock.
+    """
+    list(BitcoinAddress.objects.select_for_update().filter(id__in=sorted(address_ids)).order_by('id').values_list('id'))
+
+
+def _daily_nets(address_id, since=None):
+    legs = TransactionLeg.objects.filter(address_id=address_id)
+    if since is not None:
+        legs = legs.filter(timestamp__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    return (
+        legs.annotate(day=TruncDate('timestamp'))
+        .values_list('day')
+        .annotate(net_sats=Sum('amount_sats'))
+        .order_by('day')
+    )
+
+
+def update_daily_balances(legs):
+    """
+    Bring the daily balance series of newly stored legs' addresses up to date.
+
+    The days from each address's earliest new leg onwards are recomputed from its stored
+    legs rather than by adding up the given ones, so a leg that a concurrent ingest
+    stored too is never counted twice, and are written back with one upsert. Appending
+    new activity touches the last row or two, while a backfilled older page shifts the
+    running balance of the days after it. Each address costs a fixed number of queries
+    however many legs it has.
+    """
+    first_days: dict[int, date] = {}
+    for leg in legs:
+        day = timezone.localdate(leg.timestamp)
+        first_days[leg.address_id] = min(day, first_days.get(leg.address_id, day))
+
+    if not first_days:
+        return
+    with transaction.atomic():
+        lock_series(first_days)
+        for address_id, first_day in sorted(first_days.items()):
+            balance = (
+                DailyBalance.objects.filter(address_id=address_id, date__lt=first_day)
+                .order_by('-date')
+                .values_list('balance_sats', flat=True)
+                .first()
+            ) or 0
+            rows = []
+            for day, net_sats in _daily_nets(address_id, since=first_day):
+                balance += net_sats
+                rows.append(DailyBalance(address_id=address_id, date=day, net_sats=net_sats, balance_sats=balance))
+            DailyBalance.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['address', 'date'], update_fields=['net_sats', 'balance_sats']
+            )
+
+
+def rebuild_daily_balances(address):
+    """Recompute an address's whole daily balance series from its stored legs"""
+    with transaction.atomic():
+        lock_series([address.id])
+        rows = []
+        balance = 0
+        for day, net_sats in _daily_nets(address.id):
+            balance += net_sats
+            rows.append(DailyBalance(address=address, date=day, net_sats=net_sats, balance_sats=balance))
+        DailyBalance.objects.filter(address=address).delete()
+        DailyBalance.objects.bulk_create(rows)
+    return len(rows)
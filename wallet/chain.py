@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.cache import cache
+
+CHAIN_TIP_CACHE_KEY = 'wallet:chain_tip'
+
+
+def get_chain_tip():
+    """The cached height of the newest block, or None until refresh_chain_tip has run"""
+    return cache.get(CHAIN_TIP_CACHE_KEY)
+
+
+def set_chain_tip(height):
+    # Outlives several refresh intervals so a missed refresh shows slightly old counts, not none
+    cache.set(CHAIN_TIP_CACHE_KEY, height, timeout=settings.WALLET_CHAIN_TIP_CACHE_TIMEOUT)
@@ -0,0 +1,94 @@
+import math
+
+# Rows re-read before a cursor's estimated position when a walk resumes, so its first page
+# still starts at or before the cursor when the estimate is slightly off, and finding it
+# proves there is no gap. Later pages of the same walk follow on exactly and skip it.
+CURSOR_MARGIN = 5
+
+
+def _height(block_height):
+    # Providers list history newest first, with unconfirmed transactions on top
+    return math.inf if block_height is None else block_height
+
+
+def resume_offset(address, margin=CURSOR_MARGIN):
+    """
+    Provider offset to fetch the page continuing an address's history walk from.
+
+    Providers page newest-first by offset, so every transaction received since the cursor
+    was saved moves it further down; the shift is how much the address's transaction
+    count has grown since. Starts at the top when there is no cursor. Pass ``margin=0``
+    for a page following on from the one that just saved the cursor.
+    """
+    if not address.history_cursor_hash:
+        return 0
+    shift = address.transaction_count - address.history_cursor_tx_count
+    return max(0, address.history_cursor_offset + shift - margin)
+
+
+class CursorScan:
+    """
+    Watch a page of history stream past for the address's cursor, without holding the page.
+
+    Pass ``expect_cursor=False`` for a page fetched right after another one in the same
+    pass, which continues from that page rather than from the saved cursor.
+    """
+
+    def __init__(self, address, expect_cursor=True):
+        self.address = address
+        self.expect_cursor = expect_cursor
+        self.found = False
+        self.first = None
+        self.last = None
+        self.count = 0
+
+    def watch(self, transactions):
+        for tx_data in transactions:
+            if self.first is None:
+                self.first = tx_data
+            if tx_data['hash'] == self.address.history_cursor_hash:
+                self.found = True
+            self.last = tx_data
+            self.count += 1
+            yield tx_data
+
+    @property
+    def overshot(self):
+        """Whether the page started below the cursor, so rows between them may be unread"""
+        return (
+            self.expect_cursor
+            and bool(self.address.history_cursor_hash)
+            and not self.found
+            and self.first is not None
+            and _height(self.first.get('block_height')) < _height(self.address.history_cursor_height)
+        )
+
+
+def advance_history_cursor(address, scan, offset, page_size):
+    """
+    Move an address's history cursor to the oldest transaction of a page read at ``offset``.
+
+    If the page overshot the cursor, the cursor stays where it is and is stepped back a
+    page so the next fetch reads the rows in between. Sets the fields without saving and
+    returns their names for save(update_fields=...).
+    """
+    if scan.overshot:
+        print(f"Page at offset {offset} started past the history cursor of {address.address}, stepping back")
+        address.history_cursor_offset = max(0, address.history_cursor_offset - page_size)
+        return ['history_cursor_offset']
+    if scan.last is None:
+        return []
+    address.history_cursor_hash = scan.last['hash']
+    address.history_cursor_height = scan.last.get('block_height')
+    address.history_cursor_offset = offset + scan.count
+    address.history_cursor_tx_count = address.transaction_count
+    return ['history_cursor_hash', 'history_cursor_height', 'history_cursor_offset', 'history_cursor_tx_count']
+
+
+def clear_history_cursor(address):
+    """Restart an address's history walk from its newest transaction; returns the changed fields"""
+    address.history_cursor_hash = ''
+    address.history_cursor_height = None
+    address.history_cursor_offset = 0
+    address.history_cursor_tx_count = 0
+    return ['history_cursor_hash', 'history_cursor_height', 'history_cursor_offset', 'history_cursor_tx_count']
@@ -0,0 +1,31 @@
+import fakeredis
+import pytest
+from django.core.cache import cache
+
+from bitcoin_wallet_tracker.users.models import User
+from bitcoin_wallet_tracker.users.tests.factories import UserFactory
+
+
+@pytest.fixture
+def user(db) -> User:
+    return UserFactory()
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch) -> fakeredis.FakeRedis:
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr("wallet.redis_client._client", client)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def _single_provider(settings, monkeypatch) -> None:
+    """Route sync tasks to blockchain.info only, with fresh health scores per test."""
+    settings.WALLET_PROVIDERS = ["blockchain_info"]
+    monkeypatch.setattr("wallet.routing._router", None)
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache() -> None:
+    """Cached portfolio rollups must not leak between tests reusing user ids."""
+    cache.clear()
@@ -0,0 +1,81 @@
+import time
+from contextvars import ContextVar
+from django.conf import settings
+
+# Whether reads in the current request may go to the replica; False outside requests,
+# so Celery workers and management commands always read and write the primary
+_use_replica = ContextVar('wallet_use_replica', default=False)
+
+PIN_COOKIE = 'wallet_pin_primary'
+
+
+def replica_alias():
+    """The configured replica alias, or None when no replica database is set up"""
+    alias = settings.WALLET_REPLICA_ALIAS
+    return alias if alias in settings.DATABASES else None
+
+
+def reads_from_replica():
+    return _use_replica.get()
+
+
+def pin_to_primary(request):
+    """Read this user's following requests from the primary so they see their own writes"""
+    request.wallet_pin_primary = True
+
+
+class ReplicaRouter:
+    """
+    Send view reads to the read replica and everything else to the primary.
+
+    Reads only go to the replica inside requests ReplicaMiddleware has marked as safe, so
+    workers, commands and migrations are unaffected. Writes always go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if alias and _use_replica.get():
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so objects from either may be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != replica_alias()
+
+
+class ReplicaMiddleware:
+    """
+    Mark GET and HEAD requests as replica reads, with read-your-writes stickiness.
+
+    After a write request, or a view calling pin_to_primary(), a short-lived cookie pins the
+    user to the primary for WALLET_REPLICA_STICKY_SECONDS so replication lag never hides
+    the change they just made.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned_until = request.COOKIES.get(PIN_COOKIE)
+        try:
+            pinned = pinned_until is not None and float(pinned_until) > time.time()
+        except ValueError:
+            pinned = False
+
+        use_replica = request.method in ('GET', 'HEAD') and not pinned
+        token = _use_replica.set(use_replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') or getattr(request, 'wallet_pin_primary', False):
+            sticky = settings.WALLET_REPLICA_STICKY_SECONDS
+            response.set_cookie(PIN_COOKIE, str(time.time() + sticky), max_age=sticky, httponly=True, samesite='Lax')
+        return response
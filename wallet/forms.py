@@ -1,14 +1,22 @@
 from django import forms
-from .models import BitcoinAddress
+from django.db import transaction
+from .models import BitcoinAddress, WatchedAddress
 
-class BitcoinAddressForm(forms.ModelForm):
-    class Meta:
-        model = BitcoinAddress
-        fields = ['address', 'label']
-        widgets = {
-            'address': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter Bitcoin Address'}),
-            'label': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter Label (optional)'})
-        }
+class BitcoinAddressForm(forms.Form):
+    """Start watching an address; the address itself is shared between all its watchers"""
+    address = forms.CharField(
+        max_length=100,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter Bitcoin Address'})
+    )
+    label = forms.CharField(
+        max_length=100,
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Enter Label (optional)'})
+    )
+    
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
 
     def clean_address(self):
         address = self.cleaned_data['address']
@@ -27,4 +35,22 @@ class BitcoinAddressForm(forms.ModelForm):
             if not (len(address) >= 26 and len(address) <= 35):
                 raise forms.ValidationError("Invalid Bitcoin address length")
                 
-        return address 
\ No newline at end of file
+        return address
+    
+    def clean(self):
+        super().clean()
+        address = self.cleaned_data.get('address')
+        if address and WatchedAddress.objects.filter(user=self.user, address__address=address).exists():
+            raise forms.ValidationError("You are already watching this address")
+        return self.cleaned_data
+    
+    def save(self):
+        """Watch the address, creating the shared address record if nobody tracks it yet"""
+        with transaction.atomic():
+            while True:
+                address, _ = BitcoinAddress.objects.get_or_create(address=self.cleaned_data['address'])
+                # Hold the row, so removing its last other watcher cannot delete it under us;
+                # if that removal got there first the address is gone and is created again
+                if list(BitcoinAddress.objects.select_for_update().filter(pk=address.pk).values_list('id')):
+                    break
+            return WatchedAddress.objects.create(user=self.user, address=address, label=self.cleaned_data['label'])
@@ -0,0 +1,181 @@
+from itertools import islice
+from django.db import transaction
+from typing import Any, TypedDict
+from .balances import lock_series, update_daily_balances
+from .portfolio import invalidate_portfolios
+from .models import BitcoinAddress, Transaction, TransactionLeg
+
+# Parsed transactions written per bulk_create when ingesting a stream
+INGEST_BATCH_SIZE = 500
+
+
+class StreamSummary(TypedDict):
+    """What ingest_transaction_stream() found in a stream of transactions"""
+    fetched: int
+    new: int
+    reached_known: bool
+    high_water: list[dict[str, Any]]
+
+
+def ingest_transactions(address, transactions, defer_balances=False):
+    """
+    Store a page of parsed provider transactions fetched for an address.
+
+    Each transaction is stored once in the shared raw table, then credited with a leg to
+    every tracked address it touches, not only the one it was fetched for, so other
+    watchers' addresses need no provider call of their own, and the new legs are folded
+    into each address's daily balance series. Lookups and inserts are done per page in
+    bulk. The legs are written holding the tracked addresses' locks, so a transaction
+    stored concurrently is credited once and counted as new once.
+    Stored transactions that were unconfirmed get the block height they were mined at.
+    With ``defer_balances`` the legs of ``address`` itself are left out of its daily
+    series, for callers that rebuild it once they are done. Returns the number of new
+    legs for ``address``.
+    """
+    # Providers occasionally repeat a transaction across page boundaries
+    by_hash = {tx_data['hash']: tx_data for tx_data in transactions}
+    if not by_hash:
+        return 0
+    
+    stored = Transaction.objects.filter(tx_hash__in=by_hash.keys()).values_list('tx_hash', 'id', 'block_height')
+    tx_ids = {}
+    confirmed = []
+    for tx_hash, tx_id, block_height in stored:
+        tx_ids[tx_hash] = tx_id
+        # Transactions first stored from the mempool get their block once it is mined
+        if block_height is None and by_hash[tx_hash].get('block_height') is not None:
+            confirmed.append(Transaction(id=tx_id, block_height=by_hash[tx_hash]['block_height']))
+    if confirmed:
+        Transaction.objects.bulk_update(confirmed, ['block_height'])
+    new_rows = [
+        Transaction(
+            tx_hash=tx_hash,
+            timestamp=tx_data['timestamp'],
+            block_height=tx_data.get('block_height')
+        )
+        for tx_hash, tx_data in by_hash.items()
+        if tx_hash not in tx_ids
+    ]
+    if new_rows:
+        Transaction.objects.bulk_create(new_rows, ignore_conflicts=True)
+        # ignore_conflicts does not report primary keys back, so read them once
+        tx_ids.update(
+            Transaction.objects.filter(tx_hash__in=[tx.tx_hash for tx in new_rows]).values_list('tx_hash', 'id')
+        )
+    
+    # Parsers without per-address legs only describe the address they were fetched for
+    legs_by_hash = {
+        tx_hash: tx_data.get('legs') or {
+            address.address: {'amount_sats': tx_data['amount_sats'], 'is_sending': tx_data['is_sending']}
+        }
+        for tx_hash, tx_data in by_hash.items()
+    }
+    touched = {addr for legs in legs_by_hash.values() for addr in legs}
+    tracked = dict(BitcoinAddress.objects.filter(address__in=touched).values_list('address', 'id'))
+    tracked[address.address] = address.id
+    with transaction.atomic():
+        # Ingests crediting the same addresses take turns, so the legs read here are all
+        # that are stored and every leg built below is really new, overlapping pages included
+        lock_series(tracked.values())
+        existing = set(
+            TransactionLeg.objects.filter(
+                transaction_id__in=tx_ids.values(), address_id__in=tracked.values()
+            ).values_list('transaction_id', 'address_id')
+        )
+        
+        new_legs = [
+            TransactionLeg(
+                transaction_id=tx_ids[tx_hash],
+                address_id=tracked[addr],
+                amount_sats=leg['amount_sats'],
+                is_sending=leg['is_sending'],
+                timestamp=by_hash[tx_hash]['timestamp']
+            )
+            for tx_hash, legs in legs_by_hash.items()
+            for addr, leg in legs.items()
+            if addr in tracked and (tx_ids[tx_hash], tracked[addr]) not in existing
+        ]
+        TransactionLeg.objects.bulk_create(new_legs)
+        update_daily_balances(
+            [leg for leg in new_legs if leg.address_id != address.id] if defer_balances else new_legs
+        )
+    if new_legs:
+        invalidate_portfolios(address_ids={leg.address_id for leg in new_legs})
+    return sum(1 for leg in new_legs if leg.address_id == address.id)
+
+
+def high_water_mark(address, transactions):
+    """
+    The ``[hash, block height]`` high-water mark of an address after a first page.
+
+    It is the page's newest transaction and the highest block seen so far, never lower
+    than the address's current mark. A list, so it can be passed between tasks as is.
+    """
+    heights = [tx_data['block_height'] for tx_data in transactions if tx_data.get('block_height') is not None]
+    height = max(heights + [address.latest_block_height or 0]) if heights else address.latest_block_height
+    return [transactions[0]['hash'], height]
+
+
+def advance_high_water_mark(address, transactions=None, mark=None):
+    """
+    Move the address's high-water mark up to the newest transaction of a first page,
+    or to a ``mark`` taken from high_water_mark() earlier.
+
+    Sets the fields without saving and returns their names for save(update_fields=...).
+    """
+    address.latest_tx_hash, address.latest_block_height = mark or high_water_mark(address, transactions)
+    return ['latest_tx_hash', 'latest_block_height']
+
+
+def ingest_transaction_stream(address, transactions, batch_size=INGEST_BATCH_SIZE, defer_balances=False, known_mark=None) -> StreamSummary:
+    """
+    Store a stream of parsed provider transactions for an address in fixed-size batches.
+
+    ``transactions`` may be any iterable, typically a provider generator parsing the
+    response body as it is read, so memory stays bounded by ``batch_size`` rather than the
+    page size. Returns a summary with the number of transactions ``fetched`` and ``new``,
+    whether the stream ``reached_known`` history (the address's newest stored transaction or
+    one at or below its high-water block) and the ``high_water`` transactions to pass to
+    advance_high_water_mark. A walk over several pages passes the ``known_mark`` it started
+    from, since its first page may already have moved the address's mark.
+    """
+    summary = new_stream_summary()
+    transactions = iter(transactions)
+    while batch := list(islice(transactions, batch_size)):
+        ingest_stream_batch(address, batch, summary, defer_balances=defer_balances, known_mark=known_mark)
+    return summary
+
+
+def new_stream_summary() -> StreamSummary:
+    """Empty summary of a stream, filled in by ingest_stream_batch()"""
+    return {'fetched': 0, 'new': 0, 'reached_known': False, 'high_water': []}
+
+
+def ingest_stream_batch(address, batch, summary: StreamSummary, defer_balances=False, known_mark=None):
+    """Store one batch of a transaction stream and fold it into the stream's ``summary``"""
+    new_transactions = ingest_transactions(address, batch, defer_balances=defer_balances)
+    summary['fetched'] += len(batch)
+    summary['new'] += new_transactions
+    
+    # A stored leg may have been credited from another address's sync, so only this
+    # address's own high-water mark proves that the history beyond it is stored
+    known_hash, known_height = known_mark or [address.latest_tx_hash, address.latest_block_height]
+    if any(
+        tx_data['hash'] == known_hash
+        or (
+            known_height is not None
+            and tx_data.get('block_height') is not None
+            and tx_data['block_height'] <= known_height
+        )
+        for tx_data in batch
+    ):
+        summary['reached_known'] = True
+    
+    # Keep only the newest transaction and the highest block seen, not the whole stream
+    newest = summary['high_water'][:1] or batch[:1]
+    with_height = [
+        tx_data for tx_data in summary['high_water'][1:] + batch if tx_data.get('block_height') is not None
+    ]
+    if with_height:
+        newest.append(max(with_height, key=lambda tx_data: tx_data['block_height']))
+    summary['high_water'] = newest
@@ -0,0 +1,52 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from wallet.async_services import sync_addresses
+from wallet.models import BitcoinAddress
+from wallet.tasks import sync_addresses_concurrently
+
+
+class Command(BaseCommand):
+    help = "Sync Bitcoin addresses concurrently with the asyncio fetch engine"
+
+    def add_arguments(self, parser):
+        parser.add_argument("address_ids", nargs="*", type=int, help="Addresses to sync (default: all)")
+        parser.add_argument("--user", type=int, dest="user_id", help="Only sync this user's addresses")
+        parser.add_argument("--balances-only", action="store_true", help="Skip transaction history")
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--max-pages", type=int, default=5)
+        parser.add_argument("--queue", action="store_true", help="Enqueue a Celery task instead of running here")
+
+    def handle(self, *args, **options):
+        addresses = BitcoinAddress.objects.all()
+        if options["address_ids"]:
+            addresses = addresses.filter(id__in=options["address_ids"])
+        if options["user_id"] is not None:
+            addresses = addresses.filter(watchers__user_id=options["user_id"])
+        ids = list(addresses.values_list("id", flat=True))
+
+        kwargs = {
+            "fetch_transactions": not options["balances_only"],
+            "page_size": options["page_size"],
+            "max_pages": options["max_pages"],
+        }
+        if options["queue"]:
+            result = sync_addresses_concurrently.delay(address_ids=ids, **kwargs)
+            self.stdout.write(f"Queued concurrent sync of {len(ids)} addresses as task {result.id}")
+            return
+
+        result = asyncio.run(sync_addresses(ids, **kwargs))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Synchronized {result['updated']} of {result['addresses']} addresses, "
+                f"added {result['new_transactions']} transactions",
+            ),
+        )
+        if result["deferred"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Rate limited: {len(result['deferred'])} addresses were left to sync, "
+                    f"run again in {result['retry_after']:.0f} seconds or use --queue",
+                ),
+            )
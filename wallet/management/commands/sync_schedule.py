@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from wallet.scheduler import get_last_run
+from wallet.scheduler import plan_syncs
+from wallet.scheduler import sync_budget
+
+
+class Command(BaseCommand):
+    help = "Show the adaptive sync scheduler's decisions from its last run, or what it would pick now"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--plan", action="store_true", help="Score due addresses now instead of showing the last run")
+        parser.add_argument("--limit", type=int, default=20, help="Number of decisions to show")
+
+    def handle(self, *args, **options):
+        if options["plan"]:
+            budget = sync_budget()
+            decisions = plan_syncs(budget=budget)
+            self.stdout.write(f"Plan: {len(decisions)} addresses due, budget {budget}")
+        else:
+            run = get_last_run()
+            if run is None:
+                self.stdout.write("The scheduler has not run yet; use --plan to preview it")
+                return
+            decisions = run["decisions"]
+            self.stdout.write(
+                f"Last run at {run['ran_at']:%Y-%m-%d %H:%M:%S}: "
+                f"{run['selected']} of {run['due']} due addresses scheduled, budget {run['budget']}",
+            )
+
+        for decision in decisions[: options["limit"]]:
+            age = "never synced" if decision["age_seconds"] is None else f"synced {decision['age_seconds']:.0f}s ago"
+            marker = "*" if decision["selected"] else " "
+            self.stdout.write(
+                f"{marker} {decision['score']:10.2f}  {decision['address']}  {age}, "
+                f"every {decision['sync_interval']}s, {decision['recent_legs']} recent, "
+                f"{decision['watchers']} watching",
+            )
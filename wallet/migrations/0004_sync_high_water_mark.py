@@ -0,0 +1,28 @@
+# Generated by Django 5.0.12 on 2026-10-18 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0003_bitcoinaddress_last_fetched_page'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitcoinaddress',
+            name='latest_block_height',
+            field=models.IntegerField(blank=True, help_text='Block height of the newest stored confirmed transaction', null=True),
+        ),
+        migrations.AddField(
+            model_name='bitcoinaddress',
+            name='latest_tx_hash',
+            field=models.CharField(blank=True, help_text='Newest stored transaction hash', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='block_height',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+
+SATOSHIS_PER_BTC = 100000000
+
+
+def btc_to_sats(apps, schema_editor):
+    BitcoinAddress = apps.get_model('wallet', 'BitcoinAddress')
+    Transaction = apps.get_model('wallet', 'Transaction')
+    # One UPDATE per table; rounding guards against binary float drift on SQLite
+    BitcoinAddress.objects.update(
+        balance_sats=Cast(Round(F('current_balance') * SATOSHIS_PER_BTC), models.BigIntegerField())
+    )
+    Transaction.objects.update(
+        amount_sats=Cast(Round(F('amount') * SATOSHIS_PER_BTC), models.BigIntegerField())
+    )
+
+
+def sats_to_btc(apps, schema_editor):
+    BitcoinAddress = apps.get_model('wallet', 'BitcoinAddress')
+    Transaction = apps.get_model('wallet', 'Transaction')
+    # Converted in Python: SQLite would otherwise divide the integers as integers
+    for model, sats_field, btc_field in (
+        (BitcoinAddress, 'balance_sats', 'current_balance'),
+        (Transaction, 'amount_sats', 'amount'),
+    ):
+        rows = []
+        for row in model.objects.only('pk', sats_field).iterator(chunk_size=2000):
+            setattr(row, btc_field, Decimal(getattr(row, sats_field)) / SATOSHIS_PER_BTC)
+            rows.append(row)
+        model.objects.bulk_update(rows, [btc_field], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0004_sync_high_water_mark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitcoinaddress',
+            name='balance_sats',
+            field=models.BigIntegerField(default=0, help_text='Current balance in satoshis'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='amount_sats',
+            field=models.BigIntegerField(default=0, help_text='Amount in satoshis'),
+            preserve_default=False,
+        ),
+        # Nullable while both columns exist so the migration can be reversed
+        migrations.AlterField(
+            model_name='transaction',
+            name='amount',
+            field=models.DecimalField(decimal_places=8, max_digits=30, null=True),
+        ),
+        migrations.RunPython(btc_to_sats, sats_to_btc),
+        migrations.RemoveField(
+            model_name='bitcoinaddress',
+            name='current_balance',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='amount',
+        ),
+    ]
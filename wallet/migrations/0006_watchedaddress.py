@@ -0,0 +1,72 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def owners_to_watchers(apps, schema_editor):
+    BitcoinAddress = apps.get_model('wallet', 'BitcoinAddress')
+    WatchedAddress = apps.get_model('wallet', 'WatchedAddress')
+    # Addresses were unique, so every existing row becomes one canonical address with one watcher
+    WatchedAddress.objects.bulk_create([
+        WatchedAddress(user_id=address.user_id, address_id=address.id, label=address.label)
+        for address in BitcoinAddress.objects.all()
+    ])
+    # auto_now_add stamps the watches with today; keep the date the address was added instead
+    WatchedAddress.objects.update(
+        created_at=Subquery(BitcoinAddress.objects.filter(id=OuterRef('address_id')).values('created_at')[:1])
+    )
+
+
+def watchers_to_owners(apps, schema_editor):
+    BitcoinAddress = apps.get_model('wallet', 'BitcoinAddress')
+    WatchedAddress = apps.get_model('wallet', 'WatchedAddress')
+    # The old schema has a single owner per address, so the earliest watcher keeps it
+    BitcoinAddress.objects.filter(watchers__isnull=True).delete()
+    addresses = []
+    for address in BitcoinAddress.objects.all():
+        watch = WatchedAddress.objects.filter(address_id=address.id).order_by('created_at', 'id').first()
+        address.user_id = watch.user_id
+        address.label = watch.label
+        addresses.append(address)
+    BitcoinAddress.objects.bulk_update(addresses, ['user', 'label'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('wallet', '0005_amounts_in_satoshis'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchedAddress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('address', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watchers', to='wallet.bitcoinaddress')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watched_addresses', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='watchedaddress',
+            constraint=models.UniqueConstraint(fields=('user', 'address'), name='unique_watched_address_per_user'),
+        ),
+        # Nullable while the data moves so the migration can be reversed
+        migrations.AlterField(
+            model_name='bitcoinaddress',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bitcoin_addresses', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(owners_to_watchers, watchers_to_owners),
+        migrations.RemoveField(
+            model_name='bitcoinaddress',
+            name='user',
+        ),
+        migrations.RemoveField(
+            model_name='bitcoinaddress',
+            name='label',
+        ),
+    ]
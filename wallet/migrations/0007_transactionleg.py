@@ -0,0 +1,110 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def transactions_to_legs(apps, schema_editor):
+    # Legs are net amounts (received minus spent), but the old rows of sending transactions
+    # hold the gross amount spent with change ignored, and there is nothing to net them
+    # against. Receiving rows are already net and are copied; sending ones get no leg, and
+    # their addresses walk their history again from the newest transaction, so the next
+    # sync stores those transactions' legs from provider data
+    BitcoinAddress = apps.get_model('wallet', 'BitcoinAddress')
+    Transaction = apps.get_model('wallet', 'Transaction')
+    TransactionLeg = apps.get_model('wallet', 'TransactionLeg')
+    legs = []
+    for tx in Transaction.objects.filter(is_sending=False).order_by('id').iterator(chunk_size=BATCH_SIZE):
+        legs.append(TransactionLeg(
+            transaction_id=tx.id,
+            address_id=tx.address_id,
+            amount_sats=tx.amount_sats,
+            is_sending=False,
+            timestamp=tx.timestamp,
+        ))
+        if len(legs) >= BATCH_SIZE:
+            TransactionLeg.objects.bulk_create(legs)
+            legs = []
+    TransactionLeg.objects.bulk_create(legs)
+    
+    resync = Transaction.objects.filter(is_sending=True).values('address_id')
+    BitcoinAddress.objects.filter(id__in=resync).update(last_fetched_page=0, latest_tx_hash='', latest_block_height=None)
+
+
+def legs_to_transactions(apps, schema_editor):
+    Transaction = apps.get_model('wallet', 'Transaction')
+    TransactionLeg = apps.get_model('wallet', 'TransactionLeg')
+    # The old schema has one address per transaction, so only the first leg survives;
+    # sending transactions left without one are fetched again by the next sync
+    Transaction.objects.filter(legs__isnull=True).delete()
+    transactions = []
+    for tx in Transaction.objects.order_by('id').iterator(chunk_size=BATCH_SIZE):
+        leg = TransactionLeg.objects.filter(transaction_id=tx.id).order_by('id').first()
+        tx.address_id = leg.address_id
+        tx.amount_sats = leg.amount_sats
+        tx.is_sending = leg.is_sending
+        transactions.append(tx)
+    Transaction.objects.bulk_update(transactions, ['address', 'amount_sats', 'is_sending'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0006_watchedaddress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionLeg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount_sats', models.BigIntegerField(help_text='Amount in satoshis')),
+                ('is_sending', models.BooleanField()),
+                ('timestamp', models.DateTimeField()),
+                ('address', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legs', to='wallet.bitcoinaddress')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legs', to='wallet.transaction')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transactionleg',
+            index=models.Index(fields=['address', 'timestamp'], name='wallet_leg_address_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='transactionleg',
+            constraint=models.UniqueConstraint(fields=('transaction', 'address'), name='unique_leg_per_address'),
+        ),
+        # Nullable while the data moves so the migration can be reversed
+        migrations.AlterField(
+            model_name='transaction',
+            name='address',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='wallet.bitcoinaddress'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='amount_sats',
+            field=models.BigIntegerField(help_text='Amount in satoshis', null=True),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='is_sending',
+            field=models.BooleanField(null=True),
+        ),
+        migrations.RunPython(transactions_to_legs, legs_to_transactions),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='address',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='amount_sats',
+        ),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='is_sending',
+        ),
+        migrations.AddField(
+            model_name='bitcoinaddress',
+            name='transactions',
+            field=models.ManyToManyField(related_name='addresses', through='wallet.TransactionLeg', to='wallet.transaction'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.12 on 2026-10-18 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0007_transactionleg'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transactionleg',
+            name='wallet_leg_address_time_idx',
+        ),
+        migrations.AddIndex(
+            model_name='transactionleg',
+            index=models.Index(fields=['address', '-timestamp', '-id'], name='wallet_leg_address_time_id_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.12 on 2026-10-18 17:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def build_daily_balances(apps, schema_editor):
+    DailyBalance = apps.get_model('wallet', 'DailyBalance')
+    TransactionLeg = apps.get_model('wallet', 'TransactionLeg')
+    days = (
+        TransactionLeg.objects.annotate(day=TruncDate('timestamp'))
+        .values('address_id', 'day')
+        .annotate(net_sats=Sum('amount_sats'))
+        .order_by('address_id', 'day')
+    )
+    rows = []
+    balances = {}
+    for day in days:
+        balance = balances[day['address_id']] = balances.get(day['address_id'], 0) + day['net_sats']
+        rows.append(DailyBalance(address_id=day['address_id'], date=day['day'], net_sats=day['net_sats'], balance_sats=balance))
+    DailyBalance.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0008_leg_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('net_sats', models.BigIntegerField(default=0, help_text='Net change during the day in satoshis')),
+                ('balance_sats', models.BigIntegerField(default=0, help_text='Balance at the end of the day in satoshis')),
+                ('address', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to='wallet.bitcoinaddress')),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailybalance',
+            constraint=models.UniqueConstraint(fields=('address', 'date'), name='unique_daily_balance'),
+        ),
+        migrations.RunPython(build_daily_balances, migrations.RunPython.noop),
+    ]
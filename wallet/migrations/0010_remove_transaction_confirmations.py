@@ -0,0 +1,17 @@
+# Generated by Django 5.0.12 on 2026-10-18 17:34
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0009_dailybalance'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='transaction',
+            name='confirmations',
+        ),
+    ]
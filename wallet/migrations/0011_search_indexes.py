@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# Django already gives the unique address and tx_hash columns varchar_pattern_ops "_like"
+# indexes on PostgreSQL, so prefix LIKE searches are indexed there. Label search uses
+# icontains, which PostgreSQL runs as UPPER(label::text) LIKE, so the trigram index is
+# built on that same expression.
+POSTGRESQL_FORWARDS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    'CREATE INDEX IF NOT EXISTS wallet_watch_label_trgm ON wallet_watchedaddress '
+    'USING gin ((UPPER("label"::text)) gin_trgm_ops)',
+]
+POSTGRESQL_BACKWARDS = [
+    "DROP INDEX IF EXISTS wallet_watch_label_trgm",
+]
+
+# SQLite's LIKE is case-insensitive and only uses an index declared COLLATE NOCASE. These
+# are not part of the model state, so a later migration that rebuilds either table on
+# SQLite must call create_search_indexes() again.
+SQLITE_FORWARDS = [
+    "CREATE INDEX IF NOT EXISTS wallet_address_prefix ON wallet_bitcoinaddress (address COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS wallet_tx_hash_prefix ON wallet_transaction (tx_hash COLLATE NOCASE)",
+]
+SQLITE_BACKWARDS = [
+    "DROP INDEX IF EXISTS wallet_address_prefix",
+    "DROP INDEX IF EXISTS wallet_tx_hash_prefix",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_search_indexes(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRESQL_FORWARDS, 'sqlite': SQLITE_FORWARDS})
+
+
+def drop_search_indexes(apps, schema_editor):
+    _run(schema_editor, {'postgresql': POSTGRESQL_BACKWARDS, 'sqlite': SQLITE_BACKWARDS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0010_remove_transaction_confirmations'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
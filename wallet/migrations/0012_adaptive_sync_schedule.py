@@ -0,0 +1,29 @@
+# Generated by Django 5.0.12 on 2026-10-18 17:38
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_indexes = import_module('wallet.migrations.0011_search_indexes')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0011_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitcoinaddress',
+            name='next_sync_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='When the scheduler next considers this address due', null=True),
+        ),
+        migrations.AddField(
+            model_name='bitcoinaddress',
+            name='sync_interval',
+            field=models.IntegerField(default=300, help_text='Seconds between scheduled syncs, grown while the address is dormant'),
+        ),
+        # SQLite rebuilds the table to add sync_interval, dropping the raw search indexes
+        migrations.RunPython(search_indexes.create_search_indexes, migrations.RunPython.noop),
+    ]
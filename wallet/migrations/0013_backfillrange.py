@@ -0,0 +1,37 @@
+# Generated by Django 5.0.12 on 2026-10-18 17:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0012_adaptive_sync_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillRange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_offset', models.IntegerField()),
+                ('end_offset', models.IntegerField(help_text='First offset of the next range')),
+                ('next_offset', models.IntegerField(help_text='Checkpoint: first offset not fetched yet')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('provider', models.CharField(blank=True, help_text='Provider tried first for this range', max_length=50)),
+                ('fetched', models.IntegerField(default=0)),
+                ('new_transactions', models.IntegerField(default=0)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('address', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backfill_ranges', to='wallet.bitcoinaddress')),
+            ],
+            options={
+                'ordering': ['start_offset'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='backfillrange',
+            constraint=models.UniqueConstraint(fields=('address', 'start_offset'), name='unique_backfill_range'),
+        ),
+    ]
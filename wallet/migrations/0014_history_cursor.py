@@ -0,0 +1,76 @@
+# Generated by Django 5.0.12 on 2026-10-18 17:47
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+search_indexes = import_module('wallet.migrations.0011_search_indexes')
+
+
+def cursors_from_pages(apps, schema_editor):
+    # Page walks stored history contiguously from the newest transaction, so the oldest
+    # stored leg is where the walk stopped and the stored count is the offset past it
+    BitcoinAddress = apps.get_model('wallet', 'BitcoinAddress')
+    TransactionLeg = apps.get_model('wallet', 'TransactionLeg')
+    for address in BitcoinAddress.objects.filter(last_fetched_page__gt=0):
+        legs = TransactionLeg.objects.filter(address=address)
+        oldest = legs.order_by('timestamp', 'id').select_related('transaction').first()
+        if oldest is None:
+            continue
+        address.history_cursor_hash = oldest.transaction.tx_hash
+        address.history_cursor_height = oldest.transaction.block_height
+        address.history_cursor_offset = legs.count()
+        address.history_cursor_tx_count = address.transaction_count
+        address.save(update_fields=[
+            'history_cursor_hash', 'history_cursor_height', 'history_cursor_offset', 'history_cursor_tx_count'
+        ])
+
+
+def pages_from_cursors(apps, schema_editor):
+    BitcoinAddress = apps.get_model('wallet', 'BitcoinAddress')
+    for address in BitcoinAddress.objects.exclude(history_cursor_hash=''):
+        # Pages were 20 transactions by default
+        address.last_fetched_page = address.history_cursor_offset // 20
+        address.save(update_fields=['last_fetched_page'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0013_backfillrange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backfillrange',
+            name='tx_count',
+            field=models.IntegerField(default=0, help_text='Address transaction count the offsets were planned at'),
+        ),
+        migrations.AddField(
+            model_name='bitcoinaddress',
+            name='history_cursor_hash',
+            field=models.CharField(blank=True, help_text='Oldest transaction reached by the history walk', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='bitcoinaddress',
+            name='history_cursor_height',
+            field=models.IntegerField(blank=True, help_text='Block height of the history cursor transaction', null=True),
+        ),
+        migrations.AddField(
+            model_name='bitcoinaddress',
+            name='history_cursor_offset',
+            field=models.IntegerField(default=0, help_text='Provider offset just past the cursor when it was saved'),
+        ),
+        migrations.AddField(
+            model_name='bitcoinaddress',
+            name='history_cursor_tx_count',
+            field=models.IntegerField(default=0, help_text='Transaction count the cursor offset was measured at'),
+        ),
+        migrations.RunPython(cursors_from_pages, pages_from_cursors),
+        migrations.RemoveField(
+            model_name='bitcoinaddress',
+            name='last_fetched_page',
+        ),
+        # SQLite rebuilds the table for these changes, dropping the raw search indexes
+        migrations.RunPython(search_indexes.create_search_indexes, migrations.RunPython.noop),
+    ]
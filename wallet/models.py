@@ -1,23 +1,130 @@
+from decimal import Decimal
 from django.db import models
 from django.conf import settings
 
+SATOSHIS_PER_BTC = 100_000_000
+
+
+def sats_to_btc(sats):
+    """Convert an integer satoshi amount to BTC, for presentation only"""
+    return (Decimal(sats) / SATOSHIS_PER_BTC).quantize(Decimal('0.00000001'))
+
+
 class BitcoinAddress(models.Model):
+    """An on-chain address and its synced state, shared by every user watching it"""
     address = models.CharField(max_length=100, unique=True)
-    label = models.CharField(max_length=100, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     last_synced = models.DateTimeField(null=True, blank=True)
-    current_balance = models.DecimalField(max_digits=30, decimal_places=8, default=0)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bitcoin_addresses')
+    balance_sats = models.BigIntegerField(default=0, help_text="Current balance in satoshis")
     transaction_count = models.IntegerField(default=0)
-    last_fetched_page = models.IntegerField(default=0, help_text="Last page of transactions fetched")
+    # Where a continued history walk resumes; offsets shift as new transactions arrive,
+    # so the oldest transaction reached is stored and the offset re-derived from it
+    history_cursor_hash = models.CharField(max_length=100, blank=True, help_text="Oldest transaction reached by the history walk")
+    history_cursor_height = models.IntegerField(null=True, blank=True, help_text="Block height of the history cursor transaction")
+    history_cursor_offset = models.IntegerField(default=0, help_text="Provider offset just past the cursor when it was saved")
+    history_cursor_tx_count = models.IntegerField(default=0, help_text="Transaction count the cursor offset was measured at")
+    latest_tx_hash = models.CharField(max_length=100, blank=True, help_text="Newest stored transaction hash")
+    latest_block_height = models.IntegerField(null=True, blank=True, help_text="Block height of the newest stored confirmed transaction")
+    sync_interval = models.IntegerField(default=300, help_text="Seconds between scheduled syncs, grown while the address is dormant")
+    next_sync_at = models.DateTimeField(null=True, blank=True, db_index=True, help_text="When the scheduler next considers this address due")
+    transactions: 'models.ManyToManyField[Transaction, TransactionLeg]' = models.ManyToManyField(
+        'Transaction', through='TransactionLeg', related_name='addresses'
+    )
+    
+    def __str__(self):
+        return self.address
+
+
+class WatchedAddress(models.Model):
+    """A user's subscription to a BitcoinAddress, holding their own label"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='watched_addresses')
+    address = models.ForeignKey(BitcoinAddress, on_delete=models.CASCADE, related_name='watchers')
+    label = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'address'], name='unique_watched_address_per_user'),
+        ]
     
     def __str__(self):
-        return f"{self.address} ({self.label})" if self.label else self.address
+        return f"{self.address.address} ({self.label})" if self.label else self.address.address
+
+def confirmations(block_height, chain_tip):
+    """Confirmations of a transaction mined at ``block_height``; 0 while unconfirmed, None if the tip is unknown"""
+    if block_height is None:
+        return 0
+    if chain_tip is None:
+        return None
+    return max(chain_tip - block_height + 1, 1)
+
 
 class Transaction(models.Model):
+    """A raw on-chain transaction, stored once however many tracked addresses it touches"""
     tx_hash = models.CharField(max_length=100, unique=True)
-    address = models.ForeignKey(BitcoinAddress, on_delete=models.CASCADE, related_name='transactions')
-    amount = models.DecimalField(max_digits=30, decimal_places=8)
     timestamp = models.DateTimeField()
-    confirmations = models.IntegerField(default=0)
-    is_sending = models.BooleanField()  # True if sending, False if receiving
\ No newline at end of file
+    # Confirmations are derived from this and the cached chain tip when read
+    block_height = models.IntegerField(null=True, blank=True)
+    
+    def __str__(self):
+        return self.tx_hash
+
+
+class TransactionLeg(models.Model):
+    """The part of a transaction that moves funds in or out of one tracked address"""
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='legs')
+    address = models.ForeignKey(BitcoinAddress, on_delete=models.CASCADE, related_name='legs')
+    amount_sats = models.BigIntegerField(help_text="Amount in satoshis")
+    is_sending = models.BooleanField()  # True if sending, False if receiving
+    # Copied from the transaction so an address's history is read and paged from one index
+    timestamp = models.DateTimeField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['transaction', 'address'], name='unique_leg_per_address'),
+        ]
+        indexes = [
+            # Matches the (timestamp, id) keyset the transaction history is paginated on
+            models.Index(fields=['address', '-timestamp', '-id'], name='wallet_leg_address_time_id_idx'),
+        ]
+
+
+class BackfillRange(models.Model):
+    """A slice of an address's history, by offset from its newest transaction, fetched by one backfill task"""
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+    
+    address = models.ForeignKey(BitcoinAddress, on_delete=models.CASCADE, related_name='backfill_ranges')
+    start_offset = models.IntegerField()
+    end_offset = models.IntegerField(help_text="First offset of the next range")
+    next_offset = models.IntegerField(help_text="Checkpoint: first offset not fetched yet")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    provider = models.CharField(max_length=50, blank=True, help_text="Provider tried first for this range")
+    fetched = models.IntegerField(default=0)
+    new_transactions = models.IntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+    tx_count = models.IntegerField(default=0, help_text="Address transaction count the offsets were planned at")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['address', 'start_offset'], name='unique_backfill_range'),
+        ]
+        ordering = ['start_offset']
+
+
+class DailyBalance(models.Model):
+    """End-of-day balance of an address, maintained from its legs as they are ingested"""
+    address = models.ForeignKey(BitcoinAddress, on_delete=models.CASCADE, related_name='daily_balances')
+    date = models.DateField()
+    net_sats = models.BigIntegerField(default=0, help_text="Net change during the day in satoshis")
+    balance_sats = models.BigIntegerField(default=0, help_text="Balance at the end of the day in satoshis")
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['address', 'date'], name='unique_daily_balance'),
+        ]
+        ordering = ['date']
@@ -0,0 +1,66 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min, Q, Sum
+from django.utils import timezone
+from .models import BitcoinAddress, TransactionLeg, WatchedAddress
+
+
+def _version_key(user_id):
+    return f"wallet:portfolio:version:{user_id}"
+
+
+def _portfolio_key(user_id, version):
+    return f"wallet:portfolio:{user_id}:v{version}"
+
+
+def compute_portfolio(user_id):
+    """Aggregate a user's watched addresses into one summary dict"""
+    addresses = BitcoinAddress.objects.filter(watchers__user_id=user_id)
+    totals = addresses.aggregate(
+        address_count=Count('id'),
+        total_balance_sats=Sum('balance_sats', default=0),
+        total_transactions=Sum('transaction_count', default=0),
+        stalest_sync=Min('last_synced'),
+        never_synced=Count('id', filter=Q(last_synced__isnull=True)),
+    )
+    now = timezone.now()
+    flows = TransactionLeg.objects.filter(address__in=addresses).aggregate(
+        net_flow_24h_sats=Sum('amount_sats', filter=Q(timestamp__gte=now - timedelta(days=1)), default=0),
+        net_flow_7d_sats=Sum('amount_sats', filter=Q(timestamp__gte=now - timedelta(days=7)), default=0),
+    )
+    return {**totals, **flows, 'computed_at': now}
+
+
+def get_portfolio(user_id):
+    """
+    Return a user's portfolio summary from the cache, computing it on a miss.
+
+    Entries are keyed by a per-user version, so invalidation is a single counter bump and
+    stale entries simply expire. Versions start from a timestamp so an evicted counter
+    never reuses an old one. The timeout also bounds how old the rolling 24h and 7d
+    flows can get without any new sync.
+    """
+    version = cache.get_or_set(_version_key(user_id), time.time_ns(), timeout=None)
+    key = _portfolio_key(user_id, version)
+    portfolio = cache.get(key)
+    if portfolio is None:
+        portfolio = compute_portfolio(user_id)
+        cache.set(key, portfolio, timeout=settings.WALLET_PORTFOLIO_CACHE_TIMEOUT)
+    return portfolio
+
+
+def invalidate_portfolios(user_ids=None, address_ids=None):
+    """Bump the portfolio version of the given users and of everyone watching the given addresses"""
+    user_ids = set(user_ids or [])
+    if address_ids:
+        user_ids.update(
+            WatchedAddress.objects.filter(address_id__in=address_ids).values_list('user_id', flat=True)
+        )
+    for user_id in user_ids:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            # The version was evicted; start a fresh one that no old entry can match
+            cache.set(_version_key(user_id), time.time_ns(), timeout=None)
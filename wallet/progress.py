@@ -0,0 +1,116 @@
+import hashlib
+import json
+import time
+from django.conf import settings
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _key(address_id):
+    return f"wallet:progress:{address_id}"
+
+
+def _write(address_id, pipeline_ops):
+    """Run ``pipeline_ops`` against a pipeline and refresh the record's expiry, failing open"""
+    key = _key(address_id)
+    try:
+        pipeline = get_redis().pipeline()
+        pipeline_ops(pipeline, key)
+        pipeline.hset(key, 'updated_at', time.time())
+        pipeline.expire(key, settings.WALLET_PROGRESS_TTL)
+        pipeline.execute()
+    except RedisError as e:
+        print(f"Sync progress unavailable for address {address_id}, not publishing: {str(e)}")
+
+
+def start_progress(address_id, kind, expected=None):
+    """
+    Publish that a sync of ``kind`` (balance, history, incremental or backfill) has started.
+
+    ``expected`` is the number of transactions the sync expects to fetch, when known; it
+    is what the ETA is estimated against. Replaces the record of any earlier sync.
+    """
+    def ops(pipeline, key):
+        pipeline.delete(key)
+        pipeline.hset(key, mapping={
+            'kind': kind, 'state': RUNNING, 'started_at': time.time(),
+            'pages': 0, 'fetched': 0, 'inserted': 0, 'expected': '' if expected is None else expected, 'error': '',
+        })
+    _write(address_id, ops)
+
+
+def expect_progress(address_id, expected):
+    """Publish how many transactions the running sync expects to fetch, once it knows"""
+    _write(address_id, lambda pipeline, key: pipeline.hset(key, 'expected', expected))
+
+
+def record_page(address_id, fetched, inserted):
+    """Count a page of ``fetched`` transactions, ``inserted`` of them new, towards the sync's progress"""
+    def ops(pipeline, key):
+        pipeline.hincrby(key, 'pages', 1)
+        pipeline.hincrby(key, 'fetched', fetched)
+        pipeline.hincrby(key, 'inserted', inserted)
+        pipeline.hset(key, 'error', '')
+    _write(address_id, ops)
+
+
+def record_error(address_id, error):
+    """Publish an error the sync is retrying or working around, without ending it"""
+    _write(address_id, lambda pipeline, key: pipeline.hset(key, 'error', error[:255]))
+
+
+def finish_progress(address_id, error=''):
+    """Publish that the sync has ended, as failed if ``error`` is given"""
+    def ops(pipeline, key):
+        pipeline.hset(key, mapping={'state': FAILED if error else DONE, 'finished_at': time.time()})
+        if error:
+            pipeline.hset(key, 'error', error[:255])
+    _write(address_id, ops)
+
+
+def _decode(raw):
+    # Pages of a chain whose record already expired leave a partial one behind
+    if not raw or b'started_at' not in raw:
+        return None
+    progress = {key.decode(): value.decode() for key, value in raw.items()}
+    started_at = float(progress['started_at'])
+    updated_at = float(progress['updated_at'])
+    fetched = int(progress['fetched'])
+    expected = int(progress['expected']) if progress.get('expected') else None
+    eta = None
+    if progress['state'] == RUNNING and expected and fetched and updated_at > started_at:
+        # Extrapolate from the rate so far; providers pace pages evenly, so it holds up
+        rate = fetched / (updated_at - started_at)
+        eta = max(0, round((expected - fetched) / rate))
+    return {
+        'kind': progress['kind'],
+        'state': progress['state'],
+        'started_at': started_at,
+        'updated_at': updated_at,
+        'pages': int(progress['pages']),
+        'fetched': fetched,
+        'inserted': int(progress['inserted']),
+        'expected': expected,
+        'eta_seconds': eta,
+        'error': progress['error'] or None,
+    }
+
+
+def get_progress(address_id):
+    """The progress of an address's current or last sync as a dict, or None if there is none"""
+    try:
+        raw = get_redis().hgetall(_key(address_id))
+    except RedisError as e:
+        print(f"Sync progress unavailable for address {address_id}: {str(e)}")
+        return None
+    return _decode(raw)
+
+
+def progress_etag(status):
+    """ETag for a sync status payload; any change to the progress, lock or balance it includes changes it"""
+    digest = hashlib.sha256(json.dumps(status, sort_keys=True).encode()).hexdigest()[:32]
+    return f'"{digest}"'
@@ -0,0 +1,79 @@
+from django.conf import settings
+
+INTERACTIVE = 'interactive'
+INCREMENTAL = 'incremental'
+BACKFILL = 'backfill'
+
+# Tasks continuing a page chain or a backfill go ahead of new syncs on the same queue,
+# so work in progress finishes, and releases its address's sync lock, before more starts
+CHAIN_TASKS = {
+    'wallet.tasks.fetch_transaction_page',
+    'wallet.tasks.fetch_backfill_range',
+    'wallet.tasks.finish_backfill',
+}
+# Parallel range backfills always run on the backfill queue
+BACKFILL_TASKS = {
+    'wallet.tasks.backfill_address',
+    'wallet.tasks.fetch_backfill_range',
+    'wallet.tasks.finish_backfill',
+}
+
+
+def queue_for(name, kwargs):
+    """
+    Pick the queue for a task from what it will fetch.
+
+    Balance-only syncs and the chain tip are interactive, syncs of new transactions are
+    incremental, and history walks from a stored page or from the start, including
+    parallel range backfills, are backfill.
+    Returns None for tasks left on the default queue.
+    """
+    kwargs = kwargs or {}
+    if name == 'wallet.tasks.sync_bitcoin_address':
+        if not kwargs.get('fetch_transactions'):
+            return INTERACTIVE
+        return INCREMENTAL if kwargs.get('incremental') else BACKFILL
+    if name in BACKFILL_TASKS:
+        return BACKFILL
+    if name == 'wallet.tasks.fetch_transaction_page':
+        return INCREMENTAL if kwargs.get('incremental') else BACKFILL
+    if name == 'wallet.tasks.sync_address_balances':
+        # A user's "Sync All" waits on this; scheduled and rescheduled chunks do not
+        return INTERACTIVE if kwargs.get('user_id') is not None else INCREMENTAL
+    if name == 'wallet.tasks.refresh_chain_tip':
+        return INTERACTIVE
+    if name in ('wallet.tasks.schedule_syncs', 'wallet.tasks.sync_addresses_concurrently'):
+        return INCREMENTAL
+    return None
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """Celery router (CELERY_TASK_ROUTES) sending wallet tasks to WALLET_TASK_QUEUES"""
+    queue = queue_for(name, kwargs)
+    if queue is None:
+        return None
+    # The Redis transport treats lower numbers as higher priority
+    priority = settings.WALLET_TASK_QUEUES[queue]['priority']
+    if name not in CHAIN_TASKS:
+        priority += 1
+    return {'queue': queue, 'priority': priority}
+
+
+def configure_worker(conf, queues):
+    """
+    Apply a queue's concurrency and time limits to a worker started for only that queue.
+
+    Called from the celeryd_init signal, before the worker reads its configuration, so
+    ``celery worker -Q backfill`` picks up the backfill settings. Workers consuming
+    several queues keep the global CELERY_* defaults. Returns the queue configured.
+    """
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    queues = [queue.strip() for queue in queues or []]
+    if len(queues) != 1 or queues[0] not in settings.WALLET_TASK_QUEUES:
+        return None
+    queue = settings.WALLET_TASK_QUEUES[queues[0]]
+    conf.worker_concurrency = queue['concurrency']
+    conf.task_time_limit = queue['time_limit']
+    conf.task_soft_time_limit = queue['soft_time_limit']
+    return queues[0]
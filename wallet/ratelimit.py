@@ -0,0 +1,89 @@
+import hashlib
+from django.conf import settings
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+# Refill the bucket from the time elapsed since the last call, then either take the
+# requested tokens or report how long the caller has to wait for them. Redis' own clock
+# is used so that every worker in the cluster agrees on "now".
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+# The tokens a bucket holds now, refilled the same way but without taking any
+PEEK_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+return tostring(math.min(capacity, tokens + math.max(0, now - ts) * rate))
+"""
+
+
+class RateLimitExceeded(Exception):
+    """Raised instead of sleeping when a provider's token bucket is empty"""
+
+    def __init__(self, provider, retry_after):
+        super().__init__(f"{provider} rate limit reached, retry in {retry_after:.2f} seconds")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Cluster-wide token bucket shared by all workers through Redis, one per provider and API key"""
+
+    def __init__(self, provider, api_key=''):
+        config = settings.WALLET_RATE_LIMITS[provider]
+        self.provider = provider
+        self.rate = config['rate']
+        self.capacity = config['capacity']
+        # Keep API keys out of Redis key names
+        key_id = hashlib.sha256(api_key.encode()).hexdigest()[:12] if api_key else 'anonymous'
+        self.key = f"wallet:ratelimit:{provider}:{key_id}"
+
+    def acquire(self, tokens=1):
+        """
+        Try to take tokens from the bucket without blocking.
+
+        Returns 0 when the tokens were taken, otherwise the number of seconds to wait
+        before trying again. If Redis is unreachable the limiter fails open.
+        """
+        try:
+            wait = get_redis().eval(TOKEN_BUCKET_SCRIPT, 1, self.key, self.rate, self.capacity, tokens)
+        except RedisError as e:
+            print(f"Rate limiter unavailable for {self.provider}, allowing request: {str(e)}")
+            return 0.0
+        return float(wait)
+
+    def available(self):
+        """Tokens the bucket holds right now, without taking any; full if Redis is unreachable"""
+        try:
+            tokens = get_redis().eval(PEEK_SCRIPT, 1, self.key, self.rate, self.capacity)
+        except RedisError as e:
+            print(f"Rate limiter unavailable for {self.provider}, assuming a full bucket: {str(e)}")
+            return float(self.capacity)
+        return float(tokens)
@@ -0,0 +1,13 @@
+import redis
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """Return a shared Redis client for the configured REDIS_URL"""
+    global _client
+    if _client is None:
+        options = {'ssl_cert_reqs': None} if settings.REDIS_SSL else {}
+        _client = redis.Redis.from_url(settings.REDIS_URL, **options)
+    return _client
@@ -0,0 +1,203 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from .ratelimit import RateLimitExceeded, TokenBucket
+from .services import BlockchainInfoAPI, BlockchairAPI
+
+PROVIDERS = {api.PROVIDER: api for api in (BlockchainInfoAPI, BlockchairAPI)}
+
+# Assumed latency (seconds) for a provider we have not timed yet
+PRIOR_LATENCY = 1.0
+# Weight of the newest sample in the latency moving average
+LATENCY_ALPHA = 0.2
+
+_hedge_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='provider-hedge')
+
+
+def _close_result(future):
+    """Close a losing hedge's streamed response once it arrives, returning its connection to the pool"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), 'close', None)
+    if close:
+        close()
+
+
+class ProviderHealth:
+    """Health and latency score of one provider backend, kept per worker process"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latency = PRIOR_LATENCY
+        self.samples: deque[float] = deque(maxlen=100)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.lock = threading.Lock()
+
+    def record_success(self, elapsed):
+        with self.lock:
+            self.samples.append(elapsed)
+            self.latency = elapsed if len(self.samples) == 1 else (
+                LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * self.latency
+            )
+            self.consecutive_failures = 0
+
+    def record_failure(self, cooldown=0.0):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.cooldown_until
+
+    @property
+    def score(self):
+        """Lower is better: average latency, penalized for every consecutive failure"""
+        return self.latency * (1 + self.consecutive_failures)
+
+    def latency_percentile(self, percentile):
+        """Latency at the given percentile, or None until enough requests have been timed"""
+        with self.lock:
+            if len(self.samples) < settings.WALLET_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, math.ceil(percentile / 100 * len(ordered)) - 1)
+        return ordered[index]
+
+
+class ProviderRouter:
+    """
+    Route provider calls to the healthiest backend and fail over on errors or rate limits.
+
+    Providers are tried in order of their health score; a None result or a rate limit marks
+    the provider as failing and the next one is tried. With WALLET_HEDGE_PERCENTILE set,
+    a request still running after the primary's latency percentile is duplicated to the
+    next provider, if its rate-limit bucket holds WALLET_HEDGE_MIN_TOKENS, and whichever
+    answers first wins; the loser's streamed response is closed. Every provider returns the same
+    normalized dicts, so callers do not care which one answered.
+    """
+
+    def __init__(self, provider_names=None):
+        names = provider_names or settings.WALLET_PROVIDERS
+        self.providers = [PROVIDERS[name] for name in names]
+        self.health = {api.PROVIDER: ProviderHealth(api.PROVIDER) for api in self.providers}
+
+    def ranked(self, method, prefer=None):
+        """
+        Providers supporting ``method``, healthiest first, preference order breaking ties.
+
+        An available ``prefer`` provider is put first regardless of its score, so callers
+        can spread independent requests across providers.
+        """
+        candidates = [api for api in self.providers if hasattr(api, method)]
+        return sorted(
+            candidates,
+            key=lambda api: (
+                not self.health[api.PROVIDER].available,
+                api.PROVIDER != prefer,
+                self.health[api.PROVIDER].score,
+            ),
+        )
+
+    def _timed_call(self, api, method, args, kwargs):
+        health = self.health[api.PROVIDER]
+        started = time.monotonic()
+        try:
+            result = getattr(api, method)(*args, **kwargs)
+        except RateLimitExceeded as e:
+            health.record_failure(cooldown=e.retry_after)
+            raise
+        if result is None:
+            health.record_failure()
+        else:
+            health.record_success(time.monotonic() - started)
+        return result
+
+    def _hedged_call(self, primary, secondary, method, args, kwargs):
+        threshold = self.health[primary.PROVIDER].latency_percentile(settings.WALLET_HEDGE_PERCENTILE)
+        futures = [_hedge_executor.submit(self._timed_call, primary, method, args, kwargs)]
+        done, _ = wait(futures, timeout=threshold)
+        if not done:
+            # A hedge spends a second rate-limit token, so only send one the secondary can spare
+            tokens = TokenBucket(secondary.PROVIDER, secondary.API_KEY).available()
+            if tokens >= settings.WALLET_HEDGE_MIN_TOKENS:
+                print(f"{primary.PROVIDER} slower than {threshold:.2f}s, hedging {method} to {secondary.PROVIDER}")
+                futures.append(_hedge_executor.submit(self._timed_call, secondary, method, args, kwargs))
+            else:
+                print(f"{primary.PROVIDER} slower than {threshold:.2f}s, not hedging: {secondary.PROVIDER} has {tokens:.1f} tokens left")
+        
+        # Take the first usable answer; re-raise a rate limit only if nothing else answered
+        pending = set(futures)
+        rate_limited = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except RateLimitExceeded as e:
+                    rate_limited = e
+                    continue
+                if result is not None:
+                    for other in futures:
+                        if other is not future:
+                            other.add_done_callback(_close_result)
+                    return result
+        if rate_limited:
+            raise rate_limited
+        return None
+
+    def call(self, method, *args, prefer=None, **kwargs):
+        candidates = self.ranked(method, prefer=prefer)
+        rate_limits = []
+        for index, api in enumerate(candidates):
+            hedge_to = candidates[index + 1] if index + 1 < len(candidates) else None
+            try:
+                if hedge_to and settings.WALLET_HEDGE_PERCENTILE and (
+                    self.health[api.PROVIDER].latency_percentile(settings.WALLET_HEDGE_PERCENTILE) is not None
+                ):
+                    result = self._hedged_call(api, hedge_to, method, args, kwargs)
+                else:
+                    result = self._timed_call(api, method, args, kwargs)
+            except RateLimitExceeded as e:
+                print(f"{api.PROVIDER} rate limited, failing over: {str(e)}")
+                rate_limits.append(e)
+                continue
+            if result is not None:
+                return result
+            print(f"{api.PROVIDER} failed for {method}, failing over")
+        
+        if rate_limits and len(rate_limits) == len(candidates):
+            # Every backend is rate limited: let the caller reschedule for the soonest refill
+            raise min(rate_limits, key=lambda e: e.retry_after)
+        return None
+
+    def record_failure(self, provider):
+        """Count a failure the router could not see, such as a streamed page breaking off"""
+        self.health[provider].record_failure()
+
+    def get_address_info(self, address):
+        return self.call('get_address_info', address)
+
+    def get_transactions(self, address, limit=50, offset=0):
+        return self.call('get_transactions', address, limit=limit, offset=offset)
+
+    def iter_transactions(self, address, limit=50, offset=0, prefer=None):
+        return self.call('iter_transactions', address, limit=limit, offset=offset, prefer=prefer)
+
+    def get_chain_tip(self):
+        return self.call('get_chain_tip')
+
+
+_router = None
+
+
+def get_provider_router():
+    """Return the process-wide provider router"""
+    global _router
+    if _router is None:
+        _router = ProviderRouter()
+    return _router
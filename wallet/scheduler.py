@@ -0,0 +1,108 @@
+import math
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import BitcoinAddress
+from .services import BlockchainInfoAPI
+
+LAST_RUN_CACHE_KEY = 'wallet:scheduler:last_run'
+# Decisions kept for inspection per run, most urgent first
+LAST_RUN_DECISIONS = 100
+
+
+def next_interval(interval, changed):
+    """The sync interval after a sync that did or did not find new activity"""
+    if changed:
+        return settings.WALLET_SYNC_INTERVAL_MIN
+    backed_off = int(interval * settings.WALLET_SYNC_BACKOFF)
+    return min(max(backed_off, settings.WALLET_SYNC_INTERVAL_MIN), settings.WALLET_SYNC_INTERVAL_MAX)
+
+
+def reschedule(address, changed, now=None):
+    """
+    Adapt an address's sync interval to what its sync found and set when it is next due.
+
+    Returns the changed field names, for save(update_fields=...) or bulk_update().
+    """
+    now = now or timezone.now()
+    address.sync_interval = next_interval(address.sync_interval, changed)
+    address.next_sync_at = now + timedelta(seconds=address.sync_interval)
+    return ['sync_interval', 'next_sync_at']
+
+
+def sync_priority(age, interval, recent_legs, watchers):
+    """
+    Score how urgently an address needs syncing; higher is synced first.
+
+    The base is how many of its own intervals the address has gone unsynced (``age`` is
+    seconds since the last sync, None if never). Recent activity and watcher count raise
+    it on a log scale, so neither outweighs staleness on its own.
+    """
+    if age is None:
+        # Never synced counts as stale as the longest interval allows
+        overdue = settings.WALLET_SYNC_INTERVAL_MAX / interval
+    else:
+        overdue = age / interval
+    return overdue * (1 + math.log1p(recent_legs)) * (1 + math.log2(max(watchers, 1)))
+
+
+def sync_budget(period=None):
+    """How many address syncs one scheduler run may enqueue within the provider rate limit"""
+    period = period or settings.WALLET_SYNC_SCHEDULE_SECONDS
+    rate = settings.WALLET_RATE_LIMITS[BlockchainInfoAPI.PROVIDER]['rate']
+    return max(1, int(rate * period * settings.WALLET_SYNC_BUDGET_SHARE))
+
+
+def plan_syncs(now=None, budget=None):
+    """
+    Score every watched address that is due and pick the ``budget`` most urgent.
+
+    Returns one decision dict per due address, highest score first, with the inputs its
+    score was built from and whether it was selected. Nothing is enqueued or saved.
+    """
+    now = now or timezone.now()
+    budget = sync_budget() if budget is None else budget
+    since = now - timedelta(days=settings.WALLET_SYNC_ACTIVITY_DAYS)
+    due = (
+        BitcoinAddress.objects.filter(Q(next_sync_at__isnull=True) | Q(next_sync_at__lte=now))
+        .annotate(
+            watcher_count=Count('watchers', distinct=True),
+            recent_legs=Count('legs', filter=Q(legs__timestamp__gte=since), distinct=True),
+        )
+        .filter(watcher_count__gt=0)
+    )
+
+    decisions = []
+    for address in due:
+        age = (now - address.last_synced).total_seconds() if address.last_synced else None
+        decisions.append({
+            'address_id': address.id,
+            'address': address.address,
+            'score': sync_priority(age, address.sync_interval, address.recent_legs, address.watcher_count),
+            'age_seconds': age,
+            'sync_interval': address.sync_interval,
+            'recent_legs': address.recent_legs,
+            'watchers': address.watcher_count,
+        })
+    decisions.sort(key=lambda decision: decision['score'], reverse=True)
+    for rank, decision in enumerate(decisions):
+        decision['selected'] = rank < budget
+    return decisions
+
+
+def record_run(decisions, budget, now=None):
+    """Keep a scheduler run's decisions in the cache for get_last_run()"""
+    cache.set(LAST_RUN_CACHE_KEY, {
+        'ran_at': now or timezone.now(),
+        'budget': budget,
+        'due': len(decisions),
+        'selected': sum(decision['selected'] for decision in decisions),
+        'decisions': decisions[:LAST_RUN_DECISIONS],
+    }, timeout=None)
+
+
+def get_last_run():
+    """The most recent scheduler run's summary and decisions, or None if it has not run"""
+    return cache.get(LAST_RUN_CACHE_KEY)
@@ -1,31 +1,159 @@
+import os
+import threading
+import ijson
 import requests
-import time
-from decimal import Decimal
+import urllib3
 from datetime import datetime
 from django.conf import settings
 from django.utils import timezone
-from .models import BitcoinAddress, Transaction
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .ratelimit import RateLimitExceeded, TokenBucket
+
+# Pooled keep-alive sessions, one per provider and worker process
+_sessions: dict[str, requests.Session] = {}
+_sessions_pid = None
+_sessions_lock = threading.Lock()
+
+
+def _build_session():
+    retry = Retry(
+        total=settings.WALLET_HTTP_MAX_RETRIES,
+        backoff_factor=settings.WALLET_HTTP_BACKOFF_FACTOR,
+        # 429s are left to the caller so rate limits are not hammered by the transport
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings.WALLET_HTTP_POOL_CONNECTIONS,
+        pool_maxsize=settings.WALLET_HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(provider):
+    """Return the pooled HTTP session for a provider, creating it on first use in this process"""
+    global _sessions_pid
+    with _sessions_lock:
+        # Sessions must not be shared with a forked parent (e.g. Celery prefork workers)
+        if _sessions_pid != os.getpid():
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        session = _sessions.get(provider)
+        if session is None:
+            session = _sessions[provider] = _build_session()
+        return session
+
+
+def respect_rate_limit(provider, api_key=''):
+    """Raise RateLimitExceeded rather than sleeping when the provider's shared bucket is empty"""
+    wait = TokenBucket(provider, api_key).acquire()
+    if wait > 0:
+        raise RateLimitExceeded(provider, wait)
+
+
+def retry_after(response, provider):
+    """Seconds to back off after a 429, from Retry-After or the provider's refill rate"""
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return 1 / settings.WALLET_RATE_LIMITS[provider]['rate']
+
+
+def http_get(provider, url, params=None, stream=False):
+    """GET through the provider's pooled session with the configured timeouts"""
+    timeout = (settings.WALLET_HTTP_CONNECT_TIMEOUT, settings.WALLET_HTTP_READ_TIMEOUT)
+    return get_session(provider).get(url, params=params, timeout=timeout, stream=stream)
+
+
+class ProviderStreamError(Exception):
+    """Raised when a provider's streamed response breaks off, stops parsing or holds an unexpected item partway through"""
+
+    def __init__(self, provider, error):
+        super().__init__(f"{provider} stream failed: {str(error)}")
+        self.provider = provider
+
+
+class JsonItemStream:
+    """
+    Iterator over the objects under ``prefix`` of a streamed JSON response, one at a time.
+
+    The body is parsed incrementally, so only the object being yielded is held in memory
+    rather than the whole response tree; each is passed through ``normalize`` if given.
+    A body that breaks off or is malformed, or an item ``normalize`` cannot make sense
+    of, raises ProviderStreamError. The connection is
+    released once the stream is exhausted or fails, or when it is closed, even if it was
+    never started.
+    """
+
+    def __init__(self, provider, response, prefix, normalize=None):
+        self.provider = provider
+        self.response = response
+        # Let urllib3 undo any gzip/deflate content encoding while we read
+        response.raw.decode_content = True
+        self.items = ijson.items(response.raw, prefix)
+        self.normalize = normalize
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            item = next(self.items)
+        except (ijson.JSONError, requests.RequestException, urllib3.exceptions.HTTPError) as e:
+            self.close()
+            raise ProviderStreamError(self.provider, e) from e
+        except BaseException:
+            self.close()
+            raise
+        if not self.normalize:
+            return item
+        try:
+            return self.normalize(item)
+        except (KeyError, TypeError, ValueError) as e:
+            # A payload the parser does not expect counts against the provider like a broken one
+            self.close()
+            raise ProviderStreamError(self.provider, f"unexpected item: {e!r}") from e
+
+    def close(self):
+        self.response.close()
+
+
+def build_legs(spent, received):
+    """
+    Per-address amounts of one transaction from the satoshis each address spent and received.
+
+    Each leg is the address's net change (received minus spent, so change outputs are
+    netted out) and an address that funds any input is sending. Legs are built for every
+    address the transaction touches, so it can be credited to all tracked addresses from a
+    single fetch, and summing an address's legs gives its balance.
+    """
+    legs = {}
+    for addr in spent.keys() | received.keys():
+        legs[addr] = {
+            'amount_sats': received.get(addr, 0) - spent.get(addr, 0),
+            'is_sending': addr in spent
+        }
+    return legs
+
 
 class BlockchairAPI:
     """API for Bitcoin address information and transactions (requires API key for high usage)"""
+    PROVIDER = 'blockchair'
     BASE_URL = "https://api.blockchair.com/bitcoin"
     API_KEY = getattr(settings, 'BLOCKCHAIR_API_KEY', '')
-    RATE_LIMIT_DELAY = 60  # seconds between requests to respect the 1 request/minute average limit
-    last_request_time = 0
+    # Status codes Blockchair uses for rate limiting or API key problems
+    RATE_LIMIT_STATUS_CODES = [402, 429, 430, 434, 435, 503]
     
     @classmethod
     def _respect_rate_limit(cls):
-        """Add delay between requests to respect rate limit of 1440 requests per day (1 per minute avg)"""
-        current_time = time.time()
-        time_since_last_request = current_time - cls.last_request_time
-        
-        if cls.last_request_time > 0 and time_since_last_request < cls.RATE_LIMIT_DELAY:
-            # Wait to respect rate limit
-            sleep_time = cls.RATE_LIMIT_DELAY - time_since_last_request
-            print(f"Rate limiting: Waiting {sleep_time:.2f} seconds before next Blockchair API request")
-            time.sleep(sleep_time)
-        
-        cls.last_request_time = time.time()
+        """Take a token from the shared Blockchair bucket (1440 requests per day, 1 per minute avg)"""
+        respect_rate_limit(cls.PROVIDER, cls.API_KEY)
     
     @classmethod
     def is_available(cls):
@@ -42,186 +170,304 @@ class BlockchairAPI:
         
         try:
             print(f"Fetching address info from Blockchair: {address}")
-            response = requests.get(url, params=params)
+            response = http_get(cls.PROVIDER, url, params=params)
             
             if response.status_code == 200:
-                data = response.json()['data'][address]
                 print(f"Successfully fetched info from Blockchair for address: {address}")
-                # Convert satoshis to BTC
-                balance_btc = Decimal(str(data['address']['balance'] / 100000000))
-                return {
-                    'balance': balance_btc,
-                    'tx_count': data['address']['transaction_count']
-                }
-            elif response.status_code in [402, 429, 430, 434, 435, 503]:
+                return cls.parse_address_info(response.json(), address)
+            elif response.status_code == 429:
+                raise RateLimitExceeded(cls.PROVIDER, retry_after(response, cls.PROVIDER))
+            elif response.status_code in cls.RATE_LIMIT_STATUS_CODES:
                 # These are rate limiting or API key related errors
                 print(f"Blockchair API rate limit or key error: {response.status_code} - {response.text}")
                 return None
             else:
                 print(f"Blockchair API Error: {response.status_code} - {response.text}")
                 return None
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error fetching address info from Blockchair: {str(e)}")
             return None
         
     @classmethod
-    def get_transactions(cls, address):
+    def get_transactions(cls, address, limit=50, offset=0):
+        transactions = cls.iter_transactions(address, limit=limit, offset=offset)
+        if transactions is None:
+            return None
+        try:
+            transactions = list(transactions)
+        except Exception as e:
+            print(f"Error reading transactions from Blockchair: {str(e)}")
+            return None
+        print(f"Successfully fetched {len(transactions)} transactions from Blockchair for address: {address}")
+        return transactions
+    
+    @classmethod
+    def iter_transactions(cls, address, limit=50, offset=0):
+        """
+        Request a page of transactions and return a generator of normalized dicts.
+
+        The request and status check happen immediately so errors and rate limits surface
+        here; the body is then parsed lazily as the generator is consumed.
+        """
         cls._respect_rate_limit()
         url = f"{cls.BASE_URL}/dashboards/address/{address}"
         
+        # Blockchair takes "<transactions>,<utxos>" pairs for limit and offset
+        params = {'limit': f"{limit},0", 'offset': f"{offset},0"}
         # Only add API key if it's configured
-        params = {'key': cls.API_KEY} if cls.API_KEY else {}
+        if cls.API_KEY:
+            params['key'] = cls.API_KEY
         
         try:
-            print(f"Fetching transactions from Blockchair for address: {address}")
-            response = requests.get(url, params=params)
+            print(f"Fetching transactions from Blockchair for address: {address} (limit={limit}, offset={offset})")
+            response = http_get(cls.PROVIDER, url, params=params, stream=True)
             
             if response.status_code == 200:
-                data = response.json()['data'][address]
-                transactions_data = data.get('transactions', [])
-                print(f"Successfully fetched {len(transactions_data)} transactions from Blockchair for address: {address}")
-                transactions = []
-                
-                for tx in transactions_data:
-                    # Determine if this is a sending or receiving transaction
-                    is_sending = False
-                    amount = Decimal('0')
-                    
-                    # Process inputs (sending)
-                    for input_tx in tx['inputs']:
-                        if input_tx['recipient'] == address:
-                            is_sending = True
-                            amount -= Decimal(str(input_tx['value'] / 100000000))  # Convert satoshis to BTC
-                    
-                    # Process outputs (receiving)
-                    for output_tx in tx['outputs']:
-                        if output_tx['recipient'] == address:
-                            if not is_sending:  # Pure receiving transaction
-                                amount += Decimal(str(output_tx['value'] / 100000000))  # Convert satoshis to BTC
-                    
-                    # Create transaction object with timezone-aware datetime
-                    naive_timestamp = datetime.fromisoformat(tx['time'])
-                    aware_timestamp = timezone.make_aware(naive_timestamp)
-                    
-                    # Create transaction object
-                    transactions.append({
-                        'hash': tx['hash'],
-                        'amount': amount,
-                        'timestamp': aware_timestamp,
-                        'confirmations': tx['confirmation_count'],
-                        'is_sending': is_sending
-                    })
-                    
-                return transactions
-            elif response.status_code in [402, 429, 430, 434, 435, 503]:
+                return cls.stream_transactions(response, address)
+            elif response.status_code == 429:
+                raise RateLimitExceeded(cls.PROVIDER, retry_after(response, cls.PROVIDER))
+            elif response.status_code in cls.RATE_LIMIT_STATUS_CODES:
                 # These are rate limiting or API key related errors
                 print(f"Blockchair API rate limit or key error: {response.status_code} - {response.text}")
                 return None
             else:
                 print(f"Blockchair API Error: {response.status_code} - {response.text}")
                 return None
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error fetching transactions from Blockchair: {str(e)}")
             return None
+    
+    @classmethod
+    def get_chain_tip(cls):
+        """Height of the newest block, from the /stats endpoint"""
+        cls._respect_rate_limit()
+        params = {'key': cls.API_KEY} if cls.API_KEY else {}
+        try:
+            response = http_get(cls.PROVIDER, f"{cls.BASE_URL}/stats", params=params)
+            if response.status_code == 200:
+                return response.json()['data']['best_block_height']
+            elif response.status_code == 429:
+                raise RateLimitExceeded(cls.PROVIDER, retry_after(response, cls.PROVIDER))
+            else:
+                print(f"Blockchair API Error: {response.status_code} - {response.text}")
+                return None
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error fetching chain tip from Blockchair: {str(e)}")
+            return None
+    
+    @classmethod
+    def parse_address_info(cls, payload, address):
+        """Normalize a /dashboards/address response into the balance/tx_count dict"""
+        data = payload['data'][address]
+        # Amounts stay in integer satoshis; they are only converted to BTC for display
+        return {
+            'balance_sats': data['address']['balance'],
+            'tx_count': data['address']['transaction_count']
+        }
+    
+    @classmethod
+    def parse_transactions(cls, payload, address):
+        """Normalize the transactions of a /dashboards/address response"""
+        data = payload['data'][address]
+        return [cls.normalize_transaction(tx, address) for tx in data.get('transactions', [])]
+    
+    @classmethod
+    def stream_transactions(cls, response, address):
+        """Normalize the transactions of a streamed /dashboards/address response one at a time"""
+        return JsonItemStream(
+            cls.PROVIDER, response, f'data.{address}.transactions.item', lambda tx: cls.normalize_transaction(tx, address)
+        )
+    
+    @classmethod
+    def normalize_transaction(cls, tx, address):
+        """Normalize one Blockchair transaction, amounts from the point of view of ``address`` plus legs for every address"""
+        spent: dict[str, int] = {}
+        received: dict[str, int] = {}
+        
+        # Process inputs (sending)
+        for input_tx in tx['inputs']:
+            if input_tx.get('recipient'):
+                spent[input_tx['recipient']] = spent.get(input_tx['recipient'], 0) + input_tx['value']
+        
+        # Process outputs (receiving)
+        for output_tx in tx['outputs']:
+            if output_tx.get('recipient'):
+                received[output_tx['recipient']] = received.get(output_tx['recipient'], 0) + output_tx['value']
+        
+        legs = build_legs(spent, received)
+        leg = legs.get(address, {'amount_sats': 0, 'is_sending': False})
+        
+        # Create transaction object with timezone-aware datetime
+        naive_timestamp = datetime.fromisoformat(tx['time'])
+        aware_timestamp = timezone.make_aware(naive_timestamp)
+        
+        return {
+            'hash': tx['hash'],
+            'amount_sats': leg['amount_sats'],
+            'timestamp': aware_timestamp,
+            # Mempool transactions are reported with block_id -1
+            'block_height': tx['block_id'] if tx.get('block_id', -1) >= 0 else None,
+            'is_sending': leg['is_sending'],
+            'legs': legs
+        }
 
 
 class BlockchainInfoAPI:
     """API for Bitcoin address information and transactions (no API key required)"""
+    PROVIDER = 'blockchain_info'
+    API_KEY = ''
+    BASE_URL = "https://blockchain.info"
+    # Number of addresses sent in a single /balance?active= request
+    BALANCE_BATCH_SIZE = 100
     
     @classmethod
     def get_address_info(cls, address):
+        print(f"Using Blockchain.info API for address info: {address}")
+        balances = cls.get_balances([address])
+        if balances is None:
+            return None
+        return balances.get(address, {'balance_sats': 0, 'tx_count': 0})
+    
+    @classmethod
+    def get_balances(cls, addresses):
+        """Fetch balances for several addresses with one request to the /balance endpoint"""
+        respect_rate_limit(cls.PROVIDER, cls.API_KEY)
         try:
-            print(f"Using Blockchain.info API for address info: {address}")
-            # Use the simpler /balance endpoint instead of /address
-            url = f"https://blockchain.info/balance?active={address}"
-            response = requests.get(url)
+            # The /balance endpoint accepts many |-separated addresses
+            url = f"{cls.BASE_URL}/balance"
+            response = http_get(cls.PROVIDER, url, params={'active': '|'.join(addresses)})
             if response.status_code == 200:
-                data = response.json()
-                print(f"Successfully fetched info from Blockchain.info API for address: {address}")
-                
-                # The response format is different for this endpoint
-                address_data = data.get(address, {})
-                
-                # Convert satoshis to BTC
-                balance_btc = Decimal(str(address_data.get('final_balance', 0) / 100000000))
-                
-                return {
-                    'balance': balance_btc,
-                    'tx_count': address_data.get('n_tx', 0)
-                }
+                print(f"Successfully fetched balances from Blockchain.info API for {len(addresses)} addresses")
+                return cls.parse_balances(response.json(), addresses)
+            elif response.status_code == 429:
+                raise RateLimitExceeded(cls.PROVIDER, retry_after(response, cls.PROVIDER))
             else:
                 print(f"Blockchain.info API Error: {response.status_code} - {response.text}")
                 return None
+        except RateLimitExceeded:
+            raise
         except Exception as e:
-            print(f"Error fetching address info from Blockchain.info API: {str(e)}")
+            print(f"Error fetching balances from Blockchain.info API: {str(e)}")
             return None
     
     @classmethod
     def get_transactions(cls, address, limit=50, offset=0):
+        transactions = cls.iter_transactions(address, limit=limit, offset=offset)
+        if transactions is None:
+            return None
+        try:
+            transactions = list(transactions)
+        except Exception as e:
+            print(f"Error reading transactions from API: {str(e)}")
+            return None
+        print(f"Successfully fetched {len(transactions)} transactions from Blockchain.info API")
+        return transactions
+    
+    @classmethod
+    def iter_transactions(cls, address, limit=50, offset=0):
+        """
+        Request a page of transactions and return a generator of normalized dicts.
+
+        The request and status check happen immediately so errors and rate limits surface
+        here; the body is then parsed lazily as the generator is consumed.
+        """
+        respect_rate_limit(cls.PROVIDER, cls.API_KEY)
         try:
             print(f"Using Blockchain.info API for transactions: {address} (limit={limit}, offset={offset})")
-            transactions = []
-            
-            max_retries = 3            
-            for _ in range(max_retries):
-                url = f"https://blockchain.info/rawaddr/{address}?format=json&limit={limit}&offset={offset}"
-                print(f"Making API request with limit={limit}, offset={offset}")
-                
-                response = requests.get(url)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    txs = data.get('txs', [])
-                    
-                    print(f"Successfully fetched {len(txs)} transactions from Blockchain.info API")
-                    
-                    if not txs:
-                        return []
-                    
-                    for tx in txs:
-                        # Determine if this is a sending or receiving transaction
-                        is_sending = False
-                        amount = Decimal('0')
-                        
-                        # Process inputs
-                        for input_tx in tx['inputs']:
-                            prev_out = input_tx.get('prev_out', {})
-                            if prev_out.get('addr') == address:
-                                is_sending = True
-                                amount -= Decimal(str(prev_out.get('value', 0) / 100000000))  # Convert satoshis to BTC
-                        
-                        # Process outputs
-                        for output in tx['out']:
-                            if output.get('addr') == address:
-                                if not is_sending:  # Pure receiving transaction
-                                    amount += Decimal(str(output.get('value', 0) / 100000000))  # Convert satoshis to BTC
-                        
-                        # Create transaction object with timezone-aware datetime
-                        timestamp = datetime.fromtimestamp(tx['time'])
-                        aware_timestamp = timezone.make_aware(timestamp)
-                        
-                        transactions.append({
-                            'hash': tx['hash'],
-                            'amount': amount,
-                            'timestamp': aware_timestamp,
-                            'confirmations': data.get('confirmations', 0),
-                            'is_sending': is_sending
-                        })
-                    
-                    return transactions
-                elif response.status_code == 429:
-                    print(f"Rate limited (429). Will retry.")
-                    # Continue to next retry iteration
-                else:
-                    print(f"API Error: {response.status_code} - {response.text}")
-                    # For non-rate-limit errors, don't retry
-                    return []
+            url = f"{cls.BASE_URL}/rawaddr/{address}?format=json&limit={limit}&offset={offset}"
+            response = http_get(cls.PROVIDER, url, stream=True)
             
-            # If we've exhausted all retries
-            print("Exhausted all retry attempts. Could not fetch transactions.")
-            return []
+            if response.status_code == 200:
+                return cls.stream_transactions(response, address)
+            elif response.status_code == 429:
+                # Hand the back-off to the caller instead of retrying straight into the limit
+                raise RateLimitExceeded(cls.PROVIDER, retry_after(response, cls.PROVIDER))
+            else:
+                print(f"API Error: {response.status_code} - {response.text}")
+                return None
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             print(f"Error fetching transactions from API: {str(e)}")
-            return []
-
-
+            return None
+    
+    @classmethod
+    def get_chain_tip(cls):
+        """Height of the newest block, from the /latestblock endpoint"""
+        respect_rate_limit(cls.PROVIDER, cls.API_KEY)
+        try:
+            response = http_get(cls.PROVIDER, f"{cls.BASE_URL}/latestblock")
+            if response.status_code == 200:
+                return response.json()['height']
+            elif response.status_code == 429:
+                raise RateLimitExceeded(cls.PROVIDER, retry_after(response, cls.PROVIDER))
+            else:
+                print(f"Blockchain.info API Error: {response.status_code} - {response.text}")
+                return None
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            print(f"Error fetching chain tip from Blockchain.info API: {str(e)}")
+            return None
+    
+    @classmethod
+    def parse_balances(cls, data, addresses):
+        """Normalize a /balance response into a balance/tx_count dict per address"""
+        balances = {}
+        for address in addresses:
+            address_data = data.get(address, {})
+            balances[address] = {
+                'balance_sats': address_data.get('final_balance', 0),
+                'tx_count': address_data.get('n_tx', 0)
+            }
+        return balances
+    
+    @classmethod
+    def parse_transactions(cls, data, address):
+        """Normalize the transactions of a /rawaddr response"""
+        return [cls.normalize_transaction(tx, address) for tx in data.get('txs', [])]
+    
+    @classmethod
+    def stream_transactions(cls, response, address):
+        """Normalize the transactions of a streamed /rawaddr response one at a time"""
+        return JsonItemStream(cls.PROVIDER, response, 'txs.item', lambda tx: cls.normalize_transaction(tx, address))
+    
+    @classmethod
+    def normalize_transaction(cls, tx, address):
+        """Normalize one /rawaddr transaction, amounts from the point of view of ``address`` plus legs for every address"""
+        spent: dict[str, int] = {}
+        received: dict[str, int] = {}
+        
+        # Process inputs
+        for input_tx in tx['inputs']:
+            prev_out = input_tx.get('prev_out', {})
+            if prev_out.get('addr'):
+                spent[prev_out['addr']] = spent.get(prev_out['addr'], 0) + prev_out.get('value', 0)
+        
+        # Process outputs
+        for output in tx['out']:
+            if output.get('addr'):
+                received[output['addr']] = received.get(output['addr'], 0) + output.get('value', 0)
+        
+        legs = build_legs(spent, received)
+        leg = legs.get(address, {'amount_sats': 0, 'is_sending': False})
+        
+        # Create transaction object with timezone-aware datetime
+        timestamp = datetime.fromtimestamp(tx['time'])
+        aware_timestamp = timezone.make_aware(timestamp)
+        
+        return {
+            'hash': tx['hash'],
+            'amount_sats': leg['amount_sats'],
+            'timestamp': aware_timestamp,
+            # Unconfirmed transactions have no block_height yet
+            'block_height': tx.get('block_height'),
+            'is_sending': leg['is_sending'],
+            'legs': legs
+        }
@@ -0,0 +1,185 @@
+import time
+import uuid
+from django.conf import settings
+from redis.exceptions import RedisError
+from .redis_client import get_redis
+
+# Take the lock if it is free. Otherwise the request either is already covered by the
+# sync holding it, or is folded into a single follow-up sync that runs once the current
+# one finishes, with later requests merged into that same follow-up.
+REQUEST_SCRIPT = """
+local token, fetch, reset, incremental, ttl, now = ARGV[1], ARGV[2], ARGV[3], ARGV[4], ARGV[5], ARGV[6]
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], 'token', token, 'state', 'queued', 'since', now,
+        'fetch_transactions', fetch, 'reset_page', reset, 'incremental', incremental)
+    redis.call('EXPIRE', KEYS[1], ttl)
+    return 'acquired'
+end
+
+local current = redis.call('HMGET', KEYS[1], 'fetch_transactions', 'reset_page', 'incremental')
+local covered
+if reset == '1' then
+    covered = current[2] == '1'
+elseif fetch == '1' then
+    covered = current[1] == '1' and (incremental == '1' or current[3] ~= '1')
+else
+    covered = true
+end
+if covered then
+    return 'coalesced'
+end
+
+local pending = redis.call('HMGET', KEYS[1], 'pending', 'pending_fetch', 'pending_reset', 'pending_incremental')
+if pending[1] == '1' then
+    fetch = (fetch == '1' or pending[2] == '1') and '1' or '0'
+    reset = (reset == '1' or pending[3] == '1') and '1' or '0'
+    incremental = (incremental == '1' and pending[4] == '1') and '1' or '0'
+end
+redis.call('HSET', KEYS[1], 'pending', '1',
+    'pending_fetch', fetch, 'pending_reset', reset, 'pending_incremental', incremental)
+return 'pending'
+"""
+
+# Release the lock if the caller still holds it. A folded follow-up takes the lock over
+# under a new token and its options are returned so the caller can enqueue it.
+FINISH_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'token') ~= ARGV[1] then
+    return false
+end
+local pending = redis.call('HMGET', KEYS[1], 'pending', 'pending_fetch', 'pending_reset', 'pending_incremental')
+redis.call('DEL', KEYS[1])
+if pending[1] ~= '1' then
+    return false
+end
+redis.call('HSET', KEYS[1], 'token', ARGV[2], 'state', 'queued', 'since', ARGV[4],
+    'fetch_transactions', pending[2], 'reset_page', pending[3], 'incremental', pending[4])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {pending[2], pending[3], pending[4]}
+"""
+
+# Mark the sync as running and extend the lock, if the caller still holds it
+TOUCH_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'token') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'state', 'running')
+if ARGV[2] ~= '' then
+    redis.call('HSET', KEYS[1], 'page', ARGV[2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+ACQUIRED = 'acquired'
+COALESCED = 'coalesced'
+PENDING = 'pending'
+
+
+def _key(address_id):
+    return f"wallet:sync:{address_id}"
+
+
+def _flag(value):
+    return '1' if value else '0'
+
+
+def request_sync(address_id, fetch_transactions=False, reset_page=False, incremental=False):
+    """
+    Ask for a sync of an address, single-flight across every worker and web process.
+
+    Returns ``(status, token)``. ACQUIRED means the caller holds the lock and must enqueue
+    the sync with ``token``. COALESCED means an in-flight or queued sync already covers the
+    request, and PENDING that it was merged into one follow-up sync which starts when the
+    current one finishes; neither needs a new task. If Redis is unreachable the lock fails
+    open and every request is ACQUIRED with a None token.
+    """
+    token = uuid.uuid4().hex
+    try:
+        status = get_redis().eval(
+            REQUEST_SCRIPT, 1, _key(address_id), token, _flag(fetch_transactions), _flag(reset_page),
+            _flag(incremental), settings.WALLET_SYNC_LOCK_TIMEOUT, int(time.time()),
+        )
+    except RedisError as e:
+        print(f"Sync lock unavailable for address {address_id}, not coalescing: {str(e)}")
+        return ACQUIRED, None
+    status = status.decode() if isinstance(status, bytes) else status
+    return status, token if status == ACQUIRED else None
+
+
+def touch_sync(address_id, token, page=None):
+    """
+    Record that the sync holding ``token`` is running, at ``page`` if given, and extend its lock.
+
+    Returns False if the lock has since expired and been taken by another sync, in which
+    case the caller should stop rather than duplicate its work.
+    """
+    if token is None:
+        return True
+    try:
+        held = get_redis().eval(
+            TOUCH_SCRIPT, 1, _key(address_id), token, '' if page is None else page, settings.WALLET_SYNC_LOCK_TIMEOUT
+        )
+    except RedisError as e:
+        print(f"Sync lock unavailable for address {address_id}, continuing: {str(e)}")
+        return True
+    return bool(held)
+
+
+def finish_sync(address_id, token):
+    """
+    Release the lock held by ``token``.
+
+    Returns None, or ``(token, options)`` for a follow-up sync that requests merged while
+    this one ran; the follow-up already holds the lock and must be enqueued with them.
+    """
+    if token is None:
+        return None
+    next_token = uuid.uuid4().hex
+    try:
+        pending = get_redis().eval(
+            FINISH_SCRIPT, 1, _key(address_id), token, next_token, settings.WALLET_SYNC_LOCK_TIMEOUT, int(time.time())
+        )
+    except RedisError as e:
+        print(f"Sync lock unavailable for address {address_id}, letting it expire: {str(e)}")
+        return None
+    if not pending:
+        return None
+    fetch, reset, incremental = (flag in (b'1', '1') for flag in pending)
+    return next_token, {'fetch_transactions': fetch, 'reset_page': reset, 'incremental': incremental}
+
+
+def _decode_state(raw):
+    if not raw:
+        return None
+    state = {key.decode(): value.decode() for key, value in raw.items()}
+    return {
+        'state': state['state'],
+        'since': int(state['since']),
+        'page': int(state['page']) if 'page' in state else None,
+        'fetch_transactions': state['fetch_transactions'] == '1',
+        'reset_page': state['reset_page'] == '1',
+        'incremental': state['incremental'] == '1',
+        'pending': state.get('pending') == '1',
+    }
+
+
+def get_sync_state(address_id):
+    """The in-flight sync of an address as a dict, or None if it is idle"""
+    return get_sync_states([address_id]).get(address_id)
+
+
+def get_sync_states(address_ids):
+    """In-flight syncs for many addresses, by address id, read in one round trip"""
+    address_ids = list(address_ids)
+    if not address_ids:
+        return {}
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        for address_id in address_ids:
+            pipeline.hgetall(_key(address_id))
+        results = pipeline.execute()
+    except RedisError as e:
+        print(f"Sync lock unavailable, not reporting sync state: {str(e)}")
+        return {}
+    states = {address_id: _decode_state(raw) for address_id, raw in zip(address_ids, results)}
+    return {address_id: state for address_id, state in states.items() if state}
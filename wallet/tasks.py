@@ -1,103 +1,597 @@
-from celery import shared_task
-from .models import BitcoinAddress, Transaction
-from .services import BlockchainInfoAPI
+from celery import Task, chord, group, shared_task
+from celery.exceptions import Ignore, Retry
+from .async_services import sync_addresses
+from .backfill import merge_results, plan_backfill
+from .balances import rebuild_daily_balances
+from .chain import set_chain_tip
+from .checkpoints import CURSOR_MARGIN, CursorScan, advance_history_cursor, clear_history_cursor, resume_offset
+from .ingest import advance_high_water_mark, high_water_mark, ingest_transaction_stream
+from .models import BackfillRange, BitcoinAddress, sats_to_btc
+from .portfolio import invalidate_portfolios
+from .progress import expect_progress, finish_progress, record_error, record_page, start_progress
+from .ratelimit import RateLimitExceeded
+from .routing import get_provider_router
+from .scheduler import plan_syncs, record_run, reschedule, sync_budget
+from .sync_lock import ACQUIRED, finish_sync, request_sync, touch_sync
+from .services import BlockchainInfoAPI, ProviderStreamError
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
-from decimal import Decimal
-import time
+from datetime import timedelta
+import asyncio
+import math
 
-@shared_task
-def sync_bitcoin_address(address_id, fetch_transactions=False, page_size=20, max_pages=5, reset_page=False):
+class SyncLockTask(Task):
+    """
+    Base for tasks that hold an address's sync lock, taking ``address_id`` first.
+
+    A task that fails for good, with an unhandled error or after running out of retries,
+    releases the lock it was given and marks the sync failed, so requests coalesced into
+    it are not left waiting for the lock to expire.
+    """
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        address_id = args[0] if args else kwargs.get('address_id')
+        print(f"{self.name} failed for address {address_id}, releasing its sync: {exc!r}")
+        _release_sync(address_id, kwargs.get('lock_token'), f"Sync failed: {str(exc) or type(exc).__name__}")
+
+
+@shared_task(bind=True, base=SyncLockTask, max_retries=20)
+def sync_bitcoin_address(self, address_id, fetch_transactions=False, page_size=20, max_pages=5, reset_page=False, incremental=False, lock_token=None):
     address = BitcoinAddress.objects.get(id=address_id)
+    previous_tx_count = address.transaction_count
+    
+    # Syncs enqueued through enqueue_sync() hold the address's single-flight lock
+    if not touch_sync(address_id, lock_token):
+        print(f"Sync lock for {address.address} was taken over by another sync, stopping")
+        return f"Skipped {address.address}"
     
     print(f"Starting synchronization for address: {address.address}")
+    if incremental and not address.latest_tx_hash:
+        # Nothing to stop at yet (never walked, or reset by a migration), so walk the history
+        print(f"No high-water mark for {address.address} yet, walking its history instead")
+        incremental = False
+    # Progress is published to Redis for the detail page to follow without reloading
+    kind = ('incremental' if incremental else 'history') if fetch_transactions else 'balance'
+    start_progress(address_id, kind)
     
-    # Get address info from Blockchain.info
-    info = BlockchainInfoAPI.get_address_info(address.address)
+    # Get address info from the healthiest provider, failing over if it errors
+    try:
+        info = get_provider_router().get_address_info(address.address)
+    except RateLimitExceeded as e:
+        # Reschedule instead of holding the worker while the shared bucket refills
+        print(f"Rate limited fetching address info, retrying in {e.retry_after:.1f} seconds")
+        record_error(address_id, f"Rate limited, retrying in {e.retry_after:.0f} seconds")
+        raise self.retry(countdown=e.retry_after)
     
     if info:
-        address.current_balance = info['balance']
+        # Dormant addresses back off to longer scheduled intervals, active ones reset
+        reschedule(address, info['tx_count'] != previous_tx_count)
+        address.balance_sats = info['balance_sats']
         address.transaction_count = info['tx_count']
         # Save address info immediately
         address.save()
-        print(f"Updated balance for {address.address}: {info['balance']} BTC")
+        print(f"Updated balance for {address.address}: {sats_to_btc(info['balance_sats'])} BTC")
         print(f"Transaction count: {info['tx_count']}")
         print(f"Address information saved to database")
     else:
-        print(f"Failed to get address info for {address.address} from Blockchain.info API")
+        print(f"Failed to get address info for {address.address} from any provider")
+        record_error(address_id, "No provider returned the address's balance")
         
+    if fetch_transactions:
+        stored_count = address.legs.count()
+        expected = max_pages * page_size
+        # The cheap balance probe already tells us how many transactions exist, so only page
+        # through history when it disagrees with what we have, and only as far as the gap
+        if info and not reset_page:
+            missing = info['tx_count'] - stored_count
+            if missing <= 0 and info['tx_count'] == previous_tx_count:
+                print(f"No new activity for {address.address} ({stored_count} transactions stored), skipping history")
+                fetch_transactions = False
+            else:
+                max_pages = min(max_pages, max(1, math.ceil(missing / page_size)))
+                expected = min(expected, max(missing, 1))
+    
     # Only attempt to fetch transactions if explicitly requested
     if fetch_transactions:
-        print(f"Attempting to fetch transactions for {address.address}")
-        
-        # Use pagination to fetch transactions in smaller batches
-        total_fetched = 0
-        new_transactions = 0
+        print(f"Attempting to fetch transactions for {address.address} (up to {max_pages} pages)")
+        expect_progress(address_id, expected)
         
-        # Reset page counter if requested or if we've fetched all transactions
-        if reset_page or address.transaction_count <= Transaction.objects.filter(address=address).count():
-            start_page = 0
-            print(f"Starting from the first page (reset_page={reset_page})")
+        # Incremental syncs walk from the newest page until they meet stored transactions
+        if incremental:
+            print(f"Fetching new transactions since {address.latest_tx_hash or 'the beginning'}")
+        # Restart the history walk if requested or if we've fetched all transactions
+        elif reset_page or address.transaction_count <= stored_count:
+            print(f"Starting from the newest transaction (reset_page={reset_page})")
+            address.save(update_fields=clear_history_cursor(address))
+            if reset_page:
+                # Resets are how reorged history is repaired, so redo the series too
+                rows = rebuild_daily_balances(address)
+                print(f"Rebuilt {rows} days of balance history for {address.address}")
         else:
-            # Start from the last fetched page
-            start_page = address.last_fetched_page
-            print(f"Continuing from page {start_page + 1}")
-        
-        for page_index in range(max_pages):
-            page = start_page + page_index
-            offset = page * page_size
-            print(f"Fetching page {page+1} (offset={offset}, limit={page_size})")
-            
-            # Get transactions for this page
-            transactions = BlockchainInfoAPI.get_transactions(address.address, limit=page_size, offset=offset)
-            
-            if not transactions:
-                print(f"No more transactions found or rate limited at page {page+1}")
-                break
-                
-            total_fetched += len(transactions)
-            
-            # Process transactions for this page
-            for tx_data in transactions:
-                tx_hash = tx_data['hash']
-                # Skip if we already have this transaction
-                if not Transaction.objects.filter(address=address, tx_hash=tx_hash).exists():
-                    # Create new transaction
-                    tx = Transaction(
-                        address=address,
-                        tx_hash=tx_hash,
-                        amount=tx_data['amount'],
-                        timestamp=tx_data['timestamp'],
-                        is_sending=tx_data['is_sending'],
-                        confirmations=tx_data.get('confirmations', 0)
-                    )
-                    tx.save()
-                    new_transactions += 1
-                    print(f"Added new transaction: {tx_hash}")
-            
-            print(f"Processed {len(transactions)} transactions from page {page+1}")
-            
-            # Update the last fetched page
-            address.last_fetched_page = page + 1
-            address.save()
-            
-            # If we got fewer transactions than requested, we've reached the end
-            if len(transactions) < page_size:
-                print(f"Reached end of transactions at page {page+1}")
-                break
-                
-            # Add a delay between pages to avoid rate limiting
-            if page_index < max_pages - 1:
-                sleep_time = 30  # 30 seconds between pages
-                print(f"Waiting {sleep_time} seconds before fetching next page...")
-                time.sleep(sleep_time)
+            # Resume after the oldest transaction the walk has reached
+            print(f"Continuing after transaction {address.history_cursor_hash or 'none yet'}")
         
-        print(f"Fetched a total of {total_fetched} transactions, added {new_transactions} new ones")
+        # Each page is its own short task; the chain enqueues itself page by page and
+        # releases the sync lock when it ends
+        fetch_transaction_page.delay(
+            address.id, 0, page_size=page_size, pages_left=max_pages, incremental=incremental,
+            lock_token=lock_token,
+        )
     else:
-        print(f"Skipping transaction fetching as requested")
+        print(f"Skipping transaction fetching")
     
     # Update last sync time
     address.last_synced = timezone.now()
     address.save()
+    invalidate_portfolios(address_ids=[address.id])
+    if not fetch_transactions:
+        _release_sync(address.id, lock_token, '' if info else "No provider returned the address's balance")
     
     print(f"Completed synchronization for address: {address.address}")
-    return f"Synchronized {address.address}"
\ No newline at end of file
+    return f"Synchronized {address.address}"
+
+
+def _page_countdown():
+    """Seconds between pages, paced to the provider's shared refill rate"""
+    return 1 / settings.WALLET_RATE_LIMITS[BlockchainInfoAPI.PROVIDER]['rate']
+
+
+def enqueue_sync(address_id, countdown=None, **options):
+    """
+    Enqueue sync_bitcoin_address for an address unless a sync already in flight covers it.
+
+    Returns the request_sync() status; only ACQUIRED requests enqueue a task, the others
+    are served by the in-flight sync or the follow-up merged into it.
+    """
+    status, token = request_sync(address_id, **options)
+    if status == ACQUIRED:
+        sync_bitcoin_address.apply_async((address_id,), {**options, 'lock_token': token}, countdown=countdown)
+    return status
+
+
+def enqueue_backfill(address_id):
+    """Start a parallel backfill of an address unless a sync in flight already covers it"""
+    status, token = request_sync(address_id, fetch_transactions=True, reset_page=True)
+    if status == ACQUIRED:
+        backfill_address.delay(address_id, lock_token=token)
+    return status
+
+
+def _release_sync(address_id, lock_token, error=''):
+    """
+    Publish that a sync has ended and release its lock, enqueueing the follow-up merged
+    into it, if any. Pass ``error`` if the sync ended without finishing its work.
+    """
+    finish_progress(address_id, error)
+    follow_up = finish_sync(address_id, lock_token)
+    if follow_up:
+        token, options = follow_up
+        print(f"Starting the sync requested for address {address_id} while the last one ran")
+        sync_bitcoin_address.delay(address_id, **options, lock_token=token)
+
+
+@shared_task(bind=True, base=SyncLockTask, max_retries=20)
+def fetch_transaction_page(self, address_id, page, page_size=20, pages_left=1, incremental=False, lock_token=None, known_mark=None, new_mark=None):
+    """
+    Fetch and store a single page of an address's transaction history.
+
+    Rather than sleeping between pages, the next page is enqueued with a countdown so a
+    worker slot is never held while waiting out a rate limit. In incremental mode paging
+    starts from the newest transactions and stops at the first page reaching the
+    high-water mark the walk started from, which is passed down the chain as
+    ``known_mark`` along with the ``new_mark`` its first page found; the address's mark
+    only moves to it once the walk has stored everything above the old one. Otherwise each page continues from the address's
+    history cursor, so the walk resumes exactly where it stopped even after new
+    transactions have shifted every provider offset. The address's sync lock is held for the whole
+    chain and released by its last page.
+    """
+    address = BitcoinAddress.objects.get(id=address_id)
+    if not touch_sync(address_id, lock_token, page + 1):
+        print(f"Sync lock for {address.address} was taken over by another sync, stopping at page {page+1}")
+        return f"Skipped {address.address}"
+    # Only the first page resumes from the saved cursor; the rest follow on from it exactly
+    resuming = page == 0
+    offset = page * page_size if incremental else resume_offset(address, CURSOR_MARGIN if resuming else 0)
+    print(f"Fetching page {page+1} for {address.address} (offset={offset}, limit={page_size})")
+    
+    try:
+        # Transactions are parsed from the response as it streams and stored in batches
+        transactions = get_provider_router().iter_transactions(address.address, limit=page_size, offset=offset)
+    except RateLimitExceeded as e:
+        print(f"Rate limited at page {page+1}, retrying in {e.retry_after:.1f} seconds")
+        record_error(address_id, f"Rate limited at page {page+1}, retrying in {e.retry_after:.0f} seconds")
+        raise self.retry(countdown=e.retry_after)
+    
+    if incremental and known_mark is None:
+        known_mark = [address.latest_tx_hash, address.latest_block_height]
+    
+    # The page is never materialized in full; it is consumed in bounded batches
+    scan = CursorScan(address, expect_cursor=resuming)
+    try:
+        # A page that breaks off mid-stream is rolled back whole and fetched again
+        with transaction.atomic():
+            summary = ingest_transaction_stream(address, scan.watch(transactions or []), known_mark=known_mark)
+    except ProviderStreamError as e:
+        # Count it against the provider so the retry fails over to a healthier one
+        get_provider_router().record_failure(e.provider)
+        if self.request.retries < self.max_retries:
+            print(f"Page {page+1} of {address.address} broke off, retrying: {str(e)}")
+            record_error(address_id, f"Page {page+1} broke off, retrying")
+            raise self.retry(countdown=2 ** self.request.retries)
+        _release_sync(address_id, lock_token, f"Page {page+1} failed: {str(e)}")
+        return f"Failed to fetch page {page+1} for {address.address}"
+    fetched, new_transactions = summary['fetched'], summary['new']
+    
+    if not fetched:
+        print(f"No more transactions found or rate limited at page {page+1}")
+        error = '' if transactions is not None else f"No provider returned page {page+1}"
+        if incremental and new_mark and not error:
+            # The walk ran off the end of the history, so everything above the old mark is stored
+            address.save(update_fields=advance_high_water_mark(address, mark=new_mark))
+        _release_sync(address_id, lock_token, error)
+        return f"Fetched 0 transactions for {address.address}"
+    
+    print(f"Processed {fetched} transactions from page {page+1}, added {new_transactions} new ones")
+    record_page(address_id, fetched, new_transactions)
+    
+    update_fields = []
+    if incremental:
+        new_mark = new_mark or high_water_mark(address, summary['high_water'])
+    else:
+        if offset == 0:
+            update_fields += advance_high_water_mark(address, summary['high_water'])
+        update_fields += advance_history_cursor(address, scan, offset, page_size)
+    
+    # If we got fewer transactions than requested, we've reached the end
+    next_page_queued = False
+    if fetched < page_size:
+        print(f"Reached end of transactions at page {page+1}")
+    elif scan.overshot:
+        # Stepped back to close a gap, which the next sync reads with a fresh margin
+        print(f"Page {page+1} started past the history cursor, leaving the rest to the next sync")
+    elif incremental and summary['reached_known']:
+        print(f"Reached already stored transactions at page {page+1}")
+    elif pages_left > 1:
+        countdown = _page_countdown()
+        print(f"Scheduling page {page+2} in {countdown:.0f} seconds")
+        options = {'page_size': page_size, 'pages_left': pages_left - 1, 'incremental': incremental, 'lock_token': lock_token}
+        if incremental:
+            options.update(known_mark=known_mark, new_mark=new_mark)
+        fetch_transaction_page.apply_async((address_id, page + 1), options, countdown=countdown)
+        next_page_queued = True
+    elif incremental:
+        # The mark stays put, so the next walk reads on past the pages stored so far
+        print(f"Ran out of pages at page {page+1} before reaching stored transactions")
+    
+    if incremental and not next_page_queued and (fetched < page_size or summary['reached_known']):
+        update_fields += advance_high_water_mark(address, mark=new_mark)
+    if update_fields:
+        address.save(update_fields=update_fields)
+    
+    if not next_page_queued:
+        _release_sync(address_id, lock_token)
+    
+    return f"Fetched {fetched} transactions for {address.address}, added {new_transactions} new ones"
+
+
+@shared_task
+def sync_address_balances(user_id=None, stale_after=None, address_ids=None):
+    """
+    Refresh balances for many addresses at once.
+
+    Addresses are grouped into chunks of BlockchainInfoAPI.BALANCE_BATCH_SIZE and each
+    chunk costs a single provider request. Pass ``user_id`` to sync one user's addresses,
+    or ``stale_after`` (seconds) to only sync addresses not refreshed within that window.
+    Chunks that hit the shared rate limit are rescheduled by ``address_ids``.
+    """
+    queryset = BitcoinAddress.objects.all()
+    if address_ids is not None:
+        queryset = queryset.filter(id__in=address_ids)
+    if user_id is not None:
+        queryset = queryset.filter(watchers__user_id=user_id)
+    if stale_after is not None:
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        queryset = queryset.filter(Q(last_synced__isnull=True) | Q(last_synced__lt=cutoff))
+    addresses = list(queryset.order_by('id'))
+    
+    print(f"Starting batched balance synchronization for {len(addresses)} addresses")
+    
+    batch_size = BlockchainInfoAPI.BALANCE_BATCH_SIZE
+    updated = []
+    for start in range(0, len(addresses), batch_size):
+        chunk = addresses[start:start + batch_size]
+        try:
+            balances = BlockchainInfoAPI.get_balances([address.address for address in chunk])
+        except RateLimitExceeded as e:
+            remaining = [address.id for address in addresses[start:]]
+            print(f"Rate limited, rescheduling {len(remaining)} addresses in {e.retry_after:.1f} seconds")
+            sync_address_balances.apply_async(kwargs={'address_ids': remaining}, countdown=e.retry_after)
+            break
+        
+        if balances is None:
+            print(f"Failed to get balances for chunk starting at {chunk[0].address}")
+            continue
+        
+        synced_at = timezone.now()
+        for address in chunk:
+            info = balances.get(address.address)
+            if info is None:
+                continue
+            reschedule(address, info['tx_count'] != address.transaction_count, synced_at)
+            address.balance_sats = info['balance_sats']
+            address.transaction_count = info['tx_count']
+            address.last_synced = synced_at
+            updated.append(address)
+    
+    # Write all balances back in bulk instead of one save() per address
+    BitcoinAddress.objects.bulk_update(
+        updated,
+        ['balance_sats', 'transaction_count', 'last_synced', 'sync_interval', 'next_sync_at'],
+        batch_size=batch_size,
+    )
+    invalidate_portfolios(address_ids=[address.id for address in updated])
+    
+    print(f"Completed batched balance synchronization: {len(updated)} of {len(addresses)} addresses updated")
+    return f"Synchronized balances for {len(updated)} of {len(addresses)} addresses"
+
+
+@shared_task
+def sync_addresses_concurrently(address_ids=None, user_id=None, fetch_transactions=True, page_size=20, max_pages=5):
+    """
+    Sync a batch of addresses from one task with the asyncio fetch engine.
+
+    Balance requests and the history walks of all addresses run concurrently, bounded
+    by WALLET_ASYNC_CONCURRENCY and the shared rate limiter; each walk streams its pages
+    in turn under the address's sync lock. The run only spends the tokens the limiter
+    has: addresses it ran out of tokens for are synced again by a new task once the
+    bucket refills, instead of the worker waiting out the refill within its time limit.
+    """
+    addresses = BitcoinAddress.objects.all()
+    if address_ids is not None:
+        addresses = addresses.filter(id__in=address_ids)
+    if user_id is not None:
+        addresses = addresses.filter(watchers__user_id=user_id)
+    ids = list(addresses.values_list('id', flat=True))
+    
+    print(f"Starting concurrent synchronization for {len(ids)} addresses")
+    result = asyncio.run(
+        sync_addresses(ids, fetch_transactions=fetch_transactions, page_size=page_size, max_pages=max_pages)
+    )
+    print(f"Completed concurrent synchronization: {result}")
+    if result['deferred']:
+        print(f"Rate limited, syncing {len(result['deferred'])} addresses again in {result['retry_after']:.0f} seconds")
+        sync_addresses_concurrently.apply_async(
+            kwargs={
+                'address_ids': result['deferred'], 'fetch_transactions': fetch_transactions,
+                'page_size': page_size, 'max_pages': max_pages,
+            },
+            countdown=result['retry_after'],
+        )
+    return (
+        f"Synchronized {result['updated']} of {result['addresses']} addresses, "
+        f"added {result['new_transactions']} transactions"
+    )
+
+
+@shared_task
+def refresh_chain_tip():
+    """
+    Cache the current chain tip height.
+
+    Confirmations are derived from it and each transaction's block height when read, so
+    this one request per interval keeps every confirmation count current.
+    """
+    try:
+        height = get_provider_router().get_chain_tip()
+    except RateLimitExceeded as e:
+        # The next scheduled run will try again; the cached tip stays valid meanwhile
+        print(f"Rate limited fetching the chain tip: {str(e)}")
+        return None
+    
+    if height is None:
+        print("Failed to get the chain tip from any provider")
+        return None
+    
+    set_chain_tip(height)
+    print(f"Chain tip is now at block {height}")
+    return height
+
+
+@shared_task
+def schedule_syncs():
+    """
+    Enqueue syncs for the most urgent due addresses, within the scheduler's request budget.
+
+    Run by beat every WALLET_SYNC_SCHEDULE_SECONDS. Selected addresses are leased for one
+    interval so a slow sync is not enqueued again by the next run, and their syncs are
+    spread over the window rather than sent as one burst. The decisions are kept for
+    inspection with ``manage.py sync_schedule``.
+    """
+    now = timezone.now()
+    budget = sync_budget()
+    decisions = plan_syncs(now=now, budget=budget)
+    selected = [decision for decision in decisions if decision['selected']]
+    
+    BitcoinAddress.objects.bulk_update(
+        [
+            BitcoinAddress(id=decision['address_id'], next_sync_at=now + timedelta(seconds=decision['sync_interval']))
+            for decision in selected
+        ],
+        ['next_sync_at'],
+    )
+    spacing = settings.WALLET_SYNC_SCHEDULE_SECONDS / budget
+    for position, decision in enumerate(selected):
+        enqueue_sync(
+            decision['address_id'], countdown=position * spacing, fetch_transactions=True, incremental=True
+        )
+    record_run(decisions, budget, now)
+    
+    print(f"Scheduled {len(selected)} of {len(decisions)} due addresses (budget {budget})")
+    return f"Scheduled {len(selected)} of {len(decisions)} due addresses"
+
+
+@shared_task(bind=True, base=SyncLockTask, max_retries=20)
+def backfill_address(self, address_id, lock_token=None):
+    """
+    Fetch an address's whole history as parallel ranges instead of one page chain.
+
+    The history is split into BackfillRange checkpoints (or an interrupted backfill's
+    ranges are resumed) and fanned out as a chord of fetch_backfill_range tasks, spread
+    over the backfill workers and the providers, with finish_backfill merging them. The
+    whole backfill holds the address's sync lock, so regular syncs coalesce into it.
+    """
+    address = BitcoinAddress.objects.get(id=address_id)
+    if not touch_sync(address_id, lock_token):
+        print(f"Sync lock for {address.address} was taken over by another sync, not backfilling")
+        return f"Skipped {address.address}"
+    start_progress(address_id, 'backfill')
+    
+    try:
+        info = get_provider_router().get_address_info(address.address)
+    except RateLimitExceeded as e:
+        print(f"Rate limited planning the backfill, retrying in {e.retry_after:.1f} seconds")
+        record_error(address_id, f"Rate limited, retrying in {e.retry_after:.0f} seconds")
+        raise self.retry(countdown=e.retry_after)
+    if info:
+        # Size the ranges from the current count, not the last synced one
+        address.balance_sats = info['balance_sats']
+        address.transaction_count = info['tx_count']
+        address.save(update_fields=['balance_sats', 'transaction_count'])
+    
+    ranges = plan_backfill(address, address.transaction_count)
+    if not ranges:
+        print(f"Nothing to backfill for {address.address}")
+        _release_sync(address_id, lock_token)
+        return f"Nothing to backfill for {address.address}"
+    
+    print(f"Backfilling {address.transaction_count} transactions for {address.address} in {len(ranges)} ranges")
+    expect_progress(address_id, sum(r.end_offset - r.next_offset for r in ranges))
+    chord(
+        group(fetch_backfill_range.s(backfill_range.id, lock_token=lock_token) for backfill_range in ranges),
+        finish_backfill.s(address_id, lock_token=lock_token),
+    ).delay()
+    return f"Backfilling {address.address} in {len(ranges)} ranges"
+
+
+@shared_task(bind=True, max_retries=20)
+def fetch_backfill_range(self, range_id, lock_token=None):
+    """
+    Fetch one BackfillRange of an address's history, resuming from its checkpoint.
+
+    Pages are fetched back to back until the range is covered. When the rate limit is
+    reached the task replaces itself with a copy scheduled after the refill, keeping its
+    place in the chord without holding the worker or spending a retry; retries are kept
+    for providers that fail. The checkpoint is saved after every page, so a rescheduled
+    or lost worker repeats at most one page. Each range reads WALLET_BACKFILL_OVERLAP
+    transactions past its end, because transactions arriving during the backfill shift
+    older ones to higher offsets. Always returns the range's summary for finish_backfill:
+    a range that keeps failing, errors or runs out of time is marked failed rather than
+    failing the whole chord, which would leave the sync lock held.
+    """
+    backfill_range = BackfillRange.objects.select_related('address').get(id=range_id)
+    address = backfill_range.address
+    stop = backfill_range.end_offset + settings.WALLET_BACKFILL_OVERLAP
+    backfill_range.status = BackfillRange.Status.RUNNING
+    backfill_range.save(update_fields=['status', 'updated_at'])
+    
+    def give_up(error):
+        record_error(address.id, error)
+        backfill_range.status = BackfillRange.Status.FAILED
+        backfill_range.error = error[:255]
+        backfill_range.save(update_fields=['status', 'error', 'updated_at'])
+    
+    try:
+        while backfill_range.status == BackfillRange.Status.RUNNING:
+            if not touch_sync(address.id, lock_token):
+                print(f"Sync lock for {address.address} was taken over, pausing range at offset {backfill_range.next_offset}")
+                backfill_range.status = BackfillRange.Status.PENDING
+                backfill_range.save(update_fields=['status', 'updated_at'])
+                break
+            
+            offset = backfill_range.next_offset
+            limit = min(settings.WALLET_BACKFILL_PAGE_SIZE, stop - offset)
+            try:
+                transactions = get_provider_router().iter_transactions(
+                    address.address, limit=limit, offset=offset, prefer=backfill_range.provider
+                )
+            except RateLimitExceeded as e:
+                print(f"Rate limited at offset {offset} of {address.address}, resuming in {e.retry_after:.1f} seconds")
+                record_error(address.id, f"Rate limited at offset {offset}, resuming in {e.retry_after:.0f} seconds")
+                backfill_range.status = BackfillRange.Status.PENDING
+                backfill_range.save(update_fields=['status', 'updated_at'])
+                return self.replace(
+                    fetch_backfill_range.s(range_id, lock_token=lock_token).set(countdown=e.retry_after)
+                )
+            if transactions is None:
+                if self.request.retries >= self.max_retries:
+                    give_up(f"No provider returned offset {offset}")
+                    break
+                raise self.retry(countdown=2 ** self.request.retries)
+            
+            try:
+                # A page that breaks off is rolled back whole and fetched again;
+                # ranges run concurrently, so the daily series is rebuilt once by finish_backfill
+                with transaction.atomic():
+                    summary = ingest_transaction_stream(address, transactions, defer_balances=True)
+            except ProviderStreamError as e:
+                get_provider_router().record_failure(e.provider)
+                if self.request.retries >= self.max_retries:
+                    give_up(f"Offset {offset} failed: {str(e)}")
+                    break
+                print(f"Offset {offset} of {address.address} broke off, retrying: {str(e)}")
+                raise self.retry(countdown=2 ** self.request.retries)
+            if offset == 0 and summary['fetched']:
+                address.save(update_fields=advance_high_water_mark(address, summary['high_water']))
+            
+            record_page(address.id, summary['fetched'], summary['new'])
+            backfill_range.next_offset = offset + summary['fetched']
+            backfill_range.fetched += summary['fetched']
+            backfill_range.new_transactions += summary['new']
+            if summary['fetched'] < limit or backfill_range.next_offset >= stop:
+                backfill_range.status = BackfillRange.Status.DONE
+            backfill_range.save(update_fields=['next_offset', 'fetched', 'new_transactions', 'status', 'updated_at'])
+    except (Retry, Ignore):
+        raise
+    except Exception as e:
+        # SoftTimeLimitExceeded included: a header task that raises keeps the chord from merging
+        print(f"Range at offset {backfill_range.next_offset} of {address.address} failed: {e!r}")
+        give_up(f"Offset {backfill_range.next_offset} failed: {str(e) or type(e).__name__}")
+    
+    return {
+        'range_id': backfill_range.id,
+        'status': backfill_range.status,
+        'fetched': backfill_range.fetched,
+        'new': backfill_range.new_transactions,
+    }
+
+
+@shared_task
+def finish_backfill(results, address_id, lock_token=None):
+    """
+    Merge a backfill once all its ranges have returned (the chord callback).
+
+    Overlapping ranges and repeated pages were already deduplicated as they were stored,
+    since transactions and legs are unique, so merging rebuilds the daily balance series
+    once from the stored legs and releases the sync lock. Unfinished ranges keep their
+    checkpoints for the next backfill of the address to resume.
+    """
+    address = BitcoinAddress.objects.get(id=address_id)
+    merged = merge_results(results)
+    rows = rebuild_daily_balances(address)
+    address.last_synced = timezone.now()
+    address.save(update_fields=['last_synced'])
+    invalidate_portfolios(address_ids=[address.id])
+    error = f"{len(merged['unfinished'])} of {merged['ranges']} ranges left to resume" if merged['unfinished'] else ''
+    _release_sync(address_id, lock_token, error)
+    
+    print(
+        f"Backfill of {address.address} finished: {merged['fetched']} fetched, {merged['new']} new, "
+        f"{rows} days of balance history, {len(merged['unfinished'])} of {merged['ranges']} ranges unfinished"
+    )
+    return (
+        f"Backfilled {address.address}: added {merged['new']} transactions, "
+        f"{len(merged['unfinished'])} ranges left to resume"
+    )
+
@@ -0,0 +1,26 @@
+from django import template
+
+from wallet.models import confirmations as derive_confirmations
+from wallet.models import sats_to_btc
+
+register = template.Library()
+
+
+@register.filter
+def btc(sats):
+    """Render an integer satoshi amount as BTC"""
+    if sats is None or sats == "":
+        return ""
+    return sats_to_btc(sats)
+
+
+@register.filter
+def sync_state(sync_states, watch):
+    """The in-flight sync of a watched address, looked up in the view's sync_states by address id"""
+    return sync_states.get(watch.address_id)
+
+
+@register.filter
+def confirmations(block_height, chain_tip):
+    """Confirmations of a transaction at ``block_height`` given the cached chain tip"""
+    return derive_confirmations(block_height, chain_tip)
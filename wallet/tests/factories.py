@@ -0,0 +1,25 @@
+from factory import Sequence
+from factory import SubFactory
+from factory.django import DjangoModelFactory
+
+from bitcoin_wallet_tracker.users.tests.factories import UserFactory
+from wallet.models import BitcoinAddress
+from wallet.models import WatchedAddress
+
+
+class BitcoinAddressFactory(DjangoModelFactory[BitcoinAddress]):
+    address = Sequence(lambda n: f"1Test{n:029d}")
+    balance_sats = 0
+
+    class Meta:
+        model = BitcoinAddress
+        django_get_or_create = ["address"]
+
+
+class WatchedAddressFactory(DjangoModelFactory[WatchedAddress]):
+    user = SubFactory(UserFactory)
+    address = SubFactory(BitcoinAddressFactory)
+    label = Sequence(lambda n: f"Address {n}")
+
+    class Meta:
+        model = WatchedAddress
@@ -0,0 +1,176 @@
+import asyncio
+from unittest import mock
+
+import httpx
+import pytest
+
+from wallet.async_services import sync_addresses
+from wallet.progress import get_progress
+from wallet.sync_lock import get_sync_state
+from wallet.sync_lock import request_sync
+from wallet.tasks import sync_addresses_concurrently
+from wallet.tests.factories import BitcoinAddressFactory
+
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+def rawaddr_tx(tx_hash, address):
+    return {
+        "hash": tx_hash,
+        "time": 1704067200,
+        "block_height": 800000,
+        "inputs": [],
+        "out": [{"addr": address, "value": 10000000}],
+    }
+
+
+@pytest.fixture
+def provider():
+    """Fake blockchain.info answering /balance and /rawaddr, recording requests."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.url.path == "/balance":
+            active = request.url.params["active"].split("|")
+            return httpx.Response(200, json={a: {"final_balance": 10000000, "n_tx": 3} for a in active})
+        address = request.url.path.rsplit("/", 1)[-1]
+        offset = int(request.url.params["offset"])
+        limit = int(request.url.params["limit"])
+        txs = [rawaddr_tx(f"{address}-{n}", address) for n in range(offset, min(offset + limit, 3))]
+        return httpx.Response(200, json={"txs": txs})
+
+    return httpx.MockTransport(handler), requests
+
+
+def test_syncs_balances_and_missing_pages(provider):
+    transport, requests = provider
+    addresses = BitcoinAddressFactory.create_batch(2)
+
+    result = asyncio.run(
+        sync_addresses([a.id for a in addresses], page_size=2, max_pages=5, transport=transport),
+    )
+
+    assert result == {"addresses": 2, "updated": 2, "new_transactions": 6, "deferred": [], "retry_after": None}
+    # One balance request for both addresses, then two pages each
+    assert sum(r.url.path == "/balance" for r in requests) == 1
+    assert len(requests) == 5  # noqa: PLR2004
+    for address in addresses:
+        address.refresh_from_db()
+        assert address.balance_sats == 10000000  # noqa: PLR2004
+        assert address.transactions.count() == 3  # noqa: PLR2004
+        assert address.history_cursor_hash == f"{address.address}-2"
+        assert address.history_cursor_offset == 3  # noqa: PLR2004
+        assert address.latest_tx_hash == f"{address.address}-0"
+
+
+def test_balances_only(provider):
+    transport, requests = provider
+    address = BitcoinAddressFactory()
+
+    asyncio.run(sync_addresses([address.id], fetch_transactions=False, transport=transport))
+
+    assert len(requests) == 1
+    assert address.transactions.count() == 0
+
+
+def test_leaves_history_to_a_sync_in_flight(provider):
+    transport, requests = provider
+    address = BitcoinAddressFactory()
+    request_sync(address.id, fetch_transactions=True)
+
+    result = asyncio.run(sync_addresses([address.id], transport=transport))
+
+    assert result["new_transactions"] == 0
+    assert [r.url.path for r in requests] == ["/balance"]
+
+
+def test_broken_stream_fails_the_sync_and_releases_the_lock():
+    def handler(request):
+        if request.url.path == "/balance":
+            active = request.url.params["active"].split("|")
+            return httpx.Response(200, json={a: {"final_balance": 0, "n_tx": 3} for a in active})
+        return httpx.Response(200, content=b'{"txs": [{"hash": "tx0", ')
+
+    address = BitcoinAddressFactory()
+    asyncio.run(sync_addresses([address.id], transport=httpx.MockTransport(handler)))
+
+    assert get_sync_state(address.id) is None
+    progress = get_progress(address.id)
+    assert progress["state"] == "failed"
+    assert progress["error"].startswith("Page 1 failed")
+
+
+def test_rate_limited_walk_is_deferred_instead_of_waited_for(provider, settings):
+    settings.WALLET_RATE_LIMITS = {
+        "blockchain_info": {"rate": 0.1, "capacity": 2},
+        "blockchair": {"rate": 0.01, "capacity": 0},
+    }
+    transport, requests = provider
+    address = BitcoinAddressFactory()
+
+    result = asyncio.run(sync_addresses([address.id], page_size=2, max_pages=5, transport=transport))
+
+    # The balance and the first page spend the bucket; the second page is left for later
+    assert (result["new_transactions"], result["deferred"]) == (2, [address.id])
+    assert 0 < result["retry_after"] <= 10  # noqa: PLR2004
+    assert len(requests) == 2  # noqa: PLR2004
+    assert get_sync_state(address.id) is None
+    assert get_progress(address.id)["error"].startswith("Rate limited at page 2")
+
+
+def test_history_page_fails_over_to_blockchair(settings):
+    settings.WALLET_PROVIDERS = ["blockchain_info", "blockchair"]
+
+    def handler(request):
+        if request.url.path == "/balance":
+            active = request.url.params["active"].split("|")
+            return httpx.Response(200, json={a: {"final_balance": 0, "n_tx": 1} for a in active})
+        if request.url.host == "blockchain.info":
+            return httpx.Response(500)
+        address = request.url.path.rsplit("/", 1)[-1]
+        tx = {
+            "hash": "tx0",
+            "time": "2024-01-01 00:00:00",
+            "block_id": 800000,
+            "inputs": [],
+            "outputs": [{"recipient": address, "value": 5000}],
+        }
+        return httpx.Response(200, json={"data": {address: {"transactions": [tx]}}})
+
+    address = BitcoinAddressFactory()
+    result = asyncio.run(sync_addresses([address.id], transport=httpx.MockTransport(handler)))
+
+    assert result["new_transactions"] == 1
+    assert address.legs.get().amount_sats == 5000  # noqa: PLR2004
+
+
+def test_task_reschedules_deferred_addresses():
+    address = BitcoinAddressFactory()
+    deferred = {"addresses": 1, "updated": 1, "new_transactions": 0, "deferred": [address.id], "retry_after": 8.0}
+
+    with (
+        mock.patch("wallet.tasks.sync_addresses", mock.AsyncMock(return_value=deferred)),
+        mock.patch.object(sync_addresses_concurrently, "apply_async") as apply_async,
+    ):
+        sync_addresses_concurrently(address_ids=[address.id], page_size=10)
+
+    apply_async.assert_called_once_with(
+        kwargs={"address_ids": [address.id], "fetch_transactions": True, "page_size": 10, "max_pages": 5},
+        countdown=8.0,
+    )
+
+
+def test_unexpected_item_fails_the_provider_stream():
+    def handler(request):
+        if request.url.path == "/balance":
+            active = request.url.params["active"].split("|")
+            return httpx.Response(200, json={a: {"final_balance": 0, "n_tx": 1} for a in active})
+        return httpx.Response(200, json={"txs": [{"hash": "tx0", "time": 1704067200}]})
+
+    address = BitcoinAddressFactory()
+    asyncio.run(sync_addresses([address.id], transport=httpx.MockTransport(handler)))
+
+    progress = get_progress(address.id)
+    assert progress["state"] == "failed"
+    assert progress["error"].startswith("Page 1 failed: blockchain_info stream failed: unexpected item")
@@ -0,0 +1,162 @@
+from datetime import UTC
+from datetime import datetime
+from unittest import mock
+
+import pytest
+from celery.exceptions import SoftTimeLimitExceeded
+
+from config.celery_app import app
+from wallet.backfill import plan_backfill
+from wallet.models import BackfillRange
+from wallet.progress import get_progress
+from wallet.ratelimit import RateLimitExceeded
+from wallet.services import BlockchainInfoAPI
+from wallet.sync_lock import get_sync_state
+from wallet.tasks import enqueue_backfill
+from wallet.tasks import fetch_backfill_range
+from wallet.tests.factories import BitcoinAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def history(count):
+    """Newest-first parsed history of ``count`` transactions on distinct days."""
+    return [
+        {
+            "hash": f"tx{n}",
+            "amount_sats": 1000,
+            "timestamp": datetime(2024, 1, 1 + (count - n) % 28, tzinfo=UTC),
+            "block_height": 800000 - n,
+            "is_sending": False,
+        }
+        for n in range(count)
+    ]
+
+
+def fake_iter(transactions):
+    def iter_transactions(address, limit=50, offset=0):
+        return iter(transactions[offset : offset + limit])
+
+    return iter_transactions
+
+
+def test_plan_splits_history_and_resumes_unfinished_ranges(settings):
+    settings.WALLET_BACKFILL_RANGE_SIZE = 10
+    address = BitcoinAddressFactory()
+
+    ranges = plan_backfill(address, 25)
+    assert [(r.start_offset, r.end_offset) for r in ranges] == [(0, 10), (10, 20), (20, 25)]
+
+    BackfillRange.objects.filter(start_offset=0).update(status=BackfillRange.Status.DONE)
+    BackfillRange.objects.filter(start_offset=10).update(status=BackfillRange.Status.FAILED, next_offset=15)
+    resumed = plan_backfill(address, 25)
+    assert [(r.start_offset, r.next_offset) for r in resumed] == [(10, 15), (20, 20)]
+
+    # Three transactions received since push the unfetched rows three offsets down
+    resumed = plan_backfill(address, 28)
+    assert [(r.start_offset, r.end_offset, r.next_offset) for r in resumed] == [(13, 23, 13), (23, 28, 23)]
+
+
+def test_range_checkpoints_each_page_and_reschedules_after_rate_limit(settings):
+    settings.WALLET_BACKFILL_PAGE_SIZE = 4
+    settings.WALLET_BACKFILL_OVERLAP = 2
+    address = BitcoinAddressFactory()
+    backfill_range = plan_backfill(address, 10)[0]
+    transactions = history(12)
+    served = fake_iter(transactions)
+    calls = []
+
+    def limited(address, limit=50, offset=0):
+        calls.append(offset)
+        if len(calls) == 2:  # noqa: PLR2004
+            raise RateLimitExceeded("blockchain_info", 5)
+        return served(address, limit, offset)
+
+    with (
+        mock.patch.object(BlockchainInfoAPI, "iter_transactions", side_effect=limited),
+        mock.patch.object(fetch_backfill_range, "replace") as replace,
+        mock.patch.object(fetch_backfill_range, "retry") as retry,
+    ):
+        fetch_backfill_range(backfill_range.id)
+    backfill_range.refresh_from_db()
+    assert (backfill_range.next_offset, backfill_range.status) == (4, "pending")
+    # The wait is rescheduled in the range's place in the chord rather than retried
+    rescheduled = replace.call_args.args[0]
+    assert (rescheduled.args, rescheduled.options["countdown"]) == ((backfill_range.id,), 5)
+    retry.assert_not_called()
+
+    with mock.patch.object(BlockchainInfoAPI, "iter_transactions", side_effect=served):
+        result = fetch_backfill_range(backfill_range.id)
+
+    # The range reads its overlap past the planned end of 10
+    assert result == {"range_id": backfill_range.id, "status": "done", "fetched": 12, "new": 12}
+    assert address.legs.count() == 12  # noqa: PLR2004
+
+
+def test_failing_range_still_returns_its_summary(settings):
+    settings.WALLET_BACKFILL_PAGE_SIZE = 4
+    address = BitcoinAddressFactory()
+    backfill_range = plan_backfill(address, 10)[0]
+    served = fake_iter(history(10))
+    calls = []
+
+    def failing(address, limit=50, offset=0):
+        calls.append(offset)
+        if len(calls) == 2:  # noqa: PLR2004
+            raise SoftTimeLimitExceeded
+        return served(address, limit, offset)
+
+    with mock.patch.object(BlockchainInfoAPI, "iter_transactions", side_effect=failing):
+        result = fetch_backfill_range(backfill_range.id)
+
+    assert result == {"range_id": backfill_range.id, "status": "failed", "fetched": 4, "new": 4}
+    backfill_range.refresh_from_db()
+    assert (backfill_range.next_offset, backfill_range.error) == (4, "Offset 4 failed: SoftTimeLimitExceeded()")
+
+
+def test_backfill_fans_out_and_merges(settings, monkeypatch):
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    settings.WALLET_BACKFILL_RANGE_SIZE = 10
+    settings.WALLET_BACKFILL_PAGE_SIZE = 4
+    settings.WALLET_BACKFILL_OVERLAP = 3
+    address = BitcoinAddressFactory()
+    transactions = history(25)
+
+    with (
+        mock.patch.object(BlockchainInfoAPI, "get_address_info", return_value={"balance_sats": 25000, "tx_count": 25}),
+        mock.patch.object(BlockchainInfoAPI, "iter_transactions", side_effect=fake_iter(transactions)),
+    ):
+        enqueue_backfill(address.id)
+
+    address.refresh_from_db()
+    assert address.legs.count() == 25  # noqa: PLR2004
+    assert address.latest_tx_hash == "tx0"
+    assert address.daily_balances.last().balance_sats == 25000  # noqa: PLR2004
+    assert set(address.backfill_ranges.values_list("status", flat=True)) == {"done"}
+    assert get_sync_state(address.id) is None
+
+
+def test_backfill_merges_after_a_range_fails(settings, monkeypatch):
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    settings.WALLET_BACKFILL_RANGE_SIZE = 10
+    settings.WALLET_BACKFILL_PAGE_SIZE = 10
+    settings.WALLET_BACKFILL_OVERLAP = 0
+    address = BitcoinAddressFactory()
+    served = fake_iter(history(20))
+
+    def failing(address, limit=50, offset=0):
+        if offset == 10:  # noqa: PLR2004
+            raise ValueError("unexpected payload")
+        return served(address, limit, offset)
+
+    with (
+        mock.patch.object(BlockchainInfoAPI, "get_address_info", return_value={"balance_sats": 20000, "tx_count": 20}),
+        mock.patch.object(BlockchainInfoAPI, "iter_transactions", side_effect=failing),
+    ):
+        enqueue_backfill(address.id)
+
+    # The ranges that finished are merged into the daily series and the lock is released
+    assert address.legs.count() == 10  # noqa: PLR2004
+    assert address.daily_balances.exists()
+    assert get_sync_state(address.id) is None
+    assert get_progress(address.id)["error"] == "1 of 2 ranges left to resume"
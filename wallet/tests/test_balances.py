@@ -0,0 +1,82 @@
+from datetime import UTC
+from datetime import date
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+from wallet.balances import rebuild_daily_balances
+from wallet.balances import update_daily_balances
+from wallet.ingest import ingest_transactions
+from wallet.models import TransactionLeg
+from wallet.tests.factories import BitcoinAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def tx_data(tx_hash, day, amount_sats):
+    return {
+        "hash": tx_hash,
+        "amount_sats": amount_sats,
+        "timestamp": datetime(2024, 1, day, 12, tzinfo=UTC),
+        "is_sending": amount_sats < 0,
+    }
+
+
+def series(address):
+    return list(address.daily_balances.values_list("date", "net_sats", "balance_sats"))
+
+
+def test_ingest_appends_and_backfills_the_series():
+    address = BitcoinAddressFactory()
+    ingest_transactions(address, [tx_data("c", 5, -300), tx_data("b", 3, 1000)])
+    assert series(address) == [(date(2024, 1, 3), 1000, 1000), (date(2024, 1, 5), -300, 700)]
+
+    # An older page shifts every later day's running balance
+    ingest_transactions(address, [tx_data("a", 1, 500), tx_data("a2", 3, 50)])
+    assert series(address) == [
+        (date(2024, 1, 1), 500, 500),
+        (date(2024, 1, 3), 1050, 1550),
+        (date(2024, 1, 5), -300, 1250),
+    ]
+
+    # Already stored legs are not counted twice
+    ingest_transactions(address, [tx_data("c", 5, -300)])
+    assert series(address)[-1] == (date(2024, 1, 5), -300, 1250)
+
+
+def test_legs_stored_by_a_concurrent_ingest_are_not_counted_twice():
+    address = BitcoinAddressFactory()
+    ingest_transactions(address, [tx_data("b", 3, 1000)])
+    racing_legs = list(address.legs.all())
+
+    # An ingest whose insert was skipped as a conflict still reports the legs it built
+    update_daily_balances(racing_legs)
+    update_daily_balances(racing_legs)
+
+    assert series(address) == [(date(2024, 1, 3), 1000, 1000)]
+
+
+def test_rebuild_matches_incremental_series():
+    address = BitcoinAddressFactory()
+    ingest_transactions(address, [tx_data("b", 3, 1000), tx_data("a", 1, 500)])
+    incremental = series(address)
+    address.daily_balances.update(balance_sats=0)
+
+    assert rebuild_daily_balances(address) == 2  # noqa: PLR2004
+    assert series(address) == incremental
+
+
+def test_series_rows_are_locked_at_once_in_id_order():
+    first, second = BitcoinAddressFactory(), BitcoinAddressFactory()
+    legs = [
+        TransactionLeg(address_id=address.id, amount_sats=100, timestamp=datetime(2024, 1, 1, tzinfo=UTC))
+        for address in (second, first)
+    ]
+
+    with mock.patch("wallet.balances.BitcoinAddress.objects.select_for_update") as select_for_update:
+        update_daily_balances(legs)
+
+    # One locking query for every address, ordered so opposite credit orders cannot deadlock
+    select_for_update.return_value.filter.assert_called_once_with(id__in=[first.id, second.id])
+    select_for_update.return_value.filter.return_value.order_by.assert_called_once_with("id")
@@ -0,0 +1,96 @@
+from datetime import UTC
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+from wallet.checkpoints import CURSOR_MARGIN
+from wallet.services import BlockchainInfoAPI
+from wallet.tasks import fetch_transaction_page
+from wallet.tests.factories import BitcoinAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def tx(name, height):
+    return {
+        "hash": name,
+        "amount_sats": 1000,
+        "timestamp": datetime(2024, 1, 1, tzinfo=UTC),
+        "block_height": height,
+        "is_sending": False,
+    }
+
+
+HISTORY = [tx(f"tx{n}", 800000 - n) for n in range(30)]
+
+
+def fetch_page(address, provider_history):
+    def iter_transactions(address, limit=50, offset=0):
+        return iter(provider_history[offset : offset + limit])
+
+    with (
+        mock.patch.object(BlockchainInfoAPI, "iter_transactions", side_effect=iter_transactions),
+        mock.patch.object(fetch_transaction_page, "apply_async"),
+    ):
+        fetch_transaction_page(address.id, 0, page_size=10, pages_left=1)
+    address.refresh_from_db()
+
+
+def test_resume_continues_after_cursor_when_new_transactions_shift_offsets():
+    address = BitcoinAddressFactory(transaction_count=30)
+    fetch_page(address, HISTORY)
+    assert (address.history_cursor_hash, address.history_cursor_offset) == ("tx9", 10)
+
+    # Five transactions arrive on top, moving every older one five offsets down
+    shifted = [tx(f"new{n}", None) for n in range(5)] + HISTORY
+    address.transaction_count = 35
+    address.save()
+    fetch_page(address, shifted)
+
+    assert (address.history_cursor_hash, address.history_cursor_offset) == ("tx14", 20)
+    stored = set(address.transactions.values_list("tx_hash", flat=True))
+    assert stored == {f"tx{n}" for n in range(15)}
+
+
+def test_page_past_the_cursor_steps_back_instead_of_leaving_a_gap():
+    address = BitcoinAddressFactory(
+        transaction_count=40,  # overstates the shift: only 30 transactions exist
+        history_cursor_hash="tx9",
+        history_cursor_height=799991,
+        history_cursor_offset=10,
+        history_cursor_tx_count=30,
+    )
+
+    fetch_page(address, HISTORY)
+    assert (address.history_cursor_hash, address.history_cursor_offset) == ("tx9", 0)
+
+    fetch_page(address, HISTORY)
+    assert address.history_cursor_hash == "tx14"
+    assert {f"tx{n}" for n in range(10, 15)} <= set(address.transactions.values_list("tx_hash", flat=True))
+
+
+def test_only_the_first_page_of_a_chain_rereads_the_margin():
+    address = BitcoinAddressFactory(
+        transaction_count=30,
+        history_cursor_hash="tx9",
+        history_cursor_height=799991,
+        history_cursor_offset=10,
+        history_cursor_tx_count=30,
+    )
+    offsets = []
+
+    def iter_transactions(address, limit=50, offset=0):
+        offsets.append(offset)
+        return iter(HISTORY[offset : offset + limit])
+
+    with (
+        mock.patch.object(BlockchainInfoAPI, "iter_transactions", side_effect=iter_transactions),
+        mock.patch.object(fetch_transaction_page, "apply_async"),
+    ):
+        fetch_transaction_page(address.id, 0, page_size=10, pages_left=2)
+        fetch_transaction_page(address.id, 1, page_size=10, pages_left=1)
+
+    address.refresh_from_db()
+    assert offsets == [10 - CURSOR_MARGIN, 15]
+    assert (address.history_cursor_hash, address.history_cursor_offset) == ("tx24", 25)
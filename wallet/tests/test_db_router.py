@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from wallet.db_router import PIN_COOKIE
+from wallet.db_router import ReplicaMiddleware
+from wallet.db_router import ReplicaRouter
+from wallet.db_router import pin_to_primary
+from wallet.db_router import reads_from_replica
+from wallet.models import BitcoinAddress
+
+
+@pytest.fixture
+def replica(settings):
+    settings.DATABASES = {**settings.DATABASES, "replica": settings.DATABASES["default"]}
+
+
+def run(request, view=None):
+    seen = {}
+
+    def get_response(request):
+        seen["replica"] = reads_from_replica()
+        seen["db"] = ReplicaRouter().db_for_read(BitcoinAddress)
+        if view:
+            view(request)
+        return HttpResponse()
+
+    response = ReplicaMiddleware(get_response)(request)
+    return seen, response
+
+
+def test_get_reads_from_replica(replica):
+    seen, response = run(RequestFactory().get("/"))
+    assert seen == {"replica": True, "db": "replica"}
+    assert PIN_COOKIE not in response.cookies
+    # Outside a request (workers, commands) reads stay on the primary
+    assert ReplicaRouter().db_for_read(BitcoinAddress) is None
+
+
+def test_writes_pin_the_user_to_the_primary(replica):
+    seen, response = run(RequestFactory().post("/"))
+    assert seen["db"] is None
+    assert PIN_COOKIE in response.cookies
+
+    request = RequestFactory().get("/")
+    request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+    seen, _ = run(request)
+    assert seen["db"] is None
+
+    request = RequestFactory().get("/")
+    request.COOKIES[PIN_COOKIE] = str(time.time() - 1)
+    seen, _ = run(request)
+    assert seen["db"] == "replica"
+
+
+def test_views_can_pin_after_triggering_a_write(replica):
+    _, response = run(RequestFactory().get("/"), view=pin_to_primary)
+    assert PIN_COOKIE in response.cookies
+
+
+def test_without_replica_everything_uses_the_primary(settings):
+    settings.DATABASES = {"default": settings.DATABASES["default"]}
+    seen, _ = run(RequestFactory().get("/"))
+    assert seen["db"] is None
+    assert ReplicaRouter().db_for_write(BitcoinAddress) == "default"
@@ -0,0 +1,99 @@
+from datetime import UTC
+from datetime import datetime
+
+import pytest
+
+from wallet.ingest import ingest_transaction_stream
+from wallet.ingest import ingest_transactions
+from wallet.models import Transaction
+from wallet.models import TransactionLeg
+from wallet.tests.factories import BitcoinAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def tx_data(tx_hash):
+    return {
+        "hash": tx_hash,
+        "amount_sats": 50000000,
+        "timestamp": datetime(2024, 1, 1, tzinfo=UTC),
+        "confirmations": 3,
+        "is_sending": False,
+    }
+
+
+def test_inserts_new_rows_and_skips_known(django_assert_num_queries):
+    address = BitcoinAddressFactory()
+    ingest_transactions(address, [tx_data("known")])
+
+    # A fixed number of lookups and inserts, however large the page
+    with django_assert_num_queries(16):
+        inserted = ingest_transactions(address, [tx_data("known"), tx_data("a"), tx_data("b")])
+
+    assert inserted == 2  # noqa: PLR2004
+    assert set(address.transactions.values_list("tx_hash", flat=True)) == {"known", "a", "b"}
+
+
+def test_transaction_is_credited_to_every_tracked_address():
+    sender = BitcoinAddressFactory()
+    receiver = BitcoinAddressFactory()
+    shared = dict(
+        tx_data("shared"),
+        legs={
+            sender.address: {"amount_sats": -70000, "is_sending": True},
+            receiver.address: {"amount_sats": 50000, "is_sending": False},
+            "1Untracked": {"amount_sats": 20000, "is_sending": False},
+        },
+    )
+
+    assert ingest_transactions(sender, [shared]) == 1
+    # Fetching it again for the other address adds nothing
+    assert ingest_transactions(receiver, [shared]) == 0
+
+    assert Transaction.objects.count() == 1
+    assert TransactionLeg.objects.count() == 2  # noqa: PLR2004
+    leg = receiver.legs.get()
+    assert leg.amount_sats == 50000  # noqa: PLR2004
+    assert not leg.is_sending
+
+
+def test_confirmation_updates_a_transaction_stored_unconfirmed():
+    address = BitcoinAddressFactory()
+    ingest_transactions(address, [dict(tx_data("pending"), block_height=None)])
+    assert Transaction.objects.get(tx_hash="pending").block_height is None
+
+    assert ingest_transactions(address, [dict(tx_data("pending"), block_height=800000)]) == 0
+
+    assert Transaction.objects.get(tx_hash="pending").block_height == 800000  # noqa: PLR2004
+
+
+def test_duplicate_hashes_within_page():
+    address = BitcoinAddressFactory()
+    assert ingest_transactions(address, [tx_data("a"), tx_data("a")]) == 1
+    assert ingest_transactions(address, []) == 0
+
+
+def test_stream_is_ingested_in_batches(django_assert_num_queries):
+    address = BitcoinAddressFactory(latest_block_height=None)
+    transactions = (dict(tx_data(f"tx{n}"), block_height=800000 - n) for n in range(5))
+
+    # Sixteen queries per batch of two, never the whole stream at once
+    with django_assert_num_queries(48):
+        summary = ingest_transaction_stream(address, transactions, batch_size=2)
+
+    assert summary["fetched"] == summary["new"] == 5  # noqa: PLR2004
+    assert not summary["reached_known"]
+    assert [tx["hash"] for tx in summary["high_water"]] == ["tx0", "tx0"]
+    assert address.transactions.count() == 5  # noqa: PLR2004
+
+
+def test_overlapping_pages_count_only_new_transactions():
+    address = BitcoinAddressFactory()
+    ingest_transaction_stream(address, [tx_data(f"tx{n}") for n in range(4)])
+
+    # The next page re-reads two stored rows, as a cursor margin or range overlap does
+    summary = ingest_transaction_stream(address, [tx_data(f"tx{n}") for n in range(2, 6)])
+
+    assert (summary["fetched"], summary["new"]) == (4, 2)
+    assert address.legs.count() == 6  # noqa: PLR2004
+
@@ -0,0 +1,79 @@
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from wallet.ingest import ingest_transactions
+from wallet.models import TransactionLeg
+from wallet.pagination import InvalidCursor
+from wallet.pagination import KeysetPaginator
+from wallet.tests.factories import BitcoinAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def paginator():
+    address = BitcoinAddressFactory()
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    # Two transactions share a timestamp so the id tie-break is exercised
+    times = [start, start + timedelta(hours=1), start + timedelta(hours=1), start + timedelta(hours=2), start + timedelta(hours=3)]
+    ingest_transactions(
+        address,
+        [
+            {"hash": f"tx{n}", "amount_sats": 1000, "timestamp": timestamp, "is_sending": False}
+            for n, timestamp in enumerate(times)
+        ],
+    )
+    return KeysetPaginator(TransactionLeg.objects.filter(address=address), 2, estimated_total=5)
+
+
+def hashes(page):
+    return [leg.transaction.tx_hash for leg in page]
+
+
+def test_walks_forward_and_back(paginator):
+    first = paginator.page()
+    assert hashes(first) == ["tx4", "tx3"]
+    assert not first.has_previous
+
+    second = paginator.page(after=first.next_cursor)
+    third = paginator.page(after=second.next_cursor)
+    assert hashes(second) == ["tx2", "tx1"]
+    assert hashes(third) == ["tx0"]
+    assert not third.has_next
+
+    assert hashes(paginator.page(before=third.previous_cursor)) == ["tx2", "tx1"]
+    back = paginator.page(before=second.previous_cursor)
+    assert hashes(back) == ["tx4", "tx3"]
+    assert not back.has_previous
+
+
+def test_deep_page_is_one_query(paginator, django_assert_num_queries):
+    cursor = paginator.page(after=paginator.page().next_cursor).next_cursor
+    with django_assert_num_queries(1):
+        paginator.page(after=cursor)
+
+
+@pytest.mark.parametrize("direction", ["after", "before"])
+def test_seek_is_bounded_on_the_index(paginator, direction):
+    cursor = paginator.page(after=paginator.page().next_cursor).next_cursor
+    with CaptureQueriesContext(connection) as queries:
+        paginator.page(**{direction: cursor})
+
+    sql = queries[0]["sql"]
+    # A range on the timestamp column, beside the OR that breaks the tie on id
+    assert ('"timestamp" <=' if direction == "after" else '"timestamp" >=') in sql
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+        assert "wallet_leg_address_time_id_idx (address_id=? AND timestamp" in plan
+
+
+def test_invalid_cursor(paginator):
+    with pytest.raises(InvalidCursor):
+        paginator.page(after="not-a-cursor")
@@ -0,0 +1,44 @@
+from datetime import UTC
+from datetime import datetime
+
+import pytest
+from django.utils import timezone
+
+from wallet.ingest import ingest_transactions
+from wallet.portfolio import get_portfolio
+from wallet.portfolio import invalidate_portfolios
+from wallet.tests.factories import WatchedAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_rollup_totals(user):
+    first = WatchedAddressFactory(user=user, address__balance_sats=1000, address__transaction_count=2).address
+    WatchedAddressFactory(user=user, address__balance_sats=500, address__transaction_count=1)
+    ingest_transactions(
+        first,
+        [
+            {"hash": "new", "amount_sats": 300, "timestamp": timezone.now(), "is_sending": False},
+            {"hash": "old", "amount_sats": 700, "timestamp": datetime(2020, 1, 1, tzinfo=UTC), "is_sending": False},
+        ],
+    )
+
+    portfolio = get_portfolio(user.id)
+
+    assert portfolio["total_balance_sats"] == 1500  # noqa: PLR2004
+    assert portfolio["total_transactions"] == 3  # noqa: PLR2004
+    assert portfolio["net_flow_24h_sats"] == portfolio["net_flow_7d_sats"] == 300  # noqa: PLR2004
+    assert portfolio["never_synced"] == 2  # noqa: PLR2004
+
+
+def test_cached_until_a_watched_address_changes(user, django_assert_num_queries):
+    address = WatchedAddressFactory(user=user, address__balance_sats=1000).address
+    get_portfolio(user.id)
+
+    with django_assert_num_queries(0):
+        assert get_portfolio(user.id)["total_balance_sats"] == 1000  # noqa: PLR2004
+
+    address.balance_sats = 2000
+    address.save()
+    invalidate_portfolios(address_ids=[address.id])
+    assert get_portfolio(user.id)["total_balance_sats"] == 2000  # noqa: PLR2004
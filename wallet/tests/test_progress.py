@@ -0,0 +1,135 @@
+from datetime import UTC
+from datetime import datetime
+from unittest import mock
+
+import pytest
+from django.urls import reverse
+
+from wallet.models import BitcoinAddress
+from wallet.progress import get_progress
+from wallet.progress import record_page
+from wallet.progress import start_progress
+from wallet.services import BlockchainInfoAPI
+from wallet.tasks import enqueue_sync
+from wallet.tasks import fetch_transaction_page
+from wallet.tasks import sync_bitcoin_address
+from wallet.tests.factories import BitcoinAddressFactory
+from wallet.tests.factories import WatchedAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def history(count):
+    return [
+        {
+            "hash": f"tx{n}",
+            "amount_sats": 1000,
+            "timestamp": datetime(2024, 1, 1, tzinfo=UTC),
+            "block_height": 800000 - n,
+            "is_sending": False,
+        }
+        for n in range(count)
+    ]
+
+
+def test_sync_chain_publishes_pages_and_completion():
+    address = BitcoinAddressFactory()
+    transactions = history(25)
+
+    def iter_transactions(address, limit=50, offset=0):
+        return iter(transactions[offset : offset + limit])
+
+    with (
+        mock.patch.object(BlockchainInfoAPI, "get_address_info", return_value={"balance_sats": 0, "tx_count": 25}),
+        mock.patch.object(fetch_transaction_page, "delay"),
+    ):
+        sync_bitcoin_address(address.id, fetch_transactions=True)
+    progress = get_progress(address.id)
+    assert (progress["kind"], progress["state"], progress["expected"]) == ("history", "running", 25)
+
+    with (
+        mock.patch.object(BlockchainInfoAPI, "iter_transactions", side_effect=iter_transactions),
+        mock.patch.object(fetch_transaction_page, "apply_async"),
+    ):
+        fetch_transaction_page(address.id, 0, pages_left=2)
+        assert get_progress(address.id)["fetched"] == 20  # noqa: PLR2004
+        fetch_transaction_page(address.id, 1, pages_left=1)
+
+    # The second page follows on from the first without re-reading any stored rows
+    progress = get_progress(address.id)
+    assert (progress["state"], progress["pages"], progress["fetched"], progress["inserted"]) == ("done", 2, 25, 25)
+    assert progress["eta_seconds"] is None
+
+
+def test_missing_page_marks_the_sync_failed():
+    address = BitcoinAddressFactory()
+    with mock.patch.object(BlockchainInfoAPI, "get_address_info", return_value=None):
+        sync_bitcoin_address(address.id)
+    progress = get_progress(address.id)
+    assert (progress["state"], progress["error"]) == ("failed", "No provider returned the address's balance")
+
+    with mock.patch.object(BlockchainInfoAPI, "iter_transactions", return_value=None):
+        fetch_transaction_page(address.id, 0)
+
+    progress = get_progress(address.id)
+    assert (progress["state"], progress["error"]) == ("failed", "No provider returned page 1")
+
+
+def test_status_long_poll_answers_304_until_progress_changes(client, user, settings):
+    settings.WALLET_PROGRESS_POLL_INTERVAL = 0
+    watch = WatchedAddressFactory(user=user)
+    client.force_login(user)
+    url = reverse("wallet:sync_status", args=[watch.pk])
+    with mock.patch.object(sync_bitcoin_address, "apply_async"):
+        enqueue_sync(watch.address_id, fetch_transactions=True)
+
+    first = client.get(url)
+    assert first.json()["sync"]["state"] == "queued"
+    assert first.json()["address"]["transaction_count"] == watch.address.transaction_count
+
+    unchanged = client.get(url, {"wait": "0.05"}, headers={"If-None-Match": first["ETag"]})
+    assert unchanged.status_code == 304  # noqa: PLR2004
+    assert unchanged["ETag"] == first["ETag"]
+
+    start_progress(watch.address_id, "history", expected=40)
+    record_page(watch.address_id, 20, 3)
+    changed = client.get(url, {"wait": "0.05"}, headers={"If-None-Match": first["ETag"]})
+    assert changed["ETag"] != first["ETag"]
+    assert (changed.json()["progress"]["fetched"], changed.json()["progress"]["inserted"]) == (20, 3)
+
+
+def test_status_etag_changes_with_the_balance(client, user, settings):
+    settings.WALLET_PROGRESS_POLL_INTERVAL = 0
+    watch = WatchedAddressFactory(user=user)
+    client.force_login(user)
+    url = reverse("wallet:sync_status", args=[watch.pk])
+    first = client.get(url)
+
+    # A balance written without any published progress, or first read from a lagging replica
+    BitcoinAddress.objects.filter(id=watch.address_id).update(balance_sats=5000)
+    changed = client.get(url, {"wait": "0.05"}, headers={"If-None-Match": first["ETag"]})
+
+    assert changed.status_code == 200  # noqa: PLR2004
+    assert changed.json()["address"]["balance_sats"] == 5000  # noqa: PLR2004
+
+
+def test_status_long_poll_returns_as_soon_as_progress_changes(client, user, settings):
+    settings.WALLET_PROGRESS_LONG_POLL_SECONDS = 30
+    watch = WatchedAddressFactory(user=user)
+    client.force_login(user)
+    url = reverse("wallet:sync_status", args=[watch.pk])
+    with mock.patch.object(sync_bitcoin_address, "apply_async"):
+        enqueue_sync(watch.address_id, fetch_transactions=True)
+    first = client.get(url)
+
+    # The sync publishes a page while the request waits
+    def publish(seconds):
+        start_progress(watch.address_id, "history", expected=40)
+        record_page(watch.address_id, 20, 3)
+
+    with mock.patch("wallet.views.time.sleep", side_effect=publish) as sleep:
+        changed = client.get(url, {"wait": "30"}, headers={"If-None-Match": first["ETag"]})
+
+    assert changed.status_code == 200  # noqa: PLR2004
+    assert changed.json()["progress"]["fetched"] == 20  # noqa: PLR2004
+    assert sleep.call_count == 1
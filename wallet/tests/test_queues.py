@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+from config.celery_app import app
+from wallet.queues import configure_worker
+from wallet.queues import route_task
+
+
+@pytest.mark.parametrize(
+    ("name", "kwargs", "queue"),
+    [
+        ("wallet.tasks.sync_bitcoin_address", {"fetch_transactions": False}, "interactive"),
+        ("wallet.tasks.sync_bitcoin_address", {"fetch_transactions": True, "incremental": True}, "incremental"),
+        ("wallet.tasks.sync_bitcoin_address", {"fetch_transactions": True, "reset_page": True}, "backfill"),
+        ("wallet.tasks.fetch_transaction_page", {"incremental": False}, "backfill"),
+        ("wallet.tasks.sync_address_balances", {"user_id": 1}, "interactive"),
+        ("wallet.tasks.sync_address_balances", {"address_ids": [1]}, "incremental"),
+        ("wallet.tasks.refresh_chain_tip", None, "interactive"),
+    ],
+)
+def test_tasks_are_routed_by_what_they_fetch(name, kwargs, queue):
+    assert route_task(name, (), kwargs, {})["queue"] == queue
+
+
+def test_chain_pages_go_ahead_of_new_syncs_on_their_queue():
+    page = route_task("wallet.tasks.fetch_transaction_page", (1, 2), {"incremental": True}, {})
+    start = route_task("wallet.tasks.sync_bitcoin_address", (1,), {"fetch_transactions": True, "incremental": True}, {})
+
+    assert page["priority"] < start["priority"]
+
+
+def test_app_router_applies_wallet_routes():
+    options = app.amqp.router.route({}, "wallet.tasks.sync_bitcoin_address", (1,), {"fetch_transactions": False})
+
+    assert options["queue"].name == "interactive"
+    assert app.amqp.router.route({}, "some.other.task", (), {})["queue"].name == "celery"
+
+
+def test_single_queue_worker_takes_its_queue_limits(settings):
+    conf = SimpleNamespace(worker_concurrency=None, task_time_limit=300, task_soft_time_limit=60)
+
+    assert configure_worker(conf, ["backfill"]) == "backfill"
+    assert conf.worker_concurrency == settings.WALLET_TASK_QUEUES["backfill"]["concurrency"]
+    assert conf.task_time_limit == settings.WALLET_TASK_QUEUES["backfill"]["time_limit"]
+
+    shared = SimpleNamespace(worker_concurrency=None, task_time_limit=300, task_soft_time_limit=60)
+    assert configure_worker(shared, "interactive,backfill") is None
+    assert shared.task_time_limit == 300  # noqa: PLR2004
@@ -0,0 +1,47 @@
+from unittest import mock
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from wallet.ratelimit import RateLimitExceeded
+from wallet.ratelimit import TokenBucket
+from wallet.services import BlockchairAPI
+
+
+@pytest.fixture
+def rate_limits(settings):
+    settings.WALLET_RATE_LIMITS = {
+        "blockchair": {"rate": 1.0, "capacity": 2},
+        "blockchain_info": {"rate": 1.0, "capacity": 2},
+    }
+
+
+@pytest.mark.usefixtures("rate_limits")
+class TestTokenBucket:
+    def test_burst_then_wait(self):
+        bucket = TokenBucket("blockchair")
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0
+        assert 0 < bucket.acquire() <= 1
+
+    def test_buckets_are_per_api_key(self):
+        TokenBucket("blockchair", "key-a").acquire(2)
+        assert TokenBucket("blockchair", "key-a").acquire() > 0
+        assert TokenBucket("blockchair", "key-b").acquire() == 0
+
+    def test_api_key_not_in_redis_key(self):
+        assert "secret" not in TokenBucket("blockchair", "secret").key
+
+    def test_fails_open_without_redis(self):
+        client = mock.Mock()
+        client.eval.side_effect = RedisConnectionError("down")
+        with mock.patch("wallet.ratelimit.get_redis", return_value=client):
+            assert TokenBucket("blockchair").acquire() == 0
+
+
+@pytest.mark.usefixtures("rate_limits")
+def test_provider_raises_instead_of_sleeping():
+    TokenBucket("blockchair", BlockchairAPI.API_KEY).acquire(2)
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        BlockchairAPI.get_address_info("addr1")
+    assert excinfo.value.retry_after > 0
@@ -0,0 +1,114 @@
+import time
+from unittest import mock
+
+import pytest
+
+from wallet.ratelimit import RateLimitExceeded
+from wallet.ratelimit import TokenBucket
+from wallet.routing import ProviderRouter
+from wallet.services import BlockchainInfoAPI
+from wallet.services import BlockchairAPI
+
+INFO = {"balance_sats": 100000000, "tx_count": 2}
+
+
+@pytest.fixture
+def router():
+    return ProviderRouter(["blockchain_info", "blockchair"])
+
+
+def patch_info(api, **kwargs):
+    return mock.patch.object(api, "get_address_info", **kwargs)
+
+
+def test_prefers_first_provider(router):
+    with (
+        patch_info(BlockchainInfoAPI, return_value=INFO),
+        patch_info(BlockchairAPI) as blockchair,
+    ):
+        assert router.get_address_info("addr") == INFO
+    blockchair.assert_not_called()
+
+
+def test_fails_over_on_error(router):
+    with (
+        patch_info(BlockchainInfoAPI, return_value=None),
+        patch_info(BlockchairAPI, return_value=INFO),
+    ):
+        assert router.get_address_info("addr") == INFO
+    assert router.health["blockchain_info"].consecutive_failures == 1
+    # The failing backend drops behind the healthy one
+    assert [api.PROVIDER for api in router.ranked("get_address_info")] == ["blockchair", "blockchain_info"]
+
+
+def test_fails_over_on_rate_limit(router):
+    with (
+        patch_info(BlockchainInfoAPI, side_effect=RateLimitExceeded("blockchain_info", 30)),
+        patch_info(BlockchairAPI, return_value=INFO),
+    ):
+        assert router.get_address_info("addr") == INFO
+    assert not router.health["blockchain_info"].available
+
+
+def test_raises_soonest_rate_limit_when_all_limited(router):
+    with (
+        patch_info(BlockchainInfoAPI, side_effect=RateLimitExceeded("blockchain_info", 30)),
+        patch_info(BlockchairAPI, side_effect=RateLimitExceeded("blockchair", 5)),
+        pytest.raises(RateLimitExceeded) as excinfo,
+    ):
+        router.get_address_info("addr")
+    assert excinfo.value.retry_after == 5  # noqa: PLR2004
+
+
+def test_hedges_slow_primary(router, settings):
+    settings.WALLET_HEDGE_PERCENTILE = 95
+    settings.WALLET_HEDGE_MIN_SAMPLES = 1
+    router.health["blockchain_info"].record_success(0.01)
+    hedged = {"balance_sats": 200000000, "tx_count": 2}
+
+    def slow_primary(address):
+        time.sleep(0.5)
+        return INFO
+
+    with (
+        patch_info(BlockchainInfoAPI, side_effect=slow_primary),
+        patch_info(BlockchairAPI, return_value=hedged),
+    ):
+        assert router.get_address_info("addr") == hedged
+
+
+def test_skips_hedge_when_secondary_bucket_is_low(router, settings):
+    settings.WALLET_HEDGE_PERCENTILE = 95
+    settings.WALLET_HEDGE_MIN_SAMPLES = 1
+    router.health["blockchain_info"].record_success(0.01)
+    TokenBucket("blockchair").acquire(tokens=settings.WALLET_RATE_LIMITS["blockchair"]["capacity"])
+
+    def slow_primary(address):
+        time.sleep(0.1)
+        return INFO
+
+    with (
+        patch_info(BlockchainInfoAPI, side_effect=slow_primary),
+        patch_info(BlockchairAPI) as blockchair,
+    ):
+        assert router.get_address_info("addr") == INFO
+    blockchair.assert_not_called()
+
+
+def test_closes_the_losing_hedge_stream(router, settings):
+    settings.WALLET_HEDGE_PERCENTILE = 95
+    settings.WALLET_HEDGE_MIN_SAMPLES = 1
+    router.health["blockchain_info"].record_success(0.01)
+    losing = mock.Mock()
+
+    def slow_primary(address, limit=50, offset=0):
+        time.sleep(0.3)
+        return losing
+
+    with (
+        mock.patch.object(BlockchainInfoAPI, "iter_transactions", side_effect=slow_primary),
+        mock.patch.object(BlockchairAPI, "iter_transactions", return_value=iter([])),
+    ):
+        router.iter_transactions("addr")
+        time.sleep(0.5)
+    losing.close.assert_called_once()
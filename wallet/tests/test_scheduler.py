@@ -0,0 +1,93 @@
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from wallet.ingest import ingest_transactions
+from wallet.models import BitcoinAddress
+from wallet.scheduler import get_last_run
+from wallet.scheduler import next_interval
+from wallet.scheduler import plan_syncs
+from wallet.services import BlockchainInfoAPI
+from wallet.tasks import schedule_syncs
+from wallet.tasks import sync_bitcoin_address
+from wallet.tests.factories import BitcoinAddressFactory
+from wallet.tests.factories import WatchedAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_interval_backs_off_while_dormant_and_resets_on_activity(settings):
+    settings.WALLET_SYNC_INTERVAL_MIN = 300
+    settings.WALLET_SYNC_INTERVAL_MAX = 1000
+    settings.WALLET_SYNC_BACKOFF = 2.0
+
+    assert next_interval(300, changed=False) == 600  # noqa: PLR2004
+    assert next_interval(600, changed=False) == 1000  # noqa: PLR2004
+    assert next_interval(1000, changed=True) == 300  # noqa: PLR2004
+
+
+def test_plan_prefers_active_and_shared_addresses_within_budget():
+    now = timezone.now()
+    synced = now - timedelta(hours=1)
+    dormant = WatchedAddressFactory(address__last_synced=synced).address
+    active = WatchedAddressFactory(address__last_synced=synced).address
+    ingest_transactions(
+        active,
+        [{"hash": "recent", "amount_sats": 1000, "timestamp": now, "is_sending": False}],
+    )
+    shared = WatchedAddressFactory(address__last_synced=synced).address
+    WatchedAddressFactory(address=shared)
+    WatchedAddressFactory(address__next_sync_at=now + timedelta(minutes=5))
+    BitcoinAddressFactory()  # no watchers
+
+    decisions = plan_syncs(now=now, budget=2)
+
+    assert [decision["address_id"] for decision in decisions][2:] == [dormant.id]
+    assert {decision["address_id"] for decision in decisions if decision["selected"]} == {active.id, shared.id}
+
+
+def test_schedule_syncs_leases_enqueues_and_records(settings):
+    settings.WALLET_SYNC_SCHEDULE_SECONDS = 300
+    settings.WALLET_SYNC_BUDGET_SHARE = 0.1  # 3 of the 30 requests blockchain.info allows per run
+    WatchedAddressFactory.create_batch(4)
+
+    with mock.patch.object(sync_bitcoin_address, "apply_async") as apply_async:
+        schedule_syncs()
+
+    assert [call.kwargs["countdown"] for call in apply_async.call_args_list] == [0, 100, 200]
+    assert BitcoinAddress.objects.filter(next_sync_at__isnull=False).count() == 3  # noqa: PLR2004
+    run = get_last_run()
+    assert (run["due"], run["selected"], run["budget"]) == (4, 3, 3)
+
+    # Leased addresses are not due again on the next run
+    with mock.patch.object(sync_bitcoin_address, "apply_async") as apply_async:
+        schedule_syncs()
+    assert apply_async.call_count == 1
+
+
+def test_sync_backs_off_dormant_address(settings):
+    settings.WALLET_SYNC_INTERVAL_MIN = 300
+    address = BitcoinAddressFactory(transaction_count=2, sync_interval=300)
+    with mock.patch.object(
+        BlockchainInfoAPI,
+        "get_address_info",
+        return_value={"balance_sats": 0, "tx_count": 2},
+    ):
+        sync_bitcoin_address(address.id)
+
+    address.refresh_from_db()
+    assert address.sync_interval == 600  # noqa: PLR2004
+    assert timedelta(seconds=599) < address.next_sync_at - address.last_synced <= timedelta(seconds=600)
+
+
+def test_sync_schedule_command_shows_plan(capsys):
+    watch = WatchedAddressFactory(address__last_synced=datetime(2024, 1, 1, tzinfo=UTC))
+
+    call_command("sync_schedule", "--plan")
+
+    assert watch.address.address in capsys.readouterr().out
@@ -0,0 +1,139 @@
+import io
+import json
+from unittest import mock
+
+import pytest
+import requests
+
+from wallet.services import BlockchairAPI
+from wallet.services import BlockchainInfoAPI
+from wallet.services import ProviderStreamError
+from wallet.services import get_session
+from wallet.services import http_get
+
+
+class TestBlockchainInfoAPI:
+    def test_get_balances_sends_pipe_separated_addresses(self):
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {
+            "addr1": {"final_balance": 150000000, "n_tx": 3},
+            "addr2": {"final_balance": 0, "n_tx": 0},
+        }
+        with mock.patch.object(requests.Session, "get", return_value=response) as get:
+            balances = BlockchainInfoAPI.get_balances(["addr1", "addr2"])
+
+        assert get.call_args.kwargs["params"] == {"active": "addr1|addr2"}
+        assert balances["addr1"] == {"balance_sats": 150000000, "tx_count": 3}
+        assert balances["addr2"]["tx_count"] == 0
+
+    def test_get_balances_returns_none_on_error(self):
+        response = mock.Mock(status_code=500, text="boom")
+        with mock.patch.object(requests.Session, "get", return_value=response):
+            assert BlockchainInfoAPI.get_balances(["addr1"]) is None
+
+    def test_iter_transactions_streams_the_body(self):
+        body = {
+            "n_tx": 2,
+            "txs": [
+                {
+                    "hash": f"tx{n}",
+                    "time": 1704067200,
+                    "block_height": 800000 - n,
+                    "inputs": [],
+                    "out": [{"addr": "addr1", "value": 1000}],
+                }
+                for n in range(2)
+            ],
+        }
+        response = mock.Mock(status_code=200, raw=io.BytesIO(json.dumps(body).encode()))
+        with mock.patch.object(requests.Session, "get", return_value=response) as get:
+            transactions = BlockchainInfoAPI.iter_transactions("addr1", limit=2)
+            # Nothing is parsed until the generator is consumed
+            assert response.close.call_count == 0
+            assert [tx["hash"] for tx in transactions] == ["tx0", "tx1"]
+
+        assert get.call_args.kwargs["stream"] is True
+        response.close.assert_called_once()
+
+    def test_truncated_stream_raises_provider_stream_error(self):
+        response = mock.Mock(status_code=200, raw=io.BytesIO(b'{"txs": [{"hash": "tx0", '))
+        with mock.patch.object(requests.Session, "get", return_value=response):
+            transactions = BlockchainInfoAPI.iter_transactions("addr1")
+            with pytest.raises(ProviderStreamError) as excinfo:
+                list(transactions)
+
+        assert excinfo.value.provider == "blockchain_info"
+        response.close.assert_called_once()
+
+
+    def test_unexpected_item_raises_provider_stream_error(self):
+        payload = b'{"data": {"addr1": {"transactions": [{"hash": "tx0", "time": "2024-01-01 00:00:00"}]}}}'
+        response = mock.Mock(status_code=200, raw=io.BytesIO(payload))
+        with mock.patch.object(requests.Session, "get", return_value=response):
+            transactions = BlockchairAPI.iter_transactions("addr1")
+            # No inputs or outputs: the parser cannot make sense of it
+            with pytest.raises(ProviderStreamError) as excinfo:
+                list(transactions)
+
+        assert excinfo.value.provider == "blockchair"
+        response.close.assert_called_once()
+
+
+class TestHttpSessions:
+    def test_session_is_reused_per_provider(self):
+        assert get_session("blockchain_info") is get_session("blockchain_info")
+        assert get_session("blockchain_info") is not get_session("blockchair")
+
+    def test_pool_is_sized_from_settings(self, settings, monkeypatch):
+        monkeypatch.setattr("wallet.services._sessions", {})
+        settings.WALLET_HTTP_POOL_MAXSIZE = 3
+        adapter = get_session("blockchair").get_adapter("https://api.blockchair.com")
+        assert adapter._pool_maxsize == 3  # noqa: SLF001, PLR2004
+
+    def test_requests_use_timeouts(self, settings):
+        settings.WALLET_HTTP_CONNECT_TIMEOUT = 1.0
+        settings.WALLET_HTTP_READ_TIMEOUT = 2.0
+        with mock.patch.object(requests.Session, "get") as get:
+            http_get("blockchair", "https://api.blockchair.com/bitcoin/stats")
+        assert get.call_args.kwargs["timeout"] == (1.0, 2.0)
+
+
+def test_parse_transactions_keeps_integer_satoshis():
+    data = {
+        "txs": [
+            {
+                "hash": "big",
+                "time": 1704067200,
+                "block_height": 800000,
+                "inputs": [],
+                # Float division by 1e8 cannot represent this exactly
+                "out": [{"addr": "addr1", "value": 2099999997690001}],
+            },
+        ],
+    }
+    (tx,) = BlockchainInfoAPI.parse_transactions(data, "addr1")
+    assert tx["amount_sats"] == 2099999997690001  # noqa: PLR2004
+    assert isinstance(tx["amount_sats"], int)
+
+
+def test_parse_transactions_builds_a_leg_per_address():
+    data = {
+        "txs": [
+            {
+                "hash": "pay",
+                "time": 1704067200,
+                "inputs": [{"prev_out": {"addr": "addr1", "value": 70000}}],
+                "out": [
+                    {"addr": "addr2", "value": 50000},
+                    {"addr": "addr1", "value": 19000},
+                ],
+            },
+        ],
+    }
+    (tx,) = BlockchainInfoAPI.parse_transactions(data, "addr2")
+    assert tx["amount_sats"] == 50000  # noqa: PLR2004
+    assert tx["legs"] == {
+        # The change output back to addr1 is netted out of its leg
+        "addr1": {"amount_sats": -51000, "is_sending": True},
+        "addr2": {"amount_sats": 50000, "is_sending": False},
+    }
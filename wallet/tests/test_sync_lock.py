@@ -0,0 +1,112 @@
+from unittest import mock
+
+import pytest
+from django.urls import reverse
+
+from wallet.progress import get_progress
+from wallet.services import BlockchainInfoAPI
+from wallet.sync_lock import ACQUIRED
+from wallet.sync_lock import COALESCED
+from wallet.sync_lock import PENDING
+from wallet.sync_lock import finish_sync
+from wallet.sync_lock import get_sync_state
+from wallet.sync_lock import request_sync
+from wallet.tasks import enqueue_sync
+from wallet.tasks import fetch_transaction_page
+from wallet.tasks import sync_bitcoin_address
+from wallet.tests.factories import BitcoinAddressFactory
+from wallet.tests.factories import WatchedAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+
+def test_requests_covered_by_the_inflight_sync_are_coalesced():
+    status, token = request_sync(1, fetch_transactions=True)
+
+    assert (status, bool(token)) == (ACQUIRED, True)
+    assert request_sync(1) == (COALESCED, None)
+    assert request_sync(1, fetch_transactions=True, incremental=True) == (COALESCED, None)
+    assert get_sync_state(1)["state"] == "queued"
+    assert get_sync_state(2) is None
+
+
+def test_uncovered_requests_merge_into_one_follow_up():
+    _, token = request_sync(1)
+
+    assert request_sync(1, fetch_transactions=True, incremental=True) == (PENDING, None)
+    assert request_sync(1, fetch_transactions=True) == (PENDING, None)
+    assert get_sync_state(1)["pending"] is True
+
+    follow_up_token, options = finish_sync(1, token)
+    assert options == {"fetch_transactions": True, "reset_page": False, "incremental": False}
+    assert finish_sync(1, token) is None  # a stale token cannot release the follow-up
+    assert finish_sync(1, follow_up_token) is None
+    assert get_sync_state(1) is None
+
+
+def test_sync_chain_holds_the_lock_until_its_last_page():
+    address = BitcoinAddressFactory()
+    with mock.patch.object(sync_bitcoin_address, "apply_async") as apply_async:
+        assert enqueue_sync(address.id, fetch_transactions=True) == ACQUIRED
+        assert enqueue_sync(address.id, fetch_transactions=True) == COALESCED
+    token = apply_async.call_args.args[1]["lock_token"]
+
+    with (
+        mock.patch.object(BlockchainInfoAPI, "get_address_info", return_value=None),
+        mock.patch.object(fetch_transaction_page, "delay") as delay,
+    ):
+        sync_bitcoin_address(address.id, fetch_transactions=True, lock_token=token)
+    assert delay.call_args.kwargs["lock_token"] == token
+    assert get_sync_state(address.id)["state"] == "running"
+
+    with mock.patch.object(BlockchainInfoAPI, "get_transactions", return_value=[]):
+        fetch_transaction_page(address.id, 0, lock_token=token)
+    assert get_sync_state(address.id) is None
+
+
+def test_chain_stops_when_its_lock_was_taken_over():
+    address = BitcoinAddressFactory()
+    request_sync(address.id)
+
+    with mock.patch.object(BlockchainInfoAPI, "get_transactions") as get_transactions:
+        fetch_transaction_page(address.id, 0, lock_token="expired")
+
+    get_transactions.assert_not_called()
+
+
+def test_repeated_ajax_sync_reports_coalescing(client, user):
+    watch = WatchedAddressFactory(user=user)
+    client.force_login(user)
+    url = reverse("wallet:sync_address", args=[watch.pk]) + "?fetch_transactions=true"
+
+    with mock.patch.object(sync_bitcoin_address, "apply_async") as apply_async:
+        first = client.get(url, headers={"X-Requested-With": "XMLHttpRequest"}).json()
+        second = client.get(url, headers={"X-Requested-With": "XMLHttpRequest"}).json()
+
+    apply_async.assert_called_once()
+    assert (first["status"], second["status"]) == (ACQUIRED, COALESCED)
+    assert second["sync"]["fetch_transactions"] is True
+
+
+def test_failed_sync_releases_its_lock():
+    address = BitcoinAddressFactory()
+    _, token = request_sync(address.id, fetch_transactions=True)
+    assert request_sync(address.id) == (COALESCED, None)
+
+    with mock.patch.object(BlockchainInfoAPI, "get_address_info", side_effect=ValueError("bad payload")):
+        result = sync_bitcoin_address.apply((address.id,), {"fetch_transactions": True, "lock_token": token})
+
+    assert result.failed()
+    assert get_sync_state(address.id) is None
+    assert get_progress(address.id)["error"] == "Sync failed: bad payload"
+
+
+def test_address_list_shows_syncs_in_flight(client, user):
+    watch = WatchedAddressFactory(user=user)
+    request_sync(watch.address_id)
+    client.force_login(user)
+
+    response = client.get(reverse("wallet:address_list"))
+
+    assert response.context["sync_states"][watch.address_id]["state"] == "queued"
+    assert b"Queued</span>" in response.content
@@ -0,0 +1,381 @@
+from datetime import UTC
+from datetime import datetime
+from unittest import mock
+
+import pytest
+from celery.exceptions import Retry
+
+from wallet.ratelimit import RateLimitExceeded
+from wallet.progress import get_progress
+from wallet.progress import start_progress
+from wallet.routing import get_provider_router
+from wallet.services import BlockchainInfoAPI
+from wallet.services import ProviderStreamError
+from wallet.sync_lock import get_sync_state
+from wallet.sync_lock import request_sync
+from wallet.ingest import ingest_transactions
+from wallet.chain import get_chain_tip
+from wallet.tasks import fetch_transaction_page
+from wallet.tasks import refresh_chain_tip
+from wallet.tasks import sync_address_balances
+from wallet.tasks import sync_bitcoin_address
+from wallet.tests.factories import BitcoinAddressFactory
+from wallet.tests.factories import WatchedAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class TestSyncAddressBalances:
+    def test_one_request_per_chunk(self, user, monkeypatch):
+        monkeypatch.setattr(BlockchainInfoAPI, "BALANCE_BATCH_SIZE", 2)
+        addresses = [watch.address for watch in WatchedAddressFactory.create_batch(3, user=user)]
+
+        def fake_get_balances(batch):
+            return {a: {"balance_sats": 150000000, "tx_count": 7} for a in batch}
+
+        with mock.patch.object(
+            BlockchainInfoAPI,
+            "get_balances",
+            side_effect=fake_get_balances,
+        ) as get_balances:
+            sync_address_balances(user_id=user.id)
+
+        assert get_balances.call_count == 2  # noqa: PLR2004
+        for address in addresses:
+            address.refresh_from_db()
+            assert address.balance_sats == 150000000  # noqa: PLR2004
+            assert address.transaction_count == 7  # noqa: PLR2004
+            assert address.last_synced is not None
+
+    def test_shared_address_is_fetched_once(self, user):
+        address = WatchedAddressFactory(user=user).address
+        WatchedAddressFactory(address=address)
+
+        with mock.patch.object(
+            BlockchainInfoAPI,
+            "get_balances",
+            return_value={},
+        ) as get_balances:
+            sync_address_balances()
+
+        get_balances.assert_called_once_with([address.address])
+
+    def test_scoped_to_user(self, user):
+        mine = WatchedAddressFactory(user=user).address
+        WatchedAddressFactory()
+
+        with mock.patch.object(
+            BlockchainInfoAPI,
+            "get_balances",
+            return_value={},
+        ) as get_balances:
+            sync_address_balances(user_id=user.id)
+
+        get_balances.assert_called_once_with([mine.address])
+
+    def test_rate_limited_chunks_are_rescheduled(self, user, monkeypatch):
+        monkeypatch.setattr(BlockchainInfoAPI, "BALANCE_BATCH_SIZE", 1)
+        first, second = [watch.address for watch in WatchedAddressFactory.create_batch(2, user=user)]
+
+        with (
+            mock.patch.object(
+                BlockchainInfoAPI,
+                "get_balances",
+                side_effect=[
+                    {first.address: {"balance_sats": 100000000, "tx_count": 1}},
+                    RateLimitExceeded("blockchain_info", 5.0),
+                ],
+            ),
+            mock.patch.object(sync_address_balances, "apply_async") as apply_async,
+        ):
+            sync_address_balances(user_id=user.id)
+
+        apply_async.assert_called_once_with(
+            kwargs={"address_ids": [second.id]},
+            countdown=5.0,
+        )
+        first.refresh_from_db()
+        assert first.balance_sats == 100000000  # noqa: PLR2004
+
+
+def make_transactions(count, start=0):
+    """Newest-first page of parsed transactions, tx0 being the newest."""
+    return [
+        {
+            "hash": f"tx{n}",
+            "amount_sats": 10000000,
+            "timestamp": datetime(2024, 1, 1, tzinfo=UTC),
+            "block_height": 800000 - n,
+            "is_sending": False,
+        }
+        for n in range(start, start + count)
+    ]
+
+
+class TestFetchTransactionPage:
+    def test_stores_page_and_enqueues_next(self, user):
+        address = BitcoinAddressFactory()
+        with (
+            mock.patch.object(
+                BlockchainInfoAPI,
+                "iter_transactions",
+                return_value=iter(make_transactions(2)),
+            ),
+            mock.patch.object(fetch_transaction_page, "apply_async") as apply_async,
+        ):
+            fetch_transaction_page(address.id, 0, page_size=2, pages_left=3)
+
+        assert address.transactions.count() == 2  # noqa: PLR2004
+        address.refresh_from_db()
+        assert (address.history_cursor_hash, address.history_cursor_offset) == ("tx1", 2)
+        args, kwargs = apply_async.call_args
+        assert args == (
+            (address.id, 1),
+            {"page_size": 2, "pages_left": 2, "incremental": False, "lock_token": None},
+        )
+        assert kwargs["countdown"] > 0
+
+    def test_short_page_ends_chain(self, user):
+        address = BitcoinAddressFactory()
+        with (
+            mock.patch.object(
+                BlockchainInfoAPI,
+                "iter_transactions",
+                return_value=iter(make_transactions(1)),
+            ),
+            mock.patch.object(fetch_transaction_page, "apply_async") as apply_async,
+        ):
+            fetch_transaction_page(address.id, 0, page_size=2, pages_left=3)
+
+        apply_async.assert_not_called()
+
+    def test_rate_limit_reschedules_without_sleeping(self, user):
+        address = BitcoinAddressFactory()
+        with (
+            mock.patch.object(
+                BlockchainInfoAPI,
+                "iter_transactions",
+                side_effect=RateLimitExceeded("blockchain_info", 7.0),
+            ),
+            mock.patch.object(fetch_transaction_page, "retry", side_effect=Retry) as retry,
+            pytest.raises(Retry),
+        ):
+            fetch_transaction_page(address.id, 0)
+
+        retry.assert_called_once_with(countdown=7.0)
+
+    def test_stream_breaking_off_rolls_back_and_retries(self, user):
+        address = BitcoinAddressFactory()
+
+        def broken_stream():
+            # More than one ingest batch arrives before the body breaks off
+            yield from make_transactions(600)
+            raise ProviderStreamError("blockchain_info", "premature EOF")
+
+        with (
+            mock.patch.object(BlockchainInfoAPI, "iter_transactions", return_value=broken_stream()),
+            mock.patch.object(fetch_transaction_page, "retry", side_effect=Retry) as retry,
+            pytest.raises(Retry),
+        ):
+            fetch_transaction_page(address.id, 0)
+
+        retry.assert_called_once_with(countdown=1)
+        assert address.transactions.count() == 0
+        assert get_provider_router().health["blockchain_info"].consecutive_failures == 1
+
+    def test_stream_failing_on_last_retry_releases_the_sync(self, user):
+        address = BitcoinAddressFactory()
+        _, token = request_sync(address.id, fetch_transactions=True)
+        start_progress(address.id, "history")
+
+        def broken_stream():
+            raise ProviderStreamError("blockchain_info", "connection reset")
+            yield
+
+        with (
+            mock.patch.object(BlockchainInfoAPI, "iter_transactions", return_value=broken_stream()),
+            mock.patch.object(fetch_transaction_page, "max_retries", 0),
+        ):
+            fetch_transaction_page(address.id, 0, lock_token=token)
+
+        assert get_sync_state(address.id) is None
+        progress = get_progress(address.id)
+        assert (progress["state"], progress["error"]) == ("failed", "Page 1 failed: blockchain_info stream failed: connection reset")
+
+    def test_incremental_stops_at_known_transaction(self, user):
+        address = BitcoinAddressFactory(
+            history_cursor_hash="tx9",
+            history_cursor_offset=10,
+            latest_tx_hash="tx1",
+            latest_block_height=799999,
+        )
+        ingest_transactions(address, make_transactions(2, start=1))
+        with (
+            mock.patch.object(
+                BlockchainInfoAPI,
+                "iter_transactions",
+                return_value=iter(make_transactions(2)),
+            ),
+            mock.patch.object(fetch_transaction_page, "apply_async") as apply_async,
+        ):
+            fetch_transaction_page(address.id, 0, page_size=2, pages_left=3, incremental=True)
+
+        apply_async.assert_not_called()
+        address.refresh_from_db()
+        assert address.transactions.filter(tx_hash="tx0").exists()
+        assert address.latest_tx_hash == "tx0"
+        assert address.latest_block_height == 800000  # noqa: PLR2004
+        # The history cursor is left alone by incremental syncs
+        assert (address.history_cursor_hash, address.history_cursor_offset) == ("tx9", 10)
+
+    def test_incremental_continues_through_new_pages(self, user):
+        address = BitcoinAddressFactory()
+        ingest_transactions(address, make_transactions(1, start=10))
+        with (
+            mock.patch.object(
+                BlockchainInfoAPI,
+                "iter_transactions",
+                return_value=iter(make_transactions(2)),
+            ),
+            mock.patch.object(fetch_transaction_page, "apply_async") as apply_async,
+        ):
+            fetch_transaction_page(address.id, 0, page_size=2, pages_left=3, incremental=True)
+
+        apply_async.assert_called_once()
+
+
+    def test_incremental_walk_stores_every_page_above_the_old_mark(self, user):
+        history = make_transactions(10)
+        address = BitcoinAddressFactory()
+        # tx6 onwards was stored by the last walk; six new transactions arrived on top
+        ingest_transactions(address, history[6:])
+        address.latest_tx_hash, address.latest_block_height = "tx6", 799994
+        address.save()
+
+        def iter_transactions(address, limit=50, offset=0):
+            return iter(history[offset : offset + limit])
+
+        def run_chain():
+            with (
+                mock.patch.object(BlockchainInfoAPI, "iter_transactions", side_effect=iter_transactions),
+                mock.patch.object(fetch_transaction_page, "apply_async") as apply_async,
+            ):
+                fetch_transaction_page(address.id, 0, page_size=2, pages_left=5, incremental=True)
+                while apply_async.call_count:
+                    args, kwargs = apply_async.call_args.args
+                    apply_async.reset_mock()
+                    fetch_transaction_page(*args, **kwargs)
+
+        run_chain()
+
+        # Later pages compare against the mark the walk started from, not the one page 1 set
+        stored = set(address.transactions.values_list("tx_hash", flat=True))
+        assert stored == {f"tx{n}" for n in range(10)}
+        address.refresh_from_db()
+        assert (address.latest_tx_hash, address.latest_block_height) == ("tx0", 800000)
+
+    def test_incremental_walk_out_of_pages_keeps_the_old_mark(self, user):
+        history = make_transactions(10)
+        address = BitcoinAddressFactory(latest_tx_hash="tx8", latest_block_height=799992)
+        ingest_transactions(address, history[8:])
+
+        with (
+            mock.patch.object(BlockchainInfoAPI, "iter_transactions", return_value=iter(history[:2])),
+            mock.patch.object(fetch_transaction_page, "apply_async") as apply_async,
+        ):
+            fetch_transaction_page(address.id, 0, page_size=2, pages_left=1, incremental=True)
+
+        apply_async.assert_not_called()
+        # The next walk must read on past tx1, so the mark cannot move to tx0 yet
+        address.refresh_from_db()
+        assert (address.latest_tx_hash, address.latest_block_height) == ("tx8", 799992)
+
+
+def test_sync_bitcoin_address_starts_page_chain(user):
+    address = BitcoinAddressFactory(history_cursor_hash="tx59", history_cursor_offset=60, transaction_count=100)
+    with (
+        mock.patch.object(
+            BlockchainInfoAPI,
+            "get_address_info",
+            return_value={"balance_sats": 100000000, "tx_count": 100},
+        ),
+        mock.patch.object(fetch_transaction_page, "delay") as delay,
+    ):
+        sync_bitcoin_address(address.id, fetch_transactions=True, max_pages=5)
+
+    delay.assert_called_once_with(
+        address.id,
+        0,
+        page_size=20,
+        pages_left=5,
+        incremental=False,
+        lock_token=None,
+    )
+
+
+def test_incremental_sync_without_a_mark_walks_the_history(user):
+    # As left by a migration that reset the address to store its sends again
+    address = BitcoinAddressFactory(latest_tx_hash="", transaction_count=2)
+    ingest_transactions(address, make_transactions(1, start=1))
+    with (
+        mock.patch.object(
+            BlockchainInfoAPI,
+            "get_address_info",
+            return_value={"balance_sats": 100000000, "tx_count": 2},
+        ),
+        mock.patch.object(fetch_transaction_page, "delay") as delay,
+    ):
+        sync_bitcoin_address(address.id, fetch_transactions=True, incremental=True)
+
+    assert delay.call_args.kwargs["incremental"] is False
+    assert get_progress(address.id)["kind"] == "history"
+
+
+class TestHistoryProbeGating:
+    def probe(self, tx_count):
+        return mock.patch.object(
+            BlockchainInfoAPI,
+            "get_address_info",
+            return_value={"balance_sats": 100000000, "tx_count": tx_count},
+        )
+
+    def test_skips_history_without_new_activity(self, user):
+        address = BitcoinAddressFactory(transaction_count=2)
+        ingest_transactions(address, make_transactions(2))
+        with self.probe(2), mock.patch.object(fetch_transaction_page, "delay") as delay:
+            sync_bitcoin_address(address.id, fetch_transactions=True, incremental=True)
+
+        delay.assert_not_called()
+
+    def test_fetches_only_pages_covering_the_delta(self, user):
+        address = BitcoinAddressFactory(transaction_count=2)
+        ingest_transactions(address, make_transactions(2))
+        with self.probe(25), mock.patch.object(fetch_transaction_page, "delay") as delay:
+            sync_bitcoin_address(
+                address.id,
+                fetch_transactions=True,
+                incremental=True,
+                page_size=10,
+                max_pages=5,
+            )
+
+        assert delay.call_args.kwargs["pages_left"] == 3  # noqa: PLR2004
+
+    def test_reset_is_never_gated(self, user):
+        address = BitcoinAddressFactory(transaction_count=2)
+        ingest_transactions(address, make_transactions(2))
+        with self.probe(2), mock.patch.object(fetch_transaction_page, "delay") as delay:
+            sync_bitcoin_address(address.id, fetch_transactions=True, reset_page=True)
+
+        assert delay.call_args.kwargs["pages_left"] == 5  # noqa: PLR2004
+
+
+def test_refresh_chain_tip_caches_height():
+    with mock.patch.object(BlockchainInfoAPI, "get_chain_tip", return_value=850000):
+        refresh_chain_tip()
+    assert get_chain_tip() == 850000  # noqa: PLR2004
+
+    # A failed refresh keeps the last known tip
+    with mock.patch.object(BlockchainInfoAPI, "get_chain_tip", return_value=None):
+        refresh_chain_tip()
+    assert get_chain_tip() == 850000  # noqa: PLR2004
@@ -0,0 +1,18 @@
+from decimal import Decimal
+
+from wallet.templatetags.wallet_tags import btc
+from wallet.templatetags.wallet_tags import confirmations
+
+
+def test_btc_filter():
+    assert btc(150000000) == Decimal("1.50000000")
+    assert btc(-1) == Decimal("-0.00000001")
+    assert btc(None) == ""
+
+
+def test_confirmations_filter():
+    assert confirmations(800000, 800009) == 10  # noqa: PLR2004
+    # Unconfirmed transactions have no block yet
+    assert confirmations(None, 800009) == 0
+    # Before the first tip refresh the count is unknown
+    assert confirmations(800000, None) is None
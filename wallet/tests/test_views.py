@@ -0,0 +1,150 @@
+from datetime import UTC
+from datetime import date
+from datetime import datetime
+from unittest import mock
+
+import pytest
+from django.urls import reverse
+
+from wallet.forms import BitcoinAddressForm
+from wallet.ingest import ingest_transactions
+from wallet.models import BitcoinAddress
+from wallet.models import Transaction
+from wallet.models import WatchedAddress
+from wallet.tests.factories import WatchedAddressFactory
+
+pytestmark = pytest.mark.django_db
+
+ADDRESS = "1A1zP1eP5QGefi2DMPTfTL5SLmv7DivfNa"
+
+
+def test_users_share_one_canonical_address(client, user):
+    other = WatchedAddressFactory(address__address=ADDRESS, label="Theirs")
+    client.force_login(user)
+
+    response = client.post(reverse("wallet:add_address"), {"address": ADDRESS, "label": "Mine"})
+
+    assert response.status_code == 302  # noqa: PLR2004
+    assert BitcoinAddress.objects.filter(address=ADDRESS).count() == 1
+    watch = WatchedAddress.objects.get(user=user)
+    assert watch.address == other.address
+    assert watch.label == "Mine"
+
+
+def test_cannot_watch_the_same_address_twice(client, user):
+    WatchedAddressFactory(user=user, address__address=ADDRESS)
+    client.force_login(user)
+
+    response = client.post(reverse("wallet:add_address"), {"address": ADDRESS})
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert WatchedAddress.objects.filter(user=user).count() == 1
+
+
+def test_removing_last_watcher_deletes_address(client, user):
+    mine = WatchedAddressFactory(user=user)
+    shared = WatchedAddressFactory(user=user)
+    WatchedAddressFactory(address=shared.address)
+    client.force_login(user)
+
+    client.post(reverse("wallet:remove_address", args=[mine.pk]))
+    client.post(reverse("wallet:remove_address", args=[shared.pk]))
+
+    assert not BitcoinAddress.objects.filter(pk=mine.address_id).exists()
+    assert BitcoinAddress.objects.filter(pk=shared.address_id).exists()
+    assert not WatchedAddress.objects.filter(user=user).exists()
+
+
+def test_detail_falls_back_to_first_page_on_bad_cursor(client, user):
+    watch = WatchedAddressFactory(user=user)
+    client.force_login(user)
+
+    response = client.get(reverse("wallet:address_detail", args=[watch.pk]), {"after": "garbage"})
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert not response.context["page_obj"].has_previous
+
+
+def test_balance_history_endpoint(client, user):
+    watch = WatchedAddressFactory(user=user)
+    watch.address.daily_balances.create(date=date(2024, 1, 1), net_sats=500, balance_sats=500)
+    client.force_login(user)
+
+    response = client.get(reverse("wallet:balance_history", args=[watch.pk]))
+
+    assert response.json() == {
+        "address": watch.address.address,
+        "series": [{"date": "2024-01-01", "balance_sats": 500}],
+    }
+
+
+def test_address_list_serves_cached_rollup(client, user):
+    WatchedAddressFactory(user=user, address__balance_sats=150000000)
+    client.force_login(user)
+
+    response = client.get(reverse("wallet:address_list"))
+
+    assert response.context["portfolio"]["total_balance_sats"] == 150000000  # noqa: PLR2004
+    assert "1.50000000 BTC" in response.content.decode()
+
+
+def test_search_by_address_prefix_label_and_tx_hash(client, user):
+    cold = WatchedAddressFactory(user=user, address__address=ADDRESS, label="Cold storage")
+    WatchedAddressFactory(user=user, label="Hot wallet")
+    WatchedAddressFactory(address__address="1A1zOther00000000000000000000000", label="Cold")
+    ingest_transactions(
+        cold.address,
+        [{"hash": "abcdef123456", "amount_sats": 1000, "timestamp": datetime(2024, 1, 1, tzinfo=UTC), "is_sending": False}],
+    )
+    client.force_login(user)
+
+    by_prefix = client.get(reverse("wallet:search"), {"q": "1A1z"}).context
+    by_label = client.get(reverse("wallet:search"), {"q": "cold"}).context
+    by_hash = client.get(reverse("wallet:search"), {"q": "abcdef"}).context
+
+    assert [watch.pk for watch in by_prefix["addresses"]] == [cold.pk]
+    assert [watch.pk for watch in by_label["addresses"]] == [cold.pk]
+    assert [(leg.transaction.tx_hash, leg.watch_id) for leg in by_hash["transactions"]] == [("abcdef123456", cold.pk)]
+    assert by_label["transactions"] is None
+
+
+def test_removing_last_watcher_prunes_its_transactions(client, user):
+    mine = WatchedAddressFactory(user=user)
+    other = WatchedAddressFactory()
+    shared = {
+        "hash": "shared",
+        "amount_sats": 0,
+        "timestamp": datetime(2024, 1, 1, tzinfo=UTC),
+        "is_sending": False,
+        "legs": {
+            mine.address.address: {"amount_sats": 1000, "is_sending": False},
+            other.address.address: {"amount_sats": -1000, "is_sending": True},
+        },
+    }
+    ingest_transactions(mine.address, [shared, dict(shared, hash="only-mine", legs=None)])
+    client.force_login(user)
+
+    client.post(reverse("wallet:remove_address", args=[mine.pk]))
+
+    # The transaction another tracked address is in stays, with its leg
+    assert set(Transaction.objects.values_list("tx_hash", flat=True)) == {"shared"}
+    assert other.address.legs.count() == 1
+
+
+def test_watching_an_address_removed_meanwhile_recreates_it(user):
+    watch = WatchedAddressFactory(address__address=ADDRESS)
+    form = BitcoinAddressForm({"address": ADDRESS}, user=user)
+    assert form.is_valid()
+    get_or_create = BitcoinAddress.objects.get_or_create
+
+    def removed_meanwhile(**kwargs):
+        # The last other watcher's removal deletes the address before the row is locked
+        address, created = get_or_create(**kwargs)
+        if not created:
+            watch.address.delete()
+        return address, created
+
+    with mock.patch.object(BitcoinAddress.objects, "get_or_create", side_effect=removed_meanwhile):
+        form.save()
+
+    assert BitcoinAddress.objects.get(address=ADDRESS).watchers.get().user == user
@@ -6,8 +6,11 @@ app_name = 'wallet'
 urlpatterns = [
     path('', views.address_list, name='address_list'),
     path('add/', views.add_address, name='add_address'),
+    path('search/', views.search, name='search'),
     path('remove/<int:pk>/', views.remove_address, name='remove_address'),
     path('sync/', views.sync_address, name='sync_all_addresses'),
     path('sync/<int:pk>/', views.sync_address, name='sync_address'),
     path('address/<int:pk>/', views.address_detail, name='address_detail'),
+    path('address/<int:pk>/balance-history/', views.balance_history, name='balance_history'),
+    path('address/<int:pk>/sync-status/', views.sync_status, name='sync_status'),
 ] 
\ No newline at end of file
@@ -1,67 +1,213 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from .models import BitcoinAddress, Transaction
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from .models import BitcoinAddress, Transaction, TransactionLeg, WatchedAddress, sats_to_btc
+from .chain import get_chain_tip
+from .db_router import pin_to_primary
 from .forms import BitcoinAddressForm
-from .tasks import sync_bitcoin_address
+from .pagination import InvalidCursor, KeysetPaginator
+from .portfolio import get_portfolio, invalidate_portfolios
+from .progress import get_progress, progress_etag
+from .sync_lock import ACQUIRED, COALESCED, get_sync_state, get_sync_states
+from .tasks import enqueue_backfill, enqueue_sync, sync_address_balances
+import time
 
 # Create your views here.
 
+# Shortest query that is also looked up as a transaction hash prefix
+MIN_TX_HASH_PREFIX = 6
+
 @login_required
 def address_list(request):
-    addresses = BitcoinAddress.objects.filter(user=request.user)
-    return render(request, 'wallet/address_list.html', {'addresses': addresses})
+    watches = list(WatchedAddress.objects.filter(user=request.user).select_related('address'))
+    # Show which addresses have a sync in flight, read from their locks in one round trip
+    sync_states = get_sync_states(watch.address_id for watch in watches)
+    # Totals come from the cached rollup rather than aggregating on every view
+    portfolio = get_portfolio(request.user.id)
+    return render(request, 'wallet/address_list.html', {
+        'watches': watches,
+        'sync_states': sync_states,
+        'portfolio': portfolio
+    })
 
 @login_required
 def address_detail(request, pk):
-    address = get_object_or_404(BitcoinAddress, pk=pk, user=request.user)
+    watch = get_object_or_404(WatchedAddress.objects.select_related('address'), pk=pk, user=request.user)
+    address = watch.address
     
-    # Get all transactions for this address, ordered by timestamp (newest first)
-    all_transactions = Transaction.objects.filter(address=address).order_by('-timestamp')
+    # Get this address's side of its transactions, ordered by timestamp (newest first)
+    all_transactions = TransactionLeg.objects.filter(address=address).select_related('transaction')
     
-    # Set up pagination
-    page = request.GET.get('page', 1)
-    paginator = Paginator(all_transactions, 25)  # Show 25 transactions per page
+    # Cursor pagination seeks on (timestamp, id), so deep pages cost the same as the first
+    paginator = KeysetPaginator(all_transactions, 25, estimated_total=address.transaction_count)
+    after = request.GET.get('after')
+    before = request.GET.get('before')
     
     try:
-        transactions = paginator.page(page)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page
-        transactions = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range, deliver last page of results
-        transactions = paginator.page(paginator.num_pages)
+        transactions = paginator.page(after=after, before=before)
+    except InvalidCursor:
+        # If the cursor is malformed, deliver the first page
+        transactions = paginator.page()
+    if not transactions and (after or before):
+        # If the cursor points past either end, deliver the first page
+        transactions = paginator.page()
     
     return render(request, 'wallet/address_detail.html', {
+        'watch': watch,
         'address': address,
         'transactions': transactions,
-        'is_paginated': paginator.num_pages > 1,
+        # Confirmations are computed from this and each transaction's block height
+        'chain_tip': get_chain_tip(),
+        'sync_state': get_sync_state(address.id),
+        'is_paginated': transactions.has_other_pages,
         'page_obj': transactions
     })
 
+@login_required
+def search(request):
+    """
+    Find watched addresses by address prefix or label, and their transactions by hash prefix.
+
+    Address and hash lookups are prefix matches so they are served by an index on both
+    SQLite and PostgreSQL; labels use a substring match, trigram-indexed on PostgreSQL.
+    The prefix matches are ``startswith``, not ``istartswith``: case-sensitive on
+    PostgreSQL, as base58 addresses are, and case-insensitive on SQLite only because
+    its LIKE is, which is also why its indexes are declared COLLATE NOCASE.
+    """
+    query = request.GET.get('q', '').strip()
+    watches = WatchedAddress.objects.none()
+    transactions = None
+    
+    if query:
+        watches = (
+            WatchedAddress.objects.filter(user=request.user)
+            .filter(Q(address__address__startswith=query) | Q(label__icontains=query))
+            .select_related('address')
+            .order_by('label', 'id')
+        )
+        # Shorter hash prefixes match too much of the history to be a useful lookup
+        if len(query) >= MIN_TX_HASH_PREFIX:
+            legs = (
+                TransactionLeg.objects.filter(transaction__tx_hash__startswith=query, address__watchers__user=request.user)
+                .annotate(watch_id=F('address__watchers__id'))
+                .select_related('transaction', 'address')
+            )
+            try:
+                transactions = KeysetPaginator(legs, 25).page(after=request.GET.get('after'))
+            except InvalidCursor:
+                transactions = KeysetPaginator(legs, 25).page()
+    
+    addresses = Paginator(watches, 25).get_page(request.GET.get('page'))
+    return render(request, 'wallet/search.html', {
+        'query': query,
+        'addresses': addresses,
+        'transactions': transactions,
+        'min_tx_hash_prefix': MIN_TX_HASH_PREFIX
+    })
+
+@login_required
+def balance_history(request, pk):
+    """Daily end-of-day balances of a watched address as JSON, read from the materialized series"""
+    watch = get_object_or_404(WatchedAddress.objects.select_related('address'), pk=pk, user=request.user)
+    series = watch.address.daily_balances.values_list('date', 'balance_sats')
+    return JsonResponse({
+        'address': watch.address.address,
+        'series': [{'date': day.isoformat(), 'balance_sats': balance} for day, balance in series]
+    })
+
+@login_required
+@transaction.non_atomic_requests
+def sync_status(request, pk):
+    """
+    Long-poll the sync of a watched address: its lock state, published progress and balance, as JSON.
+
+    A request sending the last response's ETag in If-None-Match waits up to
+    WALLET_PROGRESS_LONG_POLL_SECONDS (or ``?wait=`` seconds, if shorter) for the sync to
+    publish a change, reading only Redis meanwhile, and gets a 304 if nothing changed.
+    The ETag covers the address's balance too, so a poll answered from a lagging replica
+    is not cached. Runs outside a transaction, since waiting holds the request open, and
+    the wait is kept short because it holds a web worker too.
+    The detail page polls this instead of being reloaded to see whether a sync finished.
+    """
+    watch = get_object_or_404(WatchedAddress, pk=pk, user=request.user)
+    etag = request.headers.get('If-None-Match')
+    limit = settings.WALLET_PROGRESS_LONG_POLL_SECONDS
+    try:
+        wait = float(request.GET.get('wait', limit))
+    except ValueError:
+        wait = limit
+    if not 0 <= wait <= limit:
+        wait = limit
+    
+    def published():
+        return {'sync': get_sync_state(watch.address_id), 'progress': get_progress(watch.address_id)}
+    
+    def snapshot(status):
+        address = BitcoinAddress.objects.get(id=watch.address_id)
+        return {
+            **status,
+            'address': {
+                'balance_sats': address.balance_sats,
+                'balance_btc': str(sats_to_btc(address.balance_sats)),
+                'transaction_count': address.transaction_count,
+                'last_synced': address.last_synced.isoformat() if address.last_synced else None,
+            }
+        }
+    
+    status = published()
+    payload = snapshot(status)
+    tag = progress_etag(payload)
+    if tag == etag:
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(settings.WALLET_PROGRESS_POLL_INTERVAL)
+            if published() != status:
+                break
+        # Read again after waiting, so a finished sync's results are included
+        payload = snapshot(published())
+        tag = progress_etag(payload)
+    
+    response: HttpResponse = HttpResponseNotModified() if tag == etag else JsonResponse(payload)
+    response['ETag'] = tag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
 @login_required
 def add_address(request):
     if request.method == 'POST':
-        form = BitcoinAddressForm(request.POST)
+        form = BitcoinAddressForm(request.POST, user=request.user)
         if form.is_valid():
-            address = form.save(commit=False)
-            address.user = request.user
-            address.save()
+            form.save()
+            invalidate_portfolios(user_ids=[request.user.id])
             messages.success(request, 'Bitcoin address added successfully!')
             return redirect('wallet:address_list')
     else:
-        form = BitcoinAddressForm()
+        form = BitcoinAddressForm(user=request.user)
     return render(request, 'wallet/address_form.html', {'form': form})
 
 @login_required
 def remove_address(request, pk):
-    address = get_object_or_404(BitcoinAddress, pk=pk, user=request.user)
+    watch = get_object_or_404(WatchedAddress.objects.select_related('address'), pk=pk, user=request.user)
     if request.method == 'POST':
-        address.delete()
+        watch.delete()
+        # Stop syncing and storing history nobody is watching any more. The address is
+        # locked, so a watch added meanwhile either keeps it or finds it gone
+        with transaction.atomic():
+            address = BitcoinAddress.objects.select_for_update().filter(pk=watch.address_id).first()
+            if address and not address.watchers.exists():
+                tx_ids = list(address.legs.values_list('transaction_id', flat=True))
+                address.delete()
+                # Transactions only this address had a leg in go with it
+                Transaction.objects.filter(id__in=tx_ids, legs__isnull=True).delete()
+        invalidate_portfolios(user_ids=[request.user.id])
         messages.success(request, 'Bitcoin address removed successfully!')
         return redirect('wallet:address_list')
-    return render(request, 'wallet/address_confirm_delete.html', {'address': address})
+    return render(request, 'wallet/address_confirm_delete.html', {'watch': watch})
 
 @login_required
 def sync_address(request, pk=None):
@@ -71,37 +217,68 @@ def sync_address(request, pk=None):
     # Get the reset_page parameter from the query string
     reset_page = request.GET.get('reset_page', 'false').lower() == 'true'
     
+    # Incremental syncs only fetch transactions newer than the ones already stored
+    incremental = request.GET.get('incremental', 'false').lower() == 'true'
+    
+    # Backfills fetch the whole history in parallel ranges instead of a page chain
+    backfill = request.GET.get('backfill', 'false').lower() == 'true'
+    
     # Check if this is an AJAX request
     is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
     
+    # The sync writes in the background; keep this user on the primary to see its results
+    pin_to_primary(request)
+    
     if pk:
-        # Sync a single address
-        address = get_object_or_404(BitcoinAddress, pk=pk, user=request.user)
-        sync_bitcoin_address.delay(address.id, fetch_transactions=fetch_transactions, reset_page=reset_page)
+        # Sync a single address; other users watching it share the result
+        watch = get_object_or_404(WatchedAddress.objects.select_related('address'), pk=pk, user=request.user)
+        address = watch.address
+        # Repeated clicks merge into the sync already in flight instead of enqueueing another
+        if backfill:
+            status = enqueue_backfill(address.id)
+        else:
+            status = enqueue_sync(
+                address.id, fetch_transactions=fetch_transactions, reset_page=reset_page, incremental=incremental
+            )
         
         if not is_ajax:
-            if fetch_transactions:
-                if reset_page:
+            if status == COALESCED:
+                messages.info(request, f'A synchronization of {address.address} is already in progress')
+            elif status != ACQUIRED:
+                messages.info(request, f'Synchronization of {address.address} queued to run after the one in progress')
+            elif backfill:
+                messages.info(request, f'Parallel backfill of the full history started for {address.address}')
+            elif fetch_transactions:
+                if incremental:
+                    messages.info(request, f'Fetching new transactions for {address.address}')
+                elif reset_page:
                     messages.info(request, f'Full synchronization started for {address.address} (starting from first page)')
                 else:
-                    messages.info(request, f'Full synchronization started for {address.address} (continuing from page {address.last_fetched_page + 1})')
+                    messages.info(request, f'Full synchronization started for {address.address} (continuing where the last one stopped)')
             else:
                 messages.info(request, f'Balance synchronization started for {address.address}')
             
             return redirect('wallet:address_detail', pk=pk)
         else:
-            # For AJAX requests, return a simple 200 OK response
-            from django.http import HttpResponse
-            return HttpResponse(status=200)
+            # For AJAX requests, report whether a new sync started and the one in flight
+            return JsonResponse({'status': status, 'sync': get_sync_state(address.id)})
     else:
         # Sync all addresses
-        addresses = BitcoinAddress.objects.filter(user=request.user)
-        for address in addresses:
-            sync_bitcoin_address.delay(address.id, fetch_transactions=fetch_transactions, reset_page=reset_page)
+        addresses = BitcoinAddress.objects.filter(watchers__user=request.user)
+        if fetch_transactions:
+            for address in addresses:
+                enqueue_sync(
+                    address.id, fetch_transactions=fetch_transactions, reset_page=reset_page, incremental=incremental
+                )
+        else:
+            # Balances for all addresses are fetched in a handful of batched requests
+            sync_address_balances.delay(user_id=request.user.id)
         
         if not is_ajax:
             if fetch_transactions:
-                if reset_page:
+                if incremental:
+                    messages.info(request, f'Fetching new transactions for {addresses.count()} addresses')
+                elif reset_page:
                     messages.info(request, f'Full synchronization started for {addresses.count()} addresses (starting from first page)')
                 else:
                     messages.info(request, f'Full synchronization started for {addresses.count()} addresses (continuing from last page)')